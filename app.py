@@ -1,60 +1,82 @@
 # app.py
 import streamlit as st
-import duckdb
-import pandas as pd
 import os
+import sys
 import plotly.express as px
-from datetime import datetime, timedelta
 
-# Define path to your DuckDB database file (relative to app.py)
-DUCKDB_DB_PATH = os.path.join("data", "retail_data.duckdb")
+# Shared helpers live alongside the pipeline scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "scripts"))
+from db import get_connection, add_query_hook, slow_query_logger
+from query_cache import QueryCache
+from snapshot import close_pruned_connections, reader_db_path, snapshot_version
+import dashboard_queries
+
+SLOW_QUERY_SECONDS = 0.5 # Dashboard statements slower than this are logged to the console
 
 # --- Streamlit App Configuration ---
 st.set_page_config(layout="wide") # Use wide layout for better dashboard space
 st.title("📊 Retail Data Platform Dashboard")
 
 # --- Database Connection Function ---
-@st.cache_resource # Cache the database connection
-def get_duckdb_connection():
-    """Establishes and returns a DuckDB connection."""
+# The dashboard reads the snapshot generation the pipeline last published (see scripts/snapshot.py),
+# never the database the pipeline is writing, so it neither blocks on nor sees a run in progress.
+@st.cache_resource
+def install_slow_query_logger():
+    add_query_hook(slow_query_logger(SLOW_QUERY_SECONDS))
+
+@st.cache_resource(max_entries=2) # One read-only connection per generation, shared by all viewer sessions
+def get_duckdb_connection(db_path):
+    """Establishes and returns the shared read-only DuckDB connection to one generation."""
+    close_pruned_connections()
     try:
-        con = duckdb.connect(database=DUCKDB_DB_PATH, read_only=True)
-        return con
+        return get_connection(read_only=True, db_path=db_path)
     except Exception as e:
         st.error(f"Error connecting to DuckDB: {e}")
         return None
 
-con = get_duckdb_connection()
+def get_session_cursor():
+    """
+    Each viewer session queries through its own cursor on the shared connection. A session
+    switches to a newly published generation on its next rerun, never in the middle of one.
+    """
+    install_slow_query_logger()
+    db_path = reader_db_path()
+    shared = get_duckdb_connection(db_path)
+    if shared is None:
+        return None
+    if st.session_state.get("duckdb_path") != db_path:
+        st.session_state.duckdb_cursor = shared.cursor()
+        st.session_state.duckdb_path = db_path
+    return st.session_state.duckdb_cursor
 
-if con:
-    # --- Display Raw Sales Data ---
-    st.header("Raw Sales Data Sample")
-    try:
-        raw_sales_df = con.execute("SELECT * FROM main.sales LIMIT 10;").fetchdf()
-        st.dataframe(raw_sales_df)
-    except Exception as e:
-        st.warning(f"Could not load raw sales data: {e}")
+@st.cache_resource # One query-result cache shared by all viewer sessions
+def get_query_cache():
+    """Caches query results per published generation (or until the TTL expires)."""
+    # Keyed by the generation this session reads, so results are never cached under a newer generation
+    return QueryCache(max_entries=256, ttl_seconds=600,
+                      version_reader=lambda: snapshot_version(st.session_state.get("duckdb_path") or reader_db_path()))
 
+con = get_session_cursor()
+cache = get_query_cache()
+
+if con:
     # --- Display Transformed Sales Data (Fact Sales) ---
     st.header("Fact Sales Data Sample (Mart Layer)")
     try:
-        fct_sales_df = con.execute("SELECT * FROM marts.fct_sales LIMIT 10;").fetchdf()
+        fct_sales_df = dashboard_queries.table_sample(cache, con, "marts.fct_sales")
         st.dataframe(fct_sales_df) # Displays the sample table
 
-        if not fct_sales_df.empty:
-            st.subheader("Sales Trend Over Time")
-            # Aggregate daily sales for the chart
-            # Ensure sale_date is in datetime format for plotting
-            daily_sales_trend = fct_sales_df.groupby('sale_date')['net_sales_amount'].sum().reset_index()
-            daily_sales_trend['sale_date'] = pd.to_datetime(daily_sales_trend['sale_date'])
-
-            st.dataframe(daily_sales_trend) # <<< ADDED FOR DEBUGGING/VERIFICATION (can remove later)
+        st.subheader("Sales Trend Over Time")
+        grain = st.selectbox("Granularity", dashboard_queries.SALES_TREND_GRAINS, format_func=str.capitalize)
+        # Aggregated by date bucket inside DuckDB, so only one row per bucket is fetched
+        sales_trend_df = dashboard_queries.sales_trend(cache, con, grain)
 
+        if not sales_trend_df.empty:
             fig_sales_trend = px.line(
-                daily_sales_trend, 
+                sales_trend_df, 
                 x='sale_date', 
                 y='net_sales_amount', 
-                title='Daily Net Sales Trend',
+                title=f'Net Sales Trend by {grain.capitalize()}',
                 labels={'net_sales_amount': 'Net Sales Amount', 'sale_date': 'Date'}
             )
             st.plotly_chart(fig_sales_trend, use_container_width=True)
@@ -67,72 +89,34 @@ if con:
     # --- Display Pricing Recommendations Sample ---
     st.header("Pricing Recommendations Sample (AI/ML Output)")
     try:
-        pricing_reco_df = con.execute("SELECT * FROM recommendations.product_pricing_recommendations LIMIT 10;").fetchdf()
+        pricing_reco_df = dashboard_queries.table_sample(cache, con, "recommendations.product_pricing_recommendations")
         st.dataframe(pricing_reco_df)
     except Exception as e:
         st.warning(f"Could not load pricing recommendations: {e}")
 
+    # --- Display Product Price Statistics ---
+    st.header("Product Price Statistics (Mart Layer)")
+    try:
+        price_stats_df = dashboard_queries.top_price_stats(cache, con)
+        st.dataframe(price_stats_df)
+    except Exception as e:
+        st.warning(f"Could not load product price statistics: {e}")
+
     # --- Display Demand Forecasts Sample ---
     st.header("Demand Forecasts Sample (AI/ML Output)")
     try:
-        forecasts_df = con.execute("SELECT * FROM forecasts.product_demand_forecasts LIMIT 10;").fetchdf()
+        forecasts_df = dashboard_queries.table_sample(cache, con, "forecasts.product_demand_forecasts")
         st.dataframe(forecasts_df) # Displays the sample table
 
         if not forecasts_df.empty:
             st.subheader("Inventory Levels vs. Next Day's Demand Forecast")
 
-            # --- Fetching latest available inventory date and data ---
-            latest_inventory_date_query = """
-            SELECT MAX(inventory_date) FROM marts.agg_daily_inventory_summary;
-            """
-            latest_inventory_date_result = con.execute(latest_inventory_date_query).fetchone()
-            latest_inventory_date = latest_inventory_date_result[0] if latest_inventory_date_result else None
-
-            latest_inventory_df = pd.DataFrame() # Initialize empty DataFrame
-            if latest_inventory_date:
-                latest_inventory_df_query = f"""
-                SELECT
-                    product_id,
-                    current_stock_level
-                FROM marts.agg_daily_inventory_summary
-                WHERE inventory_date = '{latest_inventory_date.strftime('%Y-%m-%d')}';
-                """
-                latest_inventory_df = con.execute(latest_inventory_df_query).fetchdf()
-
-            # --- Fetching forecasts for the day immediately after the latest sales date ---
-            latest_sales_date_query = """
-            SELECT MAX(sale_date) FROM marts.fct_sales;
-            """
-            latest_sales_date_result = con.execute(latest_sales_date_query).fetchone()
-            latest_sales_date = latest_sales_date_result[0] if latest_sales_date_result else None
-
-            forecast_tomorrow_df = pd.DataFrame() # Initialize empty DataFrame
-            if latest_sales_date:
-                # Find the forecast for the day immediately following the latest sales date
-                forecast_target_date = latest_sales_date + timedelta(days=1)
-                forecast_tomorrow_df_query = f"""
-                SELECT product_id, predicted_quantity
-                FROM forecasts.product_demand_forecasts
-                WHERE forecast_date = '{forecast_target_date.strftime('%Y-%m-%d')}';
-                """
-                forecast_tomorrow_df = con.execute(forecast_tomorrow_df_query).fetchdf()
-
-
-            if not latest_inventory_df.empty and not forecast_tomorrow_df.empty:
-                # Merge inventory and tomorrow's forecast
-                merged_df = pd.merge(
-                    latest_inventory_df, 
-                    forecast_tomorrow_df[['product_id', 'predicted_quantity']], 
-                    on='product_id', 
-                    how='left'
-                )
-                merged_df['predicted_quantity'] = merged_df['predicted_quantity'].fillna(0).astype(int) # Fill NaNs
-
-                # Sort for better visualization
-                merged_df = merged_df.sort_values(by='predicted_quantity', ascending=False).head(20) # Top 20 for chart clarity
+            # Latest chain-wide stock joined to the forecast for the day after the latest sale, top 20 in DuckDB
+            inventory_forecast_df = dashboard_queries.inventory_vs_forecast(cache, con, top_n=20)
 
+            if not inventory_forecast_df.empty:
                 fig_inv_forecast = px.bar(
-                    merged_df, 
+                    inventory_forecast_df, 
                     x='product_id', 
                     y=['current_stock_level', 'predicted_quantity'], 
                     barmode='group', 
@@ -145,5 +129,32 @@ if con:
     except Exception as e:
         st.warning(f"Could not load demand forecasts or generate inventory vs demand chart: {e}")
 
+    # --- Pipeline Performance (run metrics from run_pipeline.py) ---
+    st.header("Pipeline Performance")
+    try:
+        stage_timings_df = dashboard_queries.stage_timings(cache, con, last_runs=20)
+        if not stage_timings_df.empty:
+            metric = st.selectbox("Metric", ['wall_seconds', 'cpu_seconds', 'peak_rss_mb', 'rows_in'],
+                                  format_func=lambda name: name.replace('_', ' ').capitalize())
+            fig_stage_timings = px.line(
+                stage_timings_df,
+                x='run_started_at',
+                y=metric,
+                color='stage',
+                markers=True,
+                hover_data=['sales_rows'],
+                title=f"{metric.replace('_', ' ').capitalize()} per Stage, Run over Run",
+                labels={'run_started_at': 'Run'}
+            )
+            st.plotly_chart(fig_stage_timings, use_container_width=True)
+
+            st.subheader("Latest Run vs. Previous 5 Runs")
+            # slowdown > 1 means the stage got slower; compare rows_in to see whether data volume explains it
+            st.dataframe(dashboard_queries.stage_regressions(cache, con, baseline_runs=5))
+        else:
+            st.info("No pipeline runs recorded yet. Run scripts/run_pipeline.py to collect stage metrics.")
+    except Exception as e:
+        st.warning(f"Could not load pipeline run metrics: {e}")
+
     # Note: We open read_only so we don't need to explicitly close the connection.
     # Streamlit handles resource caching for us.
\ No newline at end of file
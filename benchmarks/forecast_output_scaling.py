@@ -0,0 +1,77 @@
+# benchmarks/forecast_output_scaling.py
+#
+# Measures how forecast output assembly scales with catalog size.
+# Compares the old per-row pd.concat accumulation with the columnar, batched
+# write path in inventory_forecaster.write_forecasts. No models are fitted: each
+# product gets a synthetic 30-day forecast so only assembly + load is timed.
+#
+# Usage: python benchmarks/forecast_output_scaling.py [--sizes 100 1000 10000 100000] [--legacy-max-products 100]
+import os
+import sys
+import time
+import argparse
+import duckdb
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+from inventory_forecaster import FORECAST_HORIZON_DAYS, horizon_dates, write_forecasts
+
+def synthetic_results(num_products, seed=42):
+    """Yields forecaster-shaped results for num_products products."""
+    rng = np.random.default_rng(seed)
+    last_date = pd.Timestamp('2024-12-31')
+    for i in range(num_products):
+        yield {
+            'product_id': f'PROD{i:06d}',
+            'forecast_dates': horizon_dates(last_date),
+            'predicted_quantities': rng.integers(0, 50, FORECAST_HORIZON_DAYS),
+            'method': 'synthetic',
+            'model_source': 'synthetic',
+            'seconds': 0.0,
+            'error': None,
+        }
+
+def legacy_assembly(results):
+    """The previous approach: one pd.concat per predicted day (quadratic in total rows)."""
+    all_forecasts = pd.DataFrame()
+    for result in results:
+        for date, value in zip(result['forecast_dates'], result['predicted_quantities']):
+            all_forecasts = pd.concat([all_forecasts, pd.DataFrame([{
+                'product_id': result['product_id'],
+                'forecast_date': str(date),
+                'predicted_quantity': max(0, round(value)),
+            }])], ignore_index=True)
+    return all_forecasts
+
+def columnar_assembly(results):
+    con = duckdb.connect()
+    con.execute("CREATE SCHEMA forecasts;")
+    rows_written, _ = write_forecasts(con, results)
+    con.close()
+    return rows_written
+
+def run_benchmark(sizes, legacy_max_products):
+    print(f"{'products':>10} {'rows':>10} {'legacy_s':>10} {'columnar_s':>11} {'rows/s':>12}")
+    for num_products in sizes:
+        legacy_seconds = None
+        if num_products <= legacy_max_products:
+            start = time.perf_counter()
+            legacy_assembly(synthetic_results(num_products))
+            legacy_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        rows = columnar_assembly(synthetic_results(num_products))
+        columnar_seconds = time.perf_counter() - start
+
+        legacy_text = f"{legacy_seconds:.2f}" if legacy_seconds is not None else "skipped"
+        print(f"{num_products:>10} {rows:>10} {legacy_text:>10} {columnar_seconds:>11.2f} {rows / columnar_seconds:>12,.0f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark forecast output assembly at increasing catalog sizes.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 100000],
+                        help="Catalog sizes (number of products) to benchmark.")
+    parser.add_argument('--legacy-max-products', type=int, default=100,
+                        help="Largest size to run the quadratic legacy path at (it is very slow beyond this).")
+    args = parser.parse_args()
+    run_benchmark(args.sizes, args.legacy_max_products)
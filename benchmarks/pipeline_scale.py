@@ -0,0 +1,191 @@
+# benchmarks/pipeline_scale.py
+#
+# End-to-end scale benchmark. For each scale factor, data_generator.py writes a fresh dataset
+# (scale 1 = 50k sales rows) into a scratch copy of the project, then every pipeline stage runs
+# there as its own process: duckdb_loader, the three transform_* scripts, inventory_forecaster,
+# pricing_recommender and outbound_integrator. Per stage it records wall time, CPU time,
+# throughput (sales rows per second) and the process's peak RSS. Results go to a JSON file and
+# can be compared with a stored baseline, to catch regressions and super-linear scaling.
+#
+# Usage: python benchmarks/pipeline_scale.py [--scales 1 10 100] [--baseline benchmarks/pipeline_scale_baseline.json]
+#                                            [--save-baseline] [--tolerance 1.25]
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+
+PROJECT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+RESULTS_DIR = os.path.join(PROJECT_ROOT, 'benchmarks', 'results')
+DEFAULT_BASELINE_PATH = os.path.join(PROJECT_ROOT, 'benchmarks', 'pipeline_scale_baseline.json')
+BASE_SALES_ROWS = 50_000 # Sales rows at scale 1 (data_generator.BASE_SALES_RECORDS)
+DEFAULT_TOLERANCE = 1.25 # Flag stages more than 25% slower than the baseline
+SUPERLINEAR_EXPONENT = 1.2 # Flag stages whose time grows faster than rows^1.2 between scales
+
+# (stage name, script, extra arguments); run in this order at every scale
+STAGES = [
+    ('duckdb_loader', 'duckdb_loader.py', []),
+    ('transform_staging', 'transform_staging.py', []),
+    ('transform_intermediate', 'transform_intermediate.py', []),
+    ('transform_marts', 'transform_marts.py', []),
+    ('inventory_forecaster', 'inventory_forecaster.py', []),
+    ('pricing_recommender', 'pricing_recommender.py', []),
+    ('outbound_integrator', 'outbound_integrator.py', []),
+]
+
+def prepare_workspace(workdir):
+    """Copies the scripts and config into a scratch project so the benchmark never touches data/."""
+    for name in ('scripts', 'config'):
+        target = os.path.join(workdir, name)
+        shutil.rmtree(target, ignore_errors=True)
+        shutil.copytree(os.path.join(PROJECT_ROOT, name), target, ignore=shutil.ignore_patterns('__pycache__'))
+    shutil.rmtree(os.path.join(workdir, 'data'), ignore_errors=True)
+    os.makedirs(os.path.join(workdir, 'data', 'raw'))
+    os.makedirs(os.path.join(workdir, 'logs'), exist_ok=True)
+
+def run_stage(workdir, name, script, args, log_name):
+    """
+    Runs one script as a child process and measures it. On POSIX, os.wait4 returns that
+    child's own resource usage (CPU time and peak RSS); elsewhere only wall time is available.
+    """
+    log_path = os.path.join(workdir, 'logs', f"{log_name}.log")
+    with open(log_path, 'w') as log:
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, os.path.join('scripts', script), *args],
+                                   cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+        if hasattr(os, 'wait4'):
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            cpu_seconds = usage.ru_utime + usage.ru_stime
+            peak_rss_mb = usage.ru_maxrss / (2**20 if sys.platform == 'darwin' else 2**10) # bytes on macOS, KiB elsewhere
+        else:
+            process.wait()
+            cpu_seconds = peak_rss_mb = None
+        wall_seconds = time.perf_counter() - start
+    if process.returncode != 0:
+        with open(log_path) as log:
+            tail = log.read()[-2000:]
+        raise RuntimeError(f"{name} failed with exit code {process.returncode}; see {log_path}:\n{tail}")
+    return {'wall_seconds': wall_seconds, 'cpu_seconds': cpu_seconds, 'peak_rss_mb': peak_rss_mb}
+
+def benchmark_scale(workdir, scale, seed, forecast_workers):
+    """Generates data at one scale factor and times every stage on it."""
+    prepare_workspace(workdir)
+    sales_rows = round(BASE_SALES_ROWS * scale)
+    label = f"scale{scale:g}"
+    stages = {}
+
+    print(f"\n--- scale {scale:g} ({sales_rows:,} sales rows) ---")
+    generator_args = ['--scale', str(scale), '--seed', str(seed)]
+    for name, script, args in [('data_generator', 'data_generator.py', generator_args)] + STAGES:
+        if name == 'inventory_forecaster' and forecast_workers:
+            args = args + ['--workers', str(forecast_workers)]
+        metrics = run_stage(workdir, name, script, args, f"{label}_{name}")
+        metrics['rows_per_second'] = sales_rows / metrics['wall_seconds'] if metrics['wall_seconds'] else None
+        stages[name] = metrics
+        print(f"  {name:<24} {metrics['wall_seconds']:>9.2f}s  {metrics['rows_per_second'] or 0:>12,.0f} rows/s  "
+              + (f"{metrics['peak_rss_mb']:>8.0f} MB" if metrics['peak_rss_mb'] is not None else ""))
+    return {'scale': scale, 'sales_rows': sales_rows, 'stages': stages}
+
+def scaling_report(results):
+    """
+    Per stage, the exponent k in time ~ rows^k between consecutive scales. k near 1 is linear;
+    k well above 1 is a scaling cliff.
+    """
+    findings = []
+    runs = sorted(results['runs'], key=lambda run: run['sales_rows'])
+    for smaller, larger in zip(runs, runs[1:]):
+        row_ratio = larger['sales_rows'] / smaller['sales_rows']
+        for name, metrics in larger['stages'].items():
+            before = smaller['stages'].get(name, {}).get('wall_seconds')
+            if not before or row_ratio <= 1:
+                continue
+            exponent = math.log(metrics['wall_seconds'] / before) / math.log(row_ratio)
+            findings.append({'stage': name, 'from_scale': smaller['scale'], 'to_scale': larger['scale'],
+                             'exponent': exponent, 'superlinear': exponent > SUPERLINEAR_EXPONENT})
+    return findings
+
+def compare_to_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Wall time of every (scale, stage) relative to the baseline; ratio > tolerance is a regression."""
+    baseline_runs = {run['scale']: run for run in baseline['runs']}
+    comparisons = []
+    for run in results['runs']:
+        baseline_run = baseline_runs.get(run['scale'])
+        if baseline_run is None:
+            continue
+        for name, metrics in run['stages'].items():
+            before = baseline_run['stages'].get(name)
+            if not before or not before['wall_seconds']:
+                continue
+            ratio = metrics['wall_seconds'] / before['wall_seconds']
+            comparisons.append({'scale': run['scale'], 'stage': name, 'baseline_seconds': before['wall_seconds'],
+                                'seconds': metrics['wall_seconds'], 'ratio': ratio, 'regression': ratio > tolerance})
+    return comparisons
+
+def run_benchmark(scales, seed=42, forecast_workers=None, workdir=None, output=None,
+                  baseline_path=DEFAULT_BASELINE_PATH, save_baseline=False, tolerance=DEFAULT_TOLERANCE):
+    workdir = workdir or tempfile.mkdtemp(prefix='pipeline_scale_')
+    print(f"Benchmark workspace: {workdir}")
+    results = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'seed': seed,
+        'runs': [benchmark_scale(workdir, scale, seed, forecast_workers) for scale in scales],
+    }
+
+    results['scaling'] = scaling_report(results)
+    for finding in results['scaling']:
+        if finding['superlinear']:
+            print(f"Scaling cliff: {finding['stage']} grows as rows^{finding['exponent']:.2f} "
+                  f"from scale {finding['from_scale']:g} to {finding['to_scale']:g}.")
+
+    regressions = []
+    if os.path.exists(baseline_path) and not save_baseline:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        results['baseline'] = {'path': baseline_path, 'created_at': baseline.get('created_at'),
+                               'comparisons': compare_to_baseline(results, baseline, tolerance)}
+        print(f"\nCompared with baseline {baseline_path} ({baseline.get('created_at')}):")
+        for comparison in results['baseline']['comparisons']:
+            flag = "  REGRESSION" if comparison['regression'] else ""
+            print(f"  scale {comparison['scale']:<6g} {comparison['stage']:<24} {comparison['baseline_seconds']:>8.2f}s -> "
+                  f"{comparison['seconds']:>8.2f}s ({comparison['ratio']:.2f}x){flag}")
+        regressions = [comparison for comparison in results['baseline']['comparisons'] if comparison['regression']]
+
+    output = output or os.path.join(RESULTS_DIR, f"pipeline_scale_{datetime.now().strftime('%Y%m%d%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+    if save_baseline:
+        with open(baseline_path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved as the new baseline: {baseline_path}")
+    return results, regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage at increasing data scale factors.")
+    parser.add_argument('--scales', type=float, nargs='+', default=[1, 10],
+                        help="data_generator.py --scale factors to run (1 = 50k sales rows).")
+    parser.add_argument('--seed', type=int, default=42, help="Generator seed, so runs are comparable.")
+    parser.add_argument('--forecast-workers', type=int, help="Worker processes for inventory_forecaster.py.")
+    parser.add_argument('--workdir', help="Scratch project directory (default: a new temp directory).")
+    parser.add_argument('--output', help="Results JSON path (default: benchmarks/results/pipeline_scale_<timestamp>.json).")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH, help="Baseline results JSON to compare with.")
+    parser.add_argument('--save-baseline', action='store_true', help="Store this run as the baseline instead of comparing.")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="Slowdown ratio against the baseline that counts as a regression.")
+    args = parser.parse_args()
+    _, regressions = run_benchmark(args.scales, seed=args.seed, forecast_workers=args.forecast_workers,
+                                   workdir=args.workdir, output=args.output, baseline_path=args.baseline,
+                                   save_baseline=args.save_baseline, tolerance=args.tolerance)
+    if regressions:
+        sys.exit(1)
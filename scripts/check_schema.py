@@ -1,15 +1,10 @@
 # scripts/check_schema.py
-import duckdb
-import os
-import pandas as pd # Import pandas to display results nicely
 
-# Define path to your DuckDB database file
-PROJECT_ROOT = os.path.join(os.path.dirname(__file__), '..')
-DUCKDB_DB_PATH = os.path.join(PROJECT_ROOT, 'data', 'retail_data.duckdb')
+from db import DUCKDB_DB_PATH, get_connection, close_connection
 
 def check_table_schema(db_path, table_name):
     print(f"Connecting to DuckDB database: {db_path}")
-    con = duckdb.connect(database=db_path)
+    con = get_connection(read_only=True, db_path=db_path)
 
     try:
         print(f"\n--- Schema for {table_name} ---")
@@ -21,7 +16,7 @@ def check_table_schema(db_path, table_name):
     except Exception as e:
         print(f"Error describing table {table_name}: {e}")
     finally:
-        con.close()
+        close_connection(db_path)
         print("\nDuckDB connection closed.")
 
 if __name__ == "__main__":
@@ -0,0 +1,114 @@
+# scripts/dashboard_queries.py
+#
+# Data access for the dashboard. Every chart query aggregates, joins and limits inside
+# DuckDB and reads from the pre-aggregated marts rather than marts.fct_sales, so the
+# result sets are chart-sized and render latency does not grow with the fact table.
+# All functions go through a QueryCache (see query_cache.py).
+
+SALES_TREND_GRAINS = ('day', 'week', 'month')
+SAMPLE_ROWS = 10 # Rows shown by table_sample; snapshot.py publishes fct_sales cut down to this many
+
+def table_sample(cache, con, table_name, limit=SAMPLE_ROWS):
+    """First rows of a table for display. table_name must be a trusted, fully-qualified name."""
+    return cache.fetchdf(con, f"SELECT * FROM {table_name} LIMIT ?;", [limit])
+
+def sales_trend(cache, con, grain='day'):
+    """Net sales per day/week/month across the whole history."""
+    if grain not in SALES_TREND_GRAINS:
+        raise ValueError(f"Unknown grain '{grain}'. Expected one of {SALES_TREND_GRAINS}.")
+    return cache.fetchdf(con, """
+    SELECT
+        CAST(date_trunc(?, sale_date) AS DATE) AS sale_date,
+        SUM(revenue) AS net_sales_amount
+    FROM marts.agg_daily_product_store_prices
+    GROUP BY 1
+    ORDER BY 1;
+    """, [grain])
+
+def top_price_stats(cache, con, limit=10):
+    """Price statistics for the products with the highest 30-day revenue."""
+    return cache.fetchdf(con, """
+    SELECT product_id, avg_price, min_price, max_price, last_price,
+           avg_price_7d, avg_price_30d, avg_price_90d, units_sold_30d, revenue_30d
+    FROM marts.agg_product_price_stats
+    ORDER BY revenue_30d DESC
+    LIMIT ?;
+    """, [limit])
+
+def inventory_vs_forecast(cache, con, top_n=20):
+    """
+    Chain-wide stock on the latest inventory date next to the demand forecast for the day
+    after the latest sale, for the top_n products by predicted demand.
+    """
+    return cache.fetchdf(con, """
+    WITH latest_inventory AS (
+        SELECT product_id, SUM(current_stock_level) AS current_stock_level
+        FROM marts.agg_daily_inventory_summary
+        WHERE inventory_date = (SELECT MAX(inventory_date) FROM marts.agg_daily_inventory_summary)
+        GROUP BY product_id
+    ),
+    forecast_tomorrow AS (
+        SELECT product_id, SUM(predicted_quantity) AS predicted_quantity
+        FROM forecasts.product_demand_forecasts
+        WHERE forecast_date = strftime(
+            (SELECT MAX(as_of_date) FROM marts.agg_product_price_stats) + INTERVAL 1 DAY, '%Y-%m-%d'
+        )
+        GROUP BY product_id
+    )
+    SELECT
+        i.product_id,
+        CAST(i.current_stock_level AS BIGINT) AS current_stock_level,
+        CAST(f.predicted_quantity AS BIGINT) AS predicted_quantity
+    FROM latest_inventory AS i
+    JOIN forecast_tomorrow AS f ON i.product_id = f.product_id
+    ORDER BY predicted_quantity DESC, i.product_id
+    LIMIT ?;
+    """, [top_n])
+
+def stage_timings(cache, con, last_runs=20):
+    """Wall time, peak memory and input rows of every stage that ran in the last_runs pipeline runs."""
+    return cache.fetchdf(con, """
+    SELECT r.started_at AS run_started_at, r.sales_rows, s.stage, s.wall_seconds, s.cpu_seconds, s.peak_rss_mb, s.rows_in
+    FROM ops.stage_metrics AS s
+    JOIN (SELECT * FROM ops.pipeline_runs ORDER BY started_at DESC LIMIT ?) AS r USING (run_id)
+    WHERE s.status = 'ran'
+    ORDER BY r.started_at, s.stage;
+    """, [last_runs])
+
+def stage_regressions(cache, con, baseline_runs=5):
+    """
+    Each stage's latest run against the median of its previous baseline_runs runs, slowest
+    relative change first, with input rows alongside so growth in data volume is visible.
+    """
+    return cache.fetchdf(con, """
+    WITH ran AS (
+        SELECT s.*, r.started_at AS run_started_at,
+               row_number() OVER (PARTITION BY s.stage ORDER BY r.started_at DESC) AS recency
+        FROM ops.stage_metrics AS s
+        JOIN ops.pipeline_runs AS r USING (run_id)
+        WHERE s.status = 'ran'
+    ),
+    baseline AS (
+        SELECT stage,
+               median(wall_seconds) AS baseline_seconds,
+               median(rows_in) AS baseline_rows_in,
+               median(peak_rss_mb) AS baseline_peak_rss_mb
+        FROM ran
+        WHERE recency BETWEEN 2 AND ? + 1
+        GROUP BY stage
+    )
+    SELECT
+        l.stage,
+        l.run_started_at AS latest_run,
+        round(l.wall_seconds, 3) AS latest_seconds,
+        round(b.baseline_seconds, 3) AS baseline_seconds,
+        round(l.wall_seconds / NULLIF(b.baseline_seconds, 0), 2) AS slowdown,
+        l.rows_in AS latest_rows_in,
+        CAST(b.baseline_rows_in AS BIGINT) AS baseline_rows_in,
+        round(l.peak_rss_mb, 1) AS latest_peak_rss_mb,
+        round(b.baseline_peak_rss_mb, 1) AS baseline_peak_rss_mb
+    FROM ran AS l
+    LEFT JOIN baseline AS b USING (stage)
+    WHERE l.recency = 1
+    ORDER BY slowdown DESC NULLS LAST, l.stage;
+    """, [baseline_runs])
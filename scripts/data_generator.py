@@ -1,122 +1,283 @@
 # scripts/data_generator.py
+import duckdb
 import pandas as pd
 import numpy as np
 from faker import Faker
-import random
-from datetime import datetime, timedelta
-import os 
+import argparse
+import os
+import shutil
+import time
+
+PROJECT_ROOT = os.path.join(os.path.dirname(__file__), '..')
+RAW_DATA_DIR = os.path.join(PROJECT_ROOT, 'data', 'raw')
 
 fake = Faker('en_IN') # Indian locale for some realism, adjust as needed
 
-def generate_sales_data(num_records=10000, start_date='2024-01-01', end_date='2024-12-31'):
-    products = [f'PROD{i:04d}' for i in range(1, 101)] # 100 products
-    customers = [f'CUST{i:05d}' for i in range(1, 501)] # 500 customers
-    stores = [f'STORE{i:02d}' for i in range(1, 11)] # 10 stores
-
-    start_dt = datetime.strptime(start_date, '%Y-%m-%d')
-    end_dt = datetime.strptime(end_date, '%Y-%m-%d') # Corrected: use end_dt instead of end_date
-    time_delta = (end_dt - start_dt).days
-
-    data = []
-    for i in range(num_records):
-        sale_date = start_dt + timedelta(days=random.randint(0, time_delta))
-        product_id = random.choice(products)
-        customer_id = random.choice(customers)
-        store_id = random.choice(stores)
-        quantity_sold = random.randint(1, 5)
-        price_per_unit = round(random.uniform(100.0, 5000.0), 2)
-        discount_applied = round(random.uniform(0.0, 0.2), 2) if random.random() < 0.3 else 0.0 # 30% chance of discount
-
-        data.append({
-            'transaction_id': f'TXN{i:06d}',
-            'product_id': product_id,
-            'customer_id': customer_id,
-            'sale_date': sale_date.strftime('%Y-%m-%d'),
-            'quantity_sold': quantity_sold,
-            'price_per_unit': price_per_unit,
-            'discount_applied': discount_applied,
-            'store_id': store_id
-        })
-    return pd.DataFrame(data)
-
-def generate_product_catalog(num_products=100):
-    categories = ['Electronics', 'Home Goods', 'Apparel', 'Books', 'Groceries']
-    brands = [fake.company() for _ in range(20)]
-    suppliers = [f'SUP{i:03d}' for i in range(1, 21)]
-
-    data = []
-    for i in range(1, num_products + 1):
-        product_id = f'PROD{i:04d}'
-        category = random.choice(categories)
-        brand = random.choice(brands)
-        cost_price = round(random.uniform(50.0, 3000.0), 2)
-        supplier_id = random.choice(suppliers)
-
-        data.append({
-            'product_id': product_id,
-            'product_name': fake.catch_phrase(),
-            'category': category,
-            'brand': brand,
-            'cost_price': cost_price,
-            'weight_kg': round(random.uniform(0.1, 10.0), 2),
-            'dimensions_cm': f"{random.randint(5,50)}x{random.randint(5,50)}x{random.randint(5,50)}",
-            'supplier_id': supplier_id
-        })
-    return pd.DataFrame(data)
-
-def generate_inventory_data(num_stores=10, num_products=100, current_date='2024-12-31'):
-    products = [f'PROD{i:04d}' for i in range(1, num_products + 1)]
-    stores = [f'STORE{i:02d}' for i in range(1, 11)]
-
-    data = []
-    for store_id in stores:
-        for product_id in products:
-            current_stock_level = random.randint(0, 100) if random.random() < 0.9 else 0 # 10% chance of being out of stock
-            data.append({
-                'product_id': product_id,
-                'store_id': store_id,
-                'current_stock_level': current_stock_level,
-                'last_updated': current_date
-            })
-    return pd.DataFrame(data)
-
-def generate_supplier_data(num_suppliers=20):
-    data = []
-    for i in range(1, num_suppliers + 1):
-        supplier_id = f'SUP{i:03d}'
-        data.append({
-            'supplier_id': supplier_id,
-            'supplier_name': fake.company() + ' Suppliers',
-            'contact_person': fake.name(),
-            'lead_time_days': random.randint(3, 30),
-            'minimum_order_quantity': random.randint(10, 200)
+# Volumes at scale factor 1. Rows and customers grow linearly with --scale; products and
+# stores grow with its square root, so large runs get deeper history per SKU rather than
+# an unrealistic product x store grid (inventory is one row per product per store).
+BASE_SALES_RECORDS = 50_000
+BASE_PRODUCTS = 200
+BASE_CUSTOMERS = 500
+BASE_STORES = 10
+BASE_SUPPLIERS = 30
+DEFAULT_CHUNK_ROWS = 1_000_000
+OUTPUT_FORMATS = ('csv', 'parquet', 'duckdb')
+
+def padded_ids(prefix, numbers, min_width):
+    """Vectorized f'{prefix}{n:0{width}d}', widening the padding if the ids need more digits."""
+    numbers = np.asarray(numbers, dtype=np.int64)
+    width = max(min_width, len(str(int(numbers.max())))) if len(numbers) else min_width
+    # Build the ASCII bytes as a (rows x chars) matrix, then view each row as one string
+    digits = (numbers[:, None] // 10 ** np.arange(width - 1, -1, -1)) % 10 + ord('0')
+    prefix_bytes = np.broadcast_to(np.frombuffer(prefix.encode(), np.uint8), (len(numbers), len(prefix)))
+    chars = np.ascontiguousarray(np.hstack([prefix_bytes, digits.astype(np.uint8)]))
+    return chars.view(f'S{chars.shape[1]}').ravel().astype(str)
+
+def product_popularity(num_products, zipf_exponent, rng):
+    """Sales probability per product: Zipf-distributed over a random product order (uniform when the exponent is 0)."""
+    weights = 1.0 / np.arange(1, num_products + 1) ** zipf_exponent
+    rng.shuffle(weights) # Popular products are spread across the id range, not PROD0001..N
+    return weights / weights.sum()
+
+def day_weights(dates, seasonality):
+    """
+    Relative sales volume per day: a yearly cycle peaking in late December plus a weekend
+    uplift, both scaled by seasonality (0 gives a flat distribution).
+    """
+    day_of_year = (dates - dates.astype('datetime64[Y]')).astype(int)
+    day_of_week = (dates.astype(int) + 3) % 7 # 1970-01-01 was a Thursday; 0 = Monday
+    yearly = 1 + seasonality * np.cos(2 * np.pi * (day_of_year - 355) / 365.25)
+    weekly = np.where(day_of_week >= 5, 1 + 0.5 * seasonality, 1.0)
+    weights = yearly * weekly
+    return weights / weights.sum()
+
+def generate_sales_chunks(num_records=10000, start_date='2024-01-01', end_date='2024-12-31',
+                          num_products=100, num_customers=500, num_stores=10,
+                          zipf_exponent=0.0, seasonality=0.0, chunk_rows=DEFAULT_CHUNK_ROWS, seed=None):
+    """
+    Yields the sales table as DataFrames of at most chunk_rows rows, generated column-wise
+    with NumPy. Output is reproducible for a given seed and chunk_rows.
+    """
+    rng = np.random.default_rng(seed)
+    dates = np.arange(np.datetime64(start_date, 'D'), np.datetime64(end_date, 'D') + 1)
+    date_p = day_weights(dates, seasonality)
+    product_p = product_popularity(num_products, zipf_exponent, rng)
+    products = padded_ids('PROD', np.arange(1, num_products + 1), 4)
+    customers = padded_ids('CUST', np.arange(1, num_customers + 1), 5)
+    stores = padded_ids('STORE', np.arange(1, num_stores + 1), 2)
+    id_width = max(6, len(str(num_records - 1)))
+
+    for offset in range(0, num_records, chunk_rows):
+        size = min(chunk_rows, num_records - offset)
+        discounted = rng.random(size) < 0.3 # 30% chance of discount
+        yield pd.DataFrame({
+            'transaction_id': padded_ids('TXN', np.arange(offset, offset + size), id_width),
+            'product_id': products[rng.choice(num_products, size=size, p=product_p)],
+            'customer_id': customers[rng.integers(0, num_customers, size)],
+            'sale_date': dates[rng.choice(len(dates), size=size, p=date_p)],
+            'quantity_sold': rng.integers(1, 6, size),
+            'price_per_unit': np.round(rng.uniform(100.0, 5000.0, size), 2),
+            'discount_applied': np.where(discounted, np.round(rng.uniform(0.0, 0.2, size), 2), 0.0),
+            'store_id': stores[rng.integers(0, num_stores, size)],
         })
-    return pd.DataFrame(data)
+
+def generate_sales_data(num_records=10000, start_date='2024-01-01', end_date='2024-12-31', **options):
+    """The whole sales table in memory; use generate_sales_chunks for large volumes."""
+    return pd.concat(generate_sales_chunks(num_records, start_date, end_date, **options), ignore_index=True)
+
+def generate_product_catalog(num_products=100, num_suppliers=20, seed=None):
+    rng = np.random.default_rng(seed)
+    categories = np.array(['Electronics', 'Home Goods', 'Apparel', 'Books', 'Groceries'])
+    brands = np.array([fake.company() for _ in range(20)])
+    # Faker is slow per call, so large catalogs draw names from a pool
+    names = np.array([fake.catch_phrase() for _ in range(min(num_products, 5000))])
+    dimensions = rng.integers(5, 51, (num_products, 3)).astype(str)
+
+    return pd.DataFrame({
+        'product_id': padded_ids('PROD', np.arange(1, num_products + 1), 4),
+        'product_name': names[rng.integers(0, len(names), num_products)],
+        'category': categories[rng.integers(0, len(categories), num_products)],
+        'brand': brands[rng.integers(0, len(brands), num_products)],
+        'cost_price': np.round(rng.uniform(50.0, 3000.0, num_products), 2),
+        'weight_kg': np.round(rng.uniform(0.1, 10.0, num_products), 2),
+        'dimensions_cm': [f"{x}x{y}x{z}" for x, y, z in dimensions],
+        'supplier_id': padded_ids('SUP', rng.integers(1, num_suppliers + 1, num_products), 3),
+    })
+
+def generate_inventory_data(num_stores=10, num_products=100, current_date='2024-12-31', seed=None):
+    rng = np.random.default_rng(seed)
+    size = num_stores * num_products
+    in_stock = rng.random(size) < 0.9 # 10% chance of being out of stock
+
+    return pd.DataFrame({
+        'product_id': np.tile(padded_ids('PROD', np.arange(1, num_products + 1), 4), num_stores),
+        'store_id': np.repeat(padded_ids('STORE', np.arange(1, num_stores + 1), 2), num_products),
+        'current_stock_level': np.where(in_stock, rng.integers(0, 101, size), 0),
+        'last_updated': current_date,
+    })
+
+def generate_supplier_data(num_suppliers=20, seed=None):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'supplier_id': padded_ids('SUP', np.arange(1, num_suppliers + 1), 3),
+        'supplier_name': [fake.company() + ' Suppliers' for _ in range(num_suppliers)],
+        'contact_person': [fake.name() for _ in range(num_suppliers)],
+        'lead_time_days': rng.integers(3, 31, num_suppliers),
+        'minimum_order_quantity': rng.integers(10, 201, num_suppliers),
+    })
+
+# --- Sinks: each takes an iterable of DataFrame chunks, so only one chunk is in memory at a time ---
+
+DATE_COLUMNS = ('sale_date', 'last_updated') # Written as DATE by every sink
+
+def date_select(chunk, source='chunk_df'):
+    """SELECT over a registered chunk that stores the date columns as DATE, like the CSV loader infers them."""
+    date_casts = [f"CAST({column} AS DATE) AS {column}" for column in DATE_COLUMNS if column in chunk]
+    return f"SELECT * REPLACE ({', '.join(date_casts)}) FROM {source}" if date_casts else f"SELECT * FROM {source}"
+
+def write_csv(chunks, path):
+    """Formats each chunk with DuckDB's CSV writer (much faster than DataFrame.to_csv) and appends it to path."""
+    rows = 0
+    con = duckdb.connect()
+    tmp_path, part_path = f"{path}.tmp", f"{path}.part"
+    with open(tmp_path, 'wb') as out:
+        for i, chunk in enumerate(chunks):
+            con.register('chunk_df', chunk)
+            con.execute(f"COPY ({date_select(chunk)}) TO ? (HEADER {'true' if i == 0 else 'false'});", [part_path])
+            con.unregister('chunk_df')
+            with open(part_path, 'rb') as part:
+                shutil.copyfileobj(part, out)
+            rows += len(chunk)
+    con.close()
+    os.remove(part_path)
+    os.replace(tmp_path, path) # The loader never sees a half-written file
+    return rows
+
+def write_parquet(chunks, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    rows = 0
+    writer = None
+    tmp_path = f"{path}.tmp"
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            for column in DATE_COLUMNS:
+                if column in chunk:
+                    table = table.set_column(table.schema.get_field_index(column), column, table[column].cast(pa.date32()))
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema, compression='zstd')
+            writer.write_table(table)
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    os.replace(tmp_path, path)
+    return rows
+
+def write_duckdb(chunks, con, table_name):
+    """Replaces table_name with the chunks in one transaction."""
+    rows = 0
+    con.execute("BEGIN TRANSACTION;")
+    for i, chunk in enumerate(chunks):
+        con.register('chunk_df', chunk)
+        if i == 0:
+            con.execute(f"CREATE OR REPLACE TABLE {table_name} AS {date_select(chunk)};")
+        else:
+            con.execute(f"INSERT INTO {table_name} {date_select(chunk)};")
+        con.unregister('chunk_df')
+        rows += len(chunk)
+    con.execute("COMMIT;")
+    return rows
+
+def scaled_counts(scale=1.0, product_scale=None, store_scale=None, customer_scale=None):
+    """Table volumes for a scale factor; per-dimension factors override the defaults derived from scale."""
+    product_scale = np.sqrt(scale) if product_scale is None else product_scale
+    store_scale = np.sqrt(scale) if store_scale is None else store_scale
+    customer_scale = scale if customer_scale is None else customer_scale
+    return {
+        'records': max(1, int(round(BASE_SALES_RECORDS * scale))),
+        'products': max(1, int(round(BASE_PRODUCTS * product_scale))),
+        'stores': max(1, int(round(BASE_STORES * store_scale))),
+        'customers': max(1, int(round(BASE_CUSTOMERS * customer_scale))),
+        'suppliers': BASE_SUPPLIERS,
+    }
+
+def generate_all(output_format='csv', output_dir=RAW_DATA_DIR, counts=None, seed=None,
+                 zipf_exponent=0.0, seasonality=0.0, chunk_rows=DEFAULT_CHUNK_ROWS,
+                 start_date='2024-01-01', end_date='2024-12-31'):
+    """Generates all four raw tables and streams them to CSV/Parquet files or straight into DuckDB."""
+    counts = counts or scaled_counts()
+    if seed is not None:
+        Faker.seed(seed)
+    seeds = np.random.SeedSequence(seed).generate_state(4) # Independent streams per table
+
+    tables = {
+        'sales': lambda: generate_sales_chunks(
+            counts['records'], start_date, end_date,
+            num_products=counts['products'], num_customers=counts['customers'], num_stores=counts['stores'],
+            zipf_exponent=zipf_exponent, seasonality=seasonality, chunk_rows=chunk_rows, seed=seeds[0]),
+        'product_catalog': lambda: [generate_product_catalog(counts['products'], counts['suppliers'], seed=seeds[1])],
+        'inventory': lambda: [generate_inventory_data(counts['stores'], counts['products'], end_date, seed=seeds[2])],
+        'supplier': lambda: [generate_supplier_data(counts['suppliers'], seed=seeds[3])],
+    }
+    file_names = {'sales': 'sales_data', 'product_catalog': 'product_catalog',
+                  'inventory': 'inventory_data', 'supplier': 'supplier_data'}
+
+    con = None
+    if output_format == 'duckdb':
+        from db import DUCKDB_DB_PATH, get_connection, close_connection
+        from data_version import bump_data_version
+        from model_runner import record_raw_changes
+        print(f"Connecting to DuckDB database: {DUCKDB_DB_PATH}")
+        con = get_connection()
+    else:
+        os.makedirs(output_dir, exist_ok=True)
+
+    for table_name, make_chunks in tables.items():
+        print(f"Generating {table_name} data...")
+        start = time.perf_counter()
+        if output_format == 'csv':
+            rows = write_csv(make_chunks(), os.path.join(output_dir, f"{file_names[table_name]}.csv"))
+        elif output_format == 'parquet':
+            rows = write_parquet(make_chunks(), os.path.join(output_dir, f"{file_names[table_name]}.parquet"))
+        else:
+            rows = write_duckdb(make_chunks(), con, table_name)
+            record_raw_changes(con, table_name)
+        print(f"Generated {rows} {table_name} records in {time.perf_counter() - start:.2f}s.")
+
+    if con is not None:
+        bump_data_version()
+        close_connection()
 
 # Main execution
 if __name__ == "__main__":
-    # Define output directory relative to the project root
-    output_dir = os.path.join(os.path.dirname(__file__), '..', 'data', 'raw')
-    os.makedirs(output_dir, exist_ok=True)
-
-    print("Generating sales data...")
-    sales_df = generate_sales_data(num_records=50000)
-    sales_df.to_csv(os.path.join(output_dir, 'sales_data.csv'), index=False)
-    print(f"Generated {len(sales_df)} sales records.")
-
-    print("Generating product catalog data...")
-    product_df = generate_product_catalog(num_products=200)
-    product_df.to_csv(os.path.join(output_dir, 'product_catalog.csv'), index=False)
-    print(f"Generated {len(product_df)} product records.")
-
-    print("Generating inventory data...")
-    inventory_df = generate_inventory_data(num_stores=10, num_products=200)
-    inventory_df.to_csv(os.path.join(output_dir, 'inventory_data.csv'), index=False)
-    print(f"Generated {len(inventory_df)} inventory records.")
-
-    print("Generating supplier data...")
-    supplier_df = generate_supplier_data(num_suppliers=30)
-    supplier_df.to_csv(os.path.join(output_dir, 'supplier_data.csv'), index=False)
-    print(f"Generated {len(supplier_df)} supplier records.")
-
-    print("Data generation complete!")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate synthetic retail data.")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='csv',
+                        help="Write CSV or Parquet files to --output-dir, or load straight into the DuckDB raw tables.")
+    parser.add_argument('--output-dir', default=RAW_DATA_DIR, help="Directory for CSV/Parquet output.")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help=f"Scale factor; 1 = {BASE_SALES_RECORDS} sales, {BASE_PRODUCTS} products, {BASE_STORES} stores, {BASE_CUSTOMERS} customers.")
+    parser.add_argument('--product-scale', type=float, help="Product count factor (default: sqrt of --scale).")
+    parser.add_argument('--store-scale', type=float, help="Store count factor (default: sqrt of --scale).")
+    parser.add_argument('--customer-scale', type=float, help="Customer count factor (default: --scale).")
+    parser.add_argument('--records', type=int, help="Exact number of sales rows (overrides --scale for sales).")
+    parser.add_argument('--zipf', type=float, default=0.0,
+                        help="Zipf exponent for product popularity (0 = uniform, ~1 = strongly skewed).")
+    parser.add_argument('--seasonality', type=float, default=0.0,
+                        help="Strength of the yearly cycle and weekend uplift in sales volume (0-1).")
+    parser.add_argument('--seed', type=int, help="Random seed for reproducible output.")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help="Sales rows generated per chunk.")
+    parser.add_argument('--start-date', default='2024-01-01')
+    parser.add_argument('--end-date', default='2024-12-31')
+    args = parser.parse_args()
+
+    counts = scaled_counts(args.scale, args.product_scale, args.store_scale, args.customer_scale)
+    if args.records is not None:
+        counts['records'] = args.records
+    generate_all(args.format, args.output_dir, counts, seed=args.seed, zipf_exponent=args.zipf,
+                 seasonality=args.seasonality, chunk_rows=args.chunk_rows,
+                 start_date=args.start_date, end_date=args.end_date)
+    print("Data generation complete!")
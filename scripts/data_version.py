@@ -0,0 +1,26 @@
+# scripts/data_version.py
+import os
+import uuid
+from datetime import datetime
+
+# A small token file next to the database. Every pipeline step that writes tables bumps it,
+# and readers (e.g. the dashboard query cache) use it to know when cached results are stale.
+PROJECT_ROOT = os.path.join(os.path.dirname(__file__), '..')
+DATA_VERSION_PATH = os.path.join(PROJECT_ROOT, 'data', 'data_version.txt')
+
+def bump_data_version(path=DATA_VERSION_PATH):
+    """Writes a new data-version token atomically and returns it."""
+    token = f"{datetime.now().strftime('%Y%m%d%H%M%S%f')}-{uuid.uuid4().hex[:8]}"
+    tmp_path = f"{path}.{token}.tmp" # Unique per writer, so concurrent pipeline steps never share a temp file
+    with open(tmp_path, 'w') as f:
+        f.write(token)
+    os.replace(tmp_path, path) # Atomic on POSIX and Windows, so readers never see a half-written token
+    return token
+
+def read_data_version(path=DATA_VERSION_PATH):
+    """Returns the current data-version token, or '0' if the pipeline has never bumped it."""
+    try:
+        with open(path) as f:
+            return f.read().strip() or '0'
+    except FileNotFoundError:
+        return '0'
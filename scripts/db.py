@@ -0,0 +1,119 @@
+# scripts/db.py
+#
+# Shared DuckDB access for the pipeline scripts and the dashboard:
+#   * one place that defines where the database lives,
+#   * a per-process connection manager (connections are reused, not reopened per step),
+#   * cursor fan-out so concurrent dashboard sessions each get their own cursor on one database,
+#   * parameter-bound execution with every statement timed through the same hook list.
+#
+# DuckDB prepares every parameterized statement it executes; values are always bound with
+# ? placeholders, never formatted into the SQL text.
+import duckdb
+import os
+import threading
+import time
+
+# Define paths relative to the project root
+PROJECT_ROOT = os.path.join(os.path.dirname(__file__), '..')
+DUCKDB_DB_PATH = os.path.join(PROJECT_ROOT, 'data', 'retail_data.duckdb') # The DuckDB database file
+
+_connections = {} # absolute db path -> (TimedConnection, read_only)
+_connections_lock = threading.Lock()
+_query_hooks = []
+
+def add_query_hook(hook):
+    """Registers hook(sql, params, seconds, error) to be called after every statement."""
+    _query_hooks.append(hook)
+    return hook
+
+def remove_query_hook(hook):
+    if hook in _query_hooks:
+        _query_hooks.remove(hook)
+
+def slow_query_logger(threshold_seconds=0.5, log=print):
+    """Builds a hook that reports statements slower than threshold_seconds."""
+    def hook(sql, params, seconds, error):
+        if seconds >= threshold_seconds:
+            statement = " ".join(sql.split())
+            log(f"[slow query {seconds:.3f}s] {statement[:200]}" + (f" params={params}" if params else ""))
+    return hook
+
+class TimedConnection:
+    """
+    Wraps a DuckDB connection so every execute() is timed and reported to the query hooks.
+    Everything else (fetchdf, register, close, ...) is delegated to the wrapped connection.
+    Because DataFrame replacement scans only see the immediate caller's variables, register
+    DataFrames explicitly with con.register(name, df) before referencing them in SQL.
+    """
+
+    def __init__(self, con):
+        self._con = con
+
+    def execute(self, sql, params=None):
+        start = time.perf_counter()
+        error = None
+        try:
+            if params is None:
+                self._con.execute(sql)
+            else:
+                self._con.execute(sql, params)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            for hook in list(_query_hooks):
+                hook(sql, params, elapsed, error)
+        return self
+
+    def cursor(self):
+        """A new cursor on the same database, for use from another thread or session."""
+        return TimedConnection(self._con.cursor())
+
+    @property
+    def raw(self):
+        return self._con
+
+    def __getattr__(self, name):
+        return getattr(self._con, name)
+
+def get_connection(read_only=False, db_path=DUCKDB_DB_PATH):
+    """
+    Returns this process's connection to db_path, opening it on first use.
+    A read-write connection also serves read-only callers (DuckDB allows one configuration
+    per database file per process).
+    """
+    key = os.path.abspath(db_path)
+    with _connections_lock:
+        existing = _connections.get(key)
+        if existing is not None:
+            con, existing_read_only = existing
+            if existing_read_only and not read_only:
+                raise RuntimeError(f"{db_path} is already open read-only in this process; close it before opening it read-write.")
+            return con
+        con = TimedConnection(duckdb.connect(database=db_path, read_only=read_only))
+        _connections[key] = (con, read_only)
+        return con
+
+def get_cursor(read_only=True, db_path=DUCKDB_DB_PATH):
+    """A new cursor on the shared connection. Give each thread or dashboard session its own."""
+    return get_connection(read_only=read_only, db_path=db_path).cursor()
+
+def close_connection(db_path=DUCKDB_DB_PATH):
+    """Closes this process's connection to db_path, if one is open."""
+    with _connections_lock:
+        existing = _connections.pop(os.path.abspath(db_path), None)
+    if existing is not None:
+        existing[0].close()
+
+def open_db_paths():
+    """Absolute paths of the databases this process has a connection to."""
+    with _connections_lock:
+        return list(_connections)
+
+def close_all_connections():
+    with _connections_lock:
+        connections = list(_connections.values())
+        _connections.clear()
+    for con, _ in connections:
+        con.close()
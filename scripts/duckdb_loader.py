@@ -1,8 +1,16 @@
 # scripts/duckdb_loader.py
-import duckdb
 import pandas as pd
 import os
 import glob
+import re
+import hashlib
+import argparse
+from datetime import datetime
+
+from data_version import bump_data_version
+from db import DUCKDB_DB_PATH, get_connection, close_connection
+from model_runner import record_raw_changes
+from parquet_store import export_layer
 
 # Define paths relative to the project root
 # This script will assume it's run from retail_data_platform/dbt_project or similar,
@@ -10,40 +18,232 @@ import glob
 # And create the duckdb file at retail_data_platform/data/retail_data.duckdb
 PROJECT_ROOT = os.path.join(os.path.dirname(__file__), '..')
 RAW_DATA_DIR = os.path.join(PROJECT_ROOT, 'data', 'raw')
-DUCKDB_DB_PATH = os.path.join(PROJECT_ROOT, 'data', 'retail_data.duckdb') # The DuckDB database file
 
-def load_csv_to_duckdb():
-    print(f"Connecting to DuckDB database: {DUCKDB_DB_PATH}")
-    # Connect to DuckDB. If the file doesn't exist, it will be created.
-    con = duckdb.connect(database=DUCKDB_DB_PATH)
+# Raw drops can arrive as CSV or Parquet (e.g. from data_generator.py --format parquet)
+RAW_FILE_PATTERNS = ('*.csv', '*.parquet')
+
+# Manifest of every raw file ingested, used by the incremental mode to skip unchanged files
+MANIFEST_TABLE = 'ops.load_manifest'
+
+# Business keys used to merge new/changed files into existing tables.
+# Tables without an entry are appended to as-is.
+TABLE_KEYS = {
+    'sales': ['transaction_id'],
+    'product_catalog': ['product_id'],
+    'inventory': ['product_id', 'store_id'],
+    'supplier': ['supplier_id'],
+}
+
+# Date column each raw table is partitioned by downstream; merges log the dates they touch
+# (see model_runner.record_raw_changes). Changes to other tables are logged for the whole table.
+TABLE_DATE_COLUMNS = {
+    'sales': 'sale_date',
+    'inventory': 'last_updated',
+}
+
+def table_name_for(file_name):
+    """Maps a raw file name to its table, e.g. 'sales_data.csv' and 'sales_data_20250101.csv' -> 'sales'."""
+    table_name = os.path.splitext(file_name)[0] # e.g., 'sales_data'
+    table_name = re.sub(r'_\d{8,14}$', '', table_name) # Daily drops carry a date/timestamp suffix
+
+    # Clean up table name if needed (e.g., remove _data suffix for cleaner names in DB)
+    if table_name.endswith('_data'):
+        table_name = table_name[:-5] # remove '_data'
+    return table_name
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """Hashes a file in chunks so large raw drops are never held in memory."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def raw_files(raw_dir=RAW_DATA_DIR):
+    return sorted(path for pattern in RAW_FILE_PATTERNS for path in glob.glob(os.path.join(raw_dir, pattern)))
+
+def raw_source(files, filename=False):
+    """
+    SQL (and its parameters) reading a list of raw files. CSVs are parsed with read_csv_auto;
+    Parquet files are read directly, keeping their column types.
+    """
+    filename_option = ", filename = true" if filename else ""
+    parts, params = [], []
+    for reader, extension in (('read_csv_auto', '.csv'), ('read_parquet', '.parquet')):
+        matching = [f for f in files if f.endswith(extension)]
+        if matching:
+            parts.append(f"SELECT * FROM {reader}(?, union_by_name = true{filename_option})")
+            params.append(matching)
+    return f"({' UNION ALL BY NAME '.join(parts)})", params
+
+def ensure_manifest(con):
+    con.execute("CREATE SCHEMA IF NOT EXISTS ops;")
+    con.execute(f"""
+    CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} (
+        file_name VARCHAR PRIMARY KEY,
+        table_name VARCHAR,
+        file_mtime DOUBLE,
+        file_size BIGINT,
+        file_hash VARCHAR,
+        row_count BIGINT,
+        loaded_at TIMESTAMP
+    );
+    """)
+
+def record_in_manifest(con, file_name, table_name, file_mtime, file_size, file_hash, row_count):
+    con.execute(
+        f"INSERT OR REPLACE INTO {MANIFEST_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?);",
+        [file_name, table_name, file_mtime, file_size, file_hash, row_count, datetime.now()]
+    )
+
+def table_exists(con, table_name):
+    return con.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = 'main' AND table_name = ?;",
+        [table_name]
+    ).fetchone()[0] > 0
+
+def merge_file_into_table(con, csv_file, table_name):
+    """Appends a CSV to table_name, replacing existing rows that share the table's business key."""
+    source, params = raw_source([csv_file])
+    con.execute(f"CREATE OR REPLACE TEMP TABLE _incoming AS SELECT * FROM {source};", params)
+    incoming_rows = con.execute("SELECT COUNT(*) FROM _incoming").fetchone()[0]
+
+    date_column = TABLE_DATE_COLUMNS.get(table_name)
+    if not table_exists(con, table_name):
+        con.execute(f"CREATE TABLE {table_name} AS SELECT * FROM _incoming;")
+        record_raw_changes(con, table_name)
+    else:
+        keys = TABLE_KEYS.get(table_name)
+        if date_column is None:
+            record_raw_changes(con, table_name)
+        else:
+            # Dates of the incoming rows and of the rows they replace (a correction may move a sale to another day)
+            replaced = (f"UNION SELECT t.{date_column} FROM {table_name} AS t JOIN _incoming USING ({', '.join(keys)})"
+                        if keys else "")
+            record_raw_changes(con, table_name, f"SELECT {date_column} FROM _incoming {replaced}")
+        if keys:
+            join_condition = " AND ".join(f"{table_name}.{key} = _incoming.{key}" for key in keys)
+            con.execute(f"DELETE FROM {table_name} USING _incoming WHERE {join_condition};")
+        con.execute(f"INSERT INTO {table_name} BY NAME SELECT * FROM _incoming;")
+
+    con.execute("DROP TABLE _incoming;")
+    return incoming_rows
+
+def load_csv_to_duckdb(incremental=False, parquet=False, con=None):
+    # run_pipeline.py passes its shared connection; standalone runs open and close their own
+    owns_connection = con is None
+    if owns_connection:
+        print(f"Connecting to DuckDB database: {DUCKDB_DB_PATH}")
+        # Connect to DuckDB. If the file doesn't exist, it will be created.
+        con = get_connection()
+    ensure_manifest(con)
 
     # Iterate through each CSV file and load it
-    csv_files = glob.glob(os.path.join(RAW_DATA_DIR, '*.csv'))
+    csv_files = raw_files()
 
     if not csv_files:
-        print(f"No CSV files found in {RAW_DATA_DIR}. Please run data_generator.py first.")
+        print(f"No CSV or Parquet files found in {RAW_DATA_DIR}. Please run data_generator.py first.")
+        if owns_connection:
+            close_connection()
         return
 
+    if incremental:
+        load_incremental(con, csv_files)
+    else:
+        load_full(con, csv_files)
+
+    if parquet:
+        print("\nPersisting raw tables as partitioned Parquet...")
+        export_layer(con, 'raw')
+
+    bump_data_version()
+    if owns_connection:
+        close_connection()
+    print("\nAll raw files loaded to DuckDB.")
+
+def load_full(con, csv_files):
+    """Rebuilds every raw table from all of its files and resets the manifest."""
+    files_by_table = {}
+    for csv_file in csv_files:
+        files_by_table.setdefault(table_name_for(os.path.basename(csv_file)), []).append(csv_file)
+
+    con.execute(f"DELETE FROM {MANIFEST_TABLE};")
+    for table_name, table_files in files_by_table.items():
+        file_names = ", ".join(os.path.basename(f) for f in table_files)
+        print(f"\nLoading '{file_names}' into DuckDB table '{table_name}'...")
+
+        try:
+            # READ_CSV_AUTO detects column types and headers automatically
+            keys = TABLE_KEYS.get(table_name)
+            if len(table_files) > 1 and keys:
+                # Several drops for one table: keep the row from the latest file for each business key
+                source, params = raw_source(table_files, filename=True)
+                con.execute(f"""
+                CREATE OR REPLACE TABLE {table_name} AS
+                SELECT * EXCLUDE (filename)
+                FROM {source}
+                QUALIFY ROW_NUMBER() OVER (PARTITION BY {', '.join(keys)} ORDER BY filename DESC) = 1;
+                """, params)
+            else:
+                source, params = raw_source(table_files)
+                con.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM {source};", params)
+            record_raw_changes(con, table_name) # Rebuilt from scratch: downstream incremental models rebuild too
+            table_rows = con.execute(f'SELECT COUNT(*) FROM {table_name}').fetchone()[0]
+            print(f"Successfully loaded {table_rows} rows into {table_name}.")
+
+            for csv_file in table_files:
+                stat = os.stat(csv_file)
+                # Per-file counts would need a second scan; only record them when the table has one file
+                row_count = table_rows if len(table_files) == 1 else None
+                record_in_manifest(con, os.path.basename(csv_file), table_name, stat.st_mtime, stat.st_size, file_sha256(csv_file), row_count)
+        except Exception as e:
+            print(f"Error loading {file_names}: {e}")
+
+def load_incremental(con, csv_files):
+    """Loads only files that are new or changed since the last run, merging them by business key."""
+    manifest = {
+        row[0]: row[1:]
+        for row in con.execute(f"SELECT file_name, file_mtime, file_size, file_hash FROM {MANIFEST_TABLE}").fetchall()
+    }
+
+    skipped = 0
     for csv_file in csv_files:
         file_name = os.path.basename(csv_file)
-        table_name = os.path.splitext(file_name)[0] # e.g., 'sales_data'
+        table_name = table_name_for(file_name)
+        stat = os.stat(csv_file)
+        previous = manifest.get(file_name)
 
-        # Clean up table name if needed (e.g., remove _data suffix for cleaner names in DB)
-        if table_name.endswith('_data'):
-            table_name = table_name[:-5] # remove '_data'
+        # Cheap check first: identical mtime and size means the file was not touched
+        if previous and previous[0] == stat.st_mtime and previous[1] == stat.st_size:
+            skipped += 1
+            continue
 
-        print(f"\nLoading '{file_name}' into DuckDB table '{table_name}'...")
+        file_hash = file_sha256(csv_file)
+        if previous and previous[2] == file_hash:
+            # Touched but not changed; refresh the watermark so we don't re-hash next time
+            con.execute(f"UPDATE {MANIFEST_TABLE} SET file_mtime = ? WHERE file_name = ?;", [stat.st_mtime, file_name])
+            skipped += 1
+            continue
 
+        action = "Merging changed" if previous else "Appending new"
+        print(f"\n{action} file '{file_name}' into DuckDB table '{table_name}'...")
         try:
-            # Use DuckDB's powerful COPY FROM command for efficient loading
-            # READ_CSV_AUTO detects column types and headers automatically
-            con.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM read_csv_auto('{csv_file}');")
-            print(f"Successfully loaded {con.execute(f'SELECT COUNT(*) FROM {table_name}').fetchone()[0]} rows into {table_name}.")
+            con.execute("BEGIN TRANSACTION;")
+            row_count = merge_file_into_table(con, csv_file, table_name)
+            record_in_manifest(con, file_name, table_name, stat.st_mtime, stat.st_size, file_hash, row_count)
+            con.execute("COMMIT;")
+            print(f"Successfully merged {row_count} rows into {table_name}.")
         except Exception as e:
+            con.execute("ROLLBACK;")
             print(f"Error loading {file_name}: {e}")
 
-    con.close()
-    print("\nAll raw CSVs loaded to DuckDB. Database closed.")
+    print(f"\nSkipped {skipped} unchanged file(s).")
 
 if __name__ == "__main__":
-    load_csv_to_duckdb()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Load raw CSV/Parquet files from data/raw into DuckDB.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only load new or changed files (tracked in ops.load_manifest), merging by business key.")
+    parser.add_argument('--parquet', action='store_true',
+                        help="Also persist the raw tables as Hive-partitioned Parquet under data/parquet/raw.")
+    args = parser.parse_args()
+    load_csv_to_duckdb(incremental=args.incremental, parquet=args.parquet)
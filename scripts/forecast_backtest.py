@@ -0,0 +1,267 @@
+# scripts/forecast_backtest.py
+#
+# Rolling-origin backtest of the forecasting models over marts.fct_sales. For each origin the
+# models only see history up to that day and forecast the next horizon days, which are then
+# compared with what actually sold. Reports MAPE, WAPE and bias per model and product segment,
+# next to what each model costs: fit time, predict time and peak (Python-side) memory.
+import os
+import time
+import argparse
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+from db import DUCKDB_DB_PATH, get_connection, close_connection
+from inventory_forecaster import (BASELINE_METHODS, FORECAST_HORIZON_DAYS, baseline_forecasts, new_prophet_model,
+                                  non_negative_quantities)
+from ts_matrix import build_matrix
+
+DEFAULT_ORIGINS = 4
+DEFAULT_STEP_DAYS = 7 # Days between consecutive forecast origins
+DEFAULT_MAX_WORKERS = os.cpu_count() or 1
+DEFAULT_CHUNK_SIZE = 8 # Series per task for the per-series models
+MIN_HISTORY_DAYS = 60 # Same cut-off the forecaster uses before it fits Prophet/SARIMAX
+SERIES_MODELS = ('prophet', 'sarimax', 'recent_mean') # Fitted one series at a time
+VECTORIZED_MODELS = BASELINE_METHODS + ('baseline_auto',) # Fitted for all series at once
+SEGMENT_BY = ('abc', 'category')
+
+def fit_predict_series(model, history, horizon):
+    """Fits one per-series model on a daily pd.Series. Returns (forecast, fit_seconds, predict_seconds)."""
+    start = time.perf_counter()
+    if model == 'prophet':
+        fitted = new_prophet_model().fit(pd.DataFrame({'ds': history.index, 'y': history.to_numpy()}))
+        fit_done = time.perf_counter()
+        forecast = fitted.predict(fitted.make_future_dataframe(periods=horizon, freq='D'))['yhat'].to_numpy()[-horizon:]
+    elif model == 'sarimax':
+        fitted = SARIMAX(history, order=(1,1,1), seasonal_order=(0,0,0,0)).fit(disp=False)
+        fit_done = time.perf_counter()
+        forecast = np.asarray(fitted.predict(start=len(history), end=len(history) + horizon - 1))
+    else: # recent_mean: the forecaster's short-history fallback
+        level = round(history.tail(7).mean())
+        fit_done = time.perf_counter()
+        forecast = np.full(horizon, level, dtype='float64')
+    return forecast, fit_done - start, time.perf_counter() - fit_done
+
+def traced_peak_bytes(function, *args):
+    """Peak Python/NumPy allocation of one call, traced separately so timings don't pay tracemalloc's overhead."""
+    tracemalloc.start()
+    try:
+        function(*args)
+    except Exception:
+        pass
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak_bytes
+
+def run_backtest_task(task):
+    """
+    Worker entry point: one model at one origin over a set of series.
+    Per-series models get one daily history per row; vectorized models get the whole training matrix.
+    Peak memory is measured on a separate traced rerun of the task's first series (or the whole
+    matrix for vectorized models). It covers Python/NumPy allocations; Stan's optimizer runs in a
+    subprocess and is not included.
+    """
+    model, origin, rows, histories, horizon = task
+    forecasts = np.full((len(rows), horizon), np.nan)
+    fit_seconds = predict_seconds = 0.0
+    failures = 0
+    if model in VECTORIZED_MODELS:
+        method = 'auto' if model == 'baseline_auto' else model
+        start = time.perf_counter()
+        forecasts[:] = non_negative_quantities(baseline_forecasts(histories, horizon, method)[0])
+        predict_seconds = time.perf_counter() - start # No separate fit step
+        peak_bytes = traced_peak_bytes(baseline_forecasts, histories, horizon, method)
+    else:
+        for position, history in enumerate(histories):
+            try:
+                forecast, fit_time, predict_time = fit_predict_series(model, history, horizon)
+                if np.isnan(forecast).any():
+                    raise ValueError(f"{model} returned NaN predictions")
+                forecasts[position] = non_negative_quantities(forecast)
+                fit_seconds += fit_time
+                predict_seconds += predict_time
+            except Exception:
+                failures += 1
+        peak_bytes = traced_peak_bytes(fit_predict_series, model, histories[0], horizon)
+    return {
+        'model': model,
+        'origin': origin,
+        'rows': rows,
+        'forecasts': forecasts,
+        'fit_seconds': fit_seconds,
+        'predict_seconds': predict_seconds,
+        'peak_bytes': peak_bytes,
+        'failures': failures,
+    }
+
+def build_tasks(models, axes, matrix, origins, horizon, chunk_size):
+    """One task per (vectorized model, origin) and per (series model, origin, chunk of series)."""
+    tasks = []
+    for origin in origins:
+        train = matrix[:, :origin + 1]
+        first_sale = (train > 0).argmax(axis=1)
+        for model in models:
+            if model in VECTORIZED_MODELS:
+                tasks.append((model, origin, np.arange(len(train)), train, horizon))
+                continue
+            # Prophet and SARIMAX only run on series long enough for the forecaster to use them
+            eligible = [row for row in range(len(train)) if train[row].any()
+                        and (model == 'recent_mean' or origin + 1 - first_sale[row] >= MIN_HISTORY_DAYS)]
+            for chunk_start in range(0, len(eligible), chunk_size):
+                rows = np.array(eligible[chunk_start:chunk_start + chunk_size])
+                histories = [pd.Series(train[row, first_sale[row]:], index=axes['date'][first_sale[row]:origin + 1])
+                             for row in rows]
+                tasks.append((model, origin, rows, histories, horizon))
+    return tasks
+
+def product_segments(con, axes, matrix, segment_by='abc'):
+    """
+    Segment label per product. 'abc' ranks products by units sold (A: first 80% of units,
+    B: next 15%, C: the rest); 'category' uses marts.dim_products.
+    """
+    if segment_by == 'category':
+        categories = dict(con.execute("SELECT product_id, category FROM marts.dim_products;").fetchall())
+        return np.array([categories.get(product_id, 'unknown') for product_id in axes['product_id']], dtype=object)
+    totals = matrix.sum(axis=1)
+    order = np.argsort(-totals)
+    cumulative_share = np.cumsum(totals[order]) / max(totals.sum(), 1)
+    segments = np.empty(len(totals), dtype=object)
+    segments[order] = np.where(cumulative_share <= 0.8, 'A', np.where(cumulative_share <= 0.95, 'B', 'C'))
+    return segments
+
+def accuracy_metrics(forecasts, actuals):
+    """MAPE over cells with sales, WAPE and bias (over-forecast positive) for matching arrays."""
+    errors = forecasts - actuals
+    sold = actuals > 0
+    total_actual = actuals.sum()
+    return {
+        'mape': float(np.mean(np.abs(errors[sold]) / actuals[sold])) if sold.any() else np.nan,
+        'wape': float(np.abs(errors).sum() / total_actual) if total_actual else np.nan,
+        'bias': float(errors.sum() / total_actual) if total_actual else np.nan,
+    }
+
+def summarize(results, matrix, origins, horizon, segments):
+    """
+    One row per model and segment (plus 'all'), aggregated over origins, series and horizon days.
+    Every model is scored on the same (origin, series) pairs: those all the models forecast, so
+    Prophet/SARIMAX's history cut-off or a failed fit doesn't hand a model an easier set of series.
+    model_series is how many series the model itself covered.
+    """
+    origin_position = {origin: position for position, origin in enumerate(origins)}
+    actuals = np.stack([matrix[:, origin + 1:origin + 1 + horizon] for origin in origins]) # origins x products x horizon
+    by_model = {}
+    for result in results:
+        entry = by_model.setdefault(result['model'], {
+            'forecasts': np.full(actuals.shape, np.nan), 'fit_seconds': 0.0, 'predict_seconds': 0.0,
+            'peak_bytes': 0, 'failures': 0,
+        })
+        entry['forecasts'][origin_position[result['origin']], result['rows']] = result['forecasts']
+        entry['fit_seconds'] += result['fit_seconds']
+        entry['predict_seconds'] += result['predict_seconds']
+        entry['peak_bytes'] = max(entry['peak_bytes'], result['peak_bytes'])
+        entry['failures'] += result['failures']
+
+    evaluated = {model: ~np.isnan(entry['forecasts']).any(axis=2) for model, entry in by_model.items()} # origins x products
+    common = np.logical_and.reduce(list(evaluated.values())) if evaluated else np.zeros(actuals.shape[:2], dtype=bool)
+    rows = []
+    for model, entry in by_model.items():
+        fits = int(evaluated[model].sum())
+        for segment in ['all'] + sorted(set(segments)):
+            in_segment_mask = (segments == segment) if segment != 'all' else np.ones(len(segments), dtype=bool)
+            in_segment = common & in_segment_mask
+            if not in_segment.any():
+                continue
+            rows.append({
+                'model': model,
+                'segment': segment,
+                'series': int(in_segment.any(axis=0).sum()),
+                'model_series': int((evaluated[model] & in_segment_mask).any(axis=0).sum()),
+                **accuracy_metrics(entry['forecasts'][in_segment], actuals[in_segment]),
+                'fit_seconds': entry['fit_seconds'],
+                'predict_seconds': entry['predict_seconds'],
+                'ms_per_series': 1000 * (entry['fit_seconds'] + entry['predict_seconds']) / max(fits, 1),
+                'peak_mb': entry['peak_bytes'] / 2**20,
+                'failures': entry['failures'],
+            })
+    return pd.DataFrame(rows)
+
+def run_backtest(models=SERIES_MODELS + VECTORIZED_MODELS, n_origins=DEFAULT_ORIGINS, step_days=DEFAULT_STEP_DAYS,
+                 horizon=FORECAST_HORIZON_DAYS, max_workers=DEFAULT_MAX_WORKERS, chunk_size=DEFAULT_CHUNK_SIZE,
+                 segment_by='abc', max_products=None):
+    print(f"Connecting to DuckDB database: {DUCKDB_DB_PATH}")
+    con = get_connection()
+
+    axes, matrix = build_matrix(con, keys=('product_id',))
+    if matrix.size == 0:
+        print("No historical sales data found. Cannot backtest.")
+        close_connection()
+        return None
+    if max_products and len(matrix) > max_products:
+        keep = np.sort(np.argsort(-matrix.sum(axis=1))[:max_products]) # Highest-volume products
+        axes = {**axes, 'product_id': axes['product_id'][keep]}
+        matrix = matrix[keep]
+
+    # Latest origin leaves a full horizon of actuals; earlier ones step back step_days at a time
+    last_origin = matrix.shape[1] - 1 - horizon
+    origins = [origin for origin in (last_origin - k * step_days for k in range(n_origins - 1, -1, -1)) if origin >= 0]
+    if not origins:
+        print(f"Not enough history for a {horizon}-day backtest.")
+        close_connection()
+        return None
+    print(f"Backtesting {', '.join(models)} on {len(matrix)} products at {len(origins)} origin(s) "
+          f"({', '.join(str(axes['date'][origin].date()) for origin in origins)}), horizon {horizon} days...")
+
+    segments = product_segments(con, axes, matrix[:, :origins[0] + 1], segment_by) # Segment on data before any origin
+    tasks = build_tasks(models, axes, matrix, origins, horizon, chunk_size)
+    start = time.perf_counter()
+    if max_workers <= 1:
+        results = [run_backtest_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(run_backtest_task, tasks))
+    print(f"Ran {len(tasks)} backtest tasks on {max_workers} worker(s) in {time.perf_counter() - start:.2f}s.")
+
+    summary = summarize(results, matrix, origins, horizon, segments)
+    print(summary.round(3).to_string(index=False))
+
+    # Keep every run so model choices can be compared over time
+    summary.insert(0, 'run_at', datetime.now())
+    summary.insert(1, 'horizon_days', horizon)
+    summary.insert(2, 'origins', len(origins))
+    summary.insert(3, 'segment_by', segment_by)
+    con.execute("CREATE SCHEMA IF NOT EXISTS forecasts;")
+    con.register('summary_df', summary)
+    con.execute("CREATE TABLE IF NOT EXISTS forecasts.backtest_results AS SELECT * FROM summary_df WHERE false;")
+    con.execute("INSERT INTO forecasts.backtest_results SELECT * FROM summary_df;")
+    con.unregister('summary_df')
+    print("\nBacktest results appended to forecasts.backtest_results.")
+
+    close_connection()
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rolling-origin backtest of the demand forecasting models.")
+    parser.add_argument('--models', default=','.join(SERIES_MODELS + VECTORIZED_MODELS),
+                        help=f"Comma-separated models to compare (from {', '.join(SERIES_MODELS + VECTORIZED_MODELS)}).")
+    parser.add_argument('--origins', type=int, default=DEFAULT_ORIGINS, help="Number of forecast origins.")
+    parser.add_argument('--step-days', type=int, default=DEFAULT_STEP_DAYS, help="Days between origins.")
+    parser.add_argument('--horizon', type=int, default=FORECAST_HORIZON_DAYS, help="Days forecast from each origin.")
+    parser.add_argument('--workers', type=int, default=DEFAULT_MAX_WORKERS,
+                        help="Number of worker processes (1 runs in-process).")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Series per task for Prophet, SARIMAX and recent_mean.")
+    parser.add_argument('--segment-by', choices=SEGMENT_BY, default='abc',
+                        help="Segment products by ABC volume class or by category.")
+    parser.add_argument('--max-products', type=int, help="Only backtest this many highest-volume products.")
+    args = parser.parse_args()
+    models = [model.strip() for model in args.models.split(',') if model.strip()]
+    unknown = set(models) - set(SERIES_MODELS + VECTORIZED_MODELS)
+    if unknown:
+        parser.error(f"unknown model(s): {', '.join(sorted(unknown))}")
+    run_backtest(models=models, n_origins=args.origins, step_days=args.step_days, horizon=args.horizon,
+                 max_workers=args.workers, chunk_size=args.chunk_size, segment_by=args.segment_by,
+                 max_products=args.max_products)
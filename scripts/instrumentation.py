@@ -0,0 +1,277 @@
+# scripts/instrumentation.py
+#
+# Structured run metrics for the pipeline. A PipelineRecorder wraps each stage in a context
+# that measures wall time, CPU time (including worker processes), peak RSS and rows in/out,
+# and hooks every TimedConnection.execute (see db.py) to attribute statement counts and
+# times to the stage running on that thread. With profiling on, DuckDB's JSON query profile
+# (the EXPLAIN ANALYZE operator tree with timings) is kept for every statement over a threshold.
+# Everything lands in ops.pipeline_runs, ops.stage_metrics and ops.query_profiles.
+#
+# Stages that run concurrently share one process, so their CPU time and peak RSS overlap.
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from db import DUCKDB_DB_PATH, get_connection, close_connection, add_query_hook, remove_query_hook
+
+RUNS_TABLE = 'ops.pipeline_runs'
+STAGE_METRICS_TABLE = 'ops.stage_metrics'
+QUERY_PROFILES_TABLE = 'ops.query_profiles'
+RSS_SAMPLE_SECONDS = 0.05
+DEFAULT_PROFILE_MIN_SECONDS = 0.1 # With profiling on, keep profiles of statements at least this slow
+
+def current_rss_bytes():
+    """Resident set size of this process, or None where it can't be read cheaply."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource # Not available on Windows
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024 # Lifetime peak: bytes on macOS, KiB elsewhere
+    except ImportError:
+        return None
+
+def cpu_seconds():
+    """User + system CPU time of this process and its finished child processes (e.g. forecasting workers)."""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+class RssSampler:
+    """Background thread that tracks the peak RSS seen during each open measurement window."""
+
+    def __init__(self, interval=RSS_SAMPLE_SECONDS):
+        self._interval = interval
+        self._windows = {} # token -> peak bytes
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            self._sample()
+
+    def _sample(self):
+        rss = current_rss_bytes()
+        if rss is None:
+            return
+        with self._lock:
+            for token, peak in self._windows.items():
+                self._windows[token] = max(peak, rss)
+
+    def open(self):
+        token = object()
+        with self._lock:
+            self._windows[token] = current_rss_bytes() or 0
+        return token
+
+    def close(self, token):
+        self._sample()
+        with self._lock:
+            return self._windows.pop(token)
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+def table_rows(con, tables):
+    """Total row count of the given tables that exist (None when there are none)."""
+    total = None
+    for table in tables:
+        schema, name = table.split('.')
+        exists = con.execute(
+            "SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = ? AND table_name = ?;", [schema, name]
+        ).fetchone()[0]
+        if exists:
+            total = (total or 0) + con.execute(f"SELECT COUNT(*) FROM {table};").fetchone()[0]
+    return total
+
+def explain_analyze(con, sql, params=None):
+    """Runs a statement under EXPLAIN ANALYZE and returns DuckDB's annotated plan as text."""
+    rows = con.execute(f"EXPLAIN ANALYZE {sql}", params).fetchall()
+    return "\n".join(row[-1] for row in rows)
+
+class PipelineRecorder:
+    """
+    Collects run, stage and query metrics for one pipeline run and writes them with save().
+    Use one stage() context per stage, entered on the thread that runs it.
+    """
+
+    def __init__(self, run_name='pipeline', profile=False, profile_min_seconds=DEFAULT_PROFILE_MIN_SECONDS, options=None):
+        self.run_id = uuid.uuid4().hex
+        self.run_name = run_name
+        self.profile = profile
+        self.profile_min_seconds = profile_min_seconds
+        self.options = options or {}
+        self.started_at = datetime.now()
+        self.stages = []
+        self.profiles = []
+        self._start_wall = time.perf_counter()
+        self._start_cpu = cpu_seconds()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sampler = RssSampler()
+        self._run_window = self._sampler.open()
+        self._hook = add_query_hook(self._on_query)
+
+    def _on_query(self, sql, params, seconds, error):
+        metrics = getattr(self._local, 'metrics', None)
+        if metrics is None:
+            return # Statement outside any stage (e.g. the scheduler's own bookkeeping)
+        metrics['queries'] += 1
+        metrics['query_seconds'] += seconds
+        if seconds >= metrics['slowest_query_seconds']:
+            metrics['slowest_query_seconds'] = seconds
+            metrics['slowest_query'] = " ".join(sql.split())[:500]
+        profile_path = getattr(self._local, 'profile_path', None)
+        if profile_path and error is None and seconds >= self.profile_min_seconds:
+            try:
+                with open(profile_path) as f:
+                    profile = f.read()
+            except OSError:
+                return
+            with self._lock:
+                self.profiles.append({
+                    'run_id': self.run_id, 'stage': metrics['stage'], 'query_seconds': seconds,
+                    'sql': " ".join(sql.split()), 'profile': profile,
+                })
+
+    @contextmanager
+    def stage(self, name, con=None):
+        """
+        Measures the enclosed block as one stage. The caller may set 'status', 'rows_in' and
+        'rows_out' on the yielded dict; an exception marks the stage failed and is re-raised.
+        """
+        metrics = {
+            'run_id': self.run_id, 'stage': name, 'status': 'ran', 'started_at': datetime.now(),
+            'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'rows_in': None, 'rows_out': None, 'peak_rss_mb': None,
+            'queries': 0, 'query_seconds': 0.0, 'slowest_query_seconds': 0.0, 'slowest_query': None,
+        }
+        profile_path = None
+        if self.profile and con is not None:
+            profile_path = os.path.join(tempfile.gettempdir(), f"duckdb_profile_{self.run_id}_{name}.json")
+            con.execute("SET enable_profiling = 'json';")
+            quoted_path = profile_path.replace("'", "''")
+            con.execute(f"SET profiling_output = '{quoted_path}';")
+        window = self._sampler.open()
+        start_wall, start_cpu = time.perf_counter(), cpu_seconds()
+        self._local.metrics, self._local.profile_path = metrics, profile_path
+        try:
+            yield metrics
+        except BaseException:
+            metrics['status'] = 'failed'
+            raise
+        finally:
+            self._local.metrics, self._local.profile_path = None, None
+            metrics['wall_seconds'] = time.perf_counter() - start_wall
+            metrics['cpu_seconds'] = cpu_seconds() - start_cpu
+            peak = self._sampler.close(window)
+            metrics['peak_rss_mb'] = peak / 2**20 if peak else None
+            if profile_path:
+                try:
+                    con.execute("RESET enable_profiling;")
+                    con.execute("RESET profiling_output;")
+                except Exception:
+                    pass
+                if os.path.exists(profile_path):
+                    os.remove(profile_path)
+            with self._lock:
+                self.stages.append(metrics)
+
+    def save(self, con, status):
+        """Stops measuring and appends this run's metrics to the ops tables."""
+        remove_query_hook(self._hook)
+        peak = self._sampler.close(self._run_window)
+        self._sampler.stop()
+        run = {
+            'run_id': self.run_id,
+            'run_name': self.run_name,
+            'started_at': self.started_at,
+            'finished_at': datetime.now(),
+            'status': status,
+            'wall_seconds': time.perf_counter() - self._start_wall,
+            'cpu_seconds': cpu_seconds() - self._start_cpu,
+            'peak_rss_mb': peak / 2**20 if peak else None,
+            'sales_rows': table_rows(con, ['main.sales']), # Data volume, to read timings against
+            'options': json.dumps(self.options, sort_keys=True, default=str),
+        }
+        ensure_metrics_tables(con)
+        con.execute(f"INSERT INTO {RUNS_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);", list(run.values()))
+        for metrics in self.stages:
+            con.execute(f"INSERT INTO {STAGE_METRICS_TABLE} VALUES ({', '.join('?' * len(metrics))});", list(metrics.values()))
+        for profile in self.profiles:
+            con.execute(f"INSERT INTO {QUERY_PROFILES_TABLE} VALUES (?, ?, ?, ?, ?);", list(profile.values()))
+        return run
+
+def ensure_metrics_tables(con):
+    con.execute("CREATE SCHEMA IF NOT EXISTS ops;")
+    con.execute(f"""
+    CREATE TABLE IF NOT EXISTS {RUNS_TABLE} (
+        run_id VARCHAR PRIMARY KEY,
+        run_name VARCHAR,
+        started_at TIMESTAMP,
+        finished_at TIMESTAMP,
+        status VARCHAR,
+        wall_seconds DOUBLE,
+        cpu_seconds DOUBLE,
+        peak_rss_mb DOUBLE,
+        sales_rows BIGINT,
+        options VARCHAR
+    );
+    """)
+    con.execute(f"""
+    CREATE TABLE IF NOT EXISTS {STAGE_METRICS_TABLE} (
+        run_id VARCHAR,
+        stage VARCHAR,
+        status VARCHAR,
+        started_at TIMESTAMP,
+        wall_seconds DOUBLE,
+        cpu_seconds DOUBLE,
+        rows_in BIGINT,
+        rows_out BIGINT,
+        peak_rss_mb DOUBLE,
+        queries INTEGER,
+        query_seconds DOUBLE,
+        slowest_query_seconds DOUBLE,
+        slowest_query VARCHAR
+    );
+    """)
+    con.execute(f"""
+    CREATE TABLE IF NOT EXISTS {QUERY_PROFILES_TABLE} (
+        run_id VARCHAR,
+        stage VARCHAR,
+        query_seconds DOUBLE,
+        sql VARCHAR,
+        profile VARCHAR -- DuckDB JSON profile: operator tree with per-operator timings and cardinalities
+    );
+    """)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect pipeline run metrics or profile a single query.")
+    parser.add_argument('--explain', metavar='SQL', help="Print the EXPLAIN ANALYZE plan of this statement.")
+    parser.add_argument('--last-runs', type=int, default=5, help="Show stage timings of the last N recorded runs.")
+    args = parser.parse_args()
+
+    con = get_connection(read_only=True, db_path=DUCKDB_DB_PATH)
+    if args.explain:
+        print(explain_analyze(con, args.explain))
+    else:
+        print(con.execute(f"""
+        SELECT r.started_at, r.status AS run_status, r.sales_rows, s.stage, s.status,
+               round(s.wall_seconds, 3) AS wall_seconds, round(s.cpu_seconds, 3) AS cpu_seconds,
+               s.rows_in, s.rows_out, round(s.peak_rss_mb, 1) AS peak_rss_mb, s.queries, round(s.query_seconds, 3) AS query_seconds
+        FROM {STAGE_METRICS_TABLE} AS s
+        JOIN (SELECT * FROM {RUNS_TABLE} ORDER BY started_at DESC LIMIT ?) AS r USING (run_id)
+        ORDER BY r.started_at, s.started_at;
+        """, [args.last_runs]).fetchdf().to_string(index=False))
+    close_connection(DUCKDB_DB_PATH)
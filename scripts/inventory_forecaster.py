@@ -1,23 +1,510 @@
 # scripts/inventory_forecaster.py
-import duckdb
 import pandas as pd
+import numpy as np
 import os
-from datetime import datetime, timedelta
+import time
+import argparse
+import heapq
+from concurrent.futures import ProcessPoolExecutor
 
 # Importing forecasting libraries
 from statsmodels.tsa.statespace.sarimax import SARIMAX # More general than ARIMA
 from prophet import Prophet
 import warnings
 
+from data_version import bump_data_version
+from db import DUCKDB_DB_PATH, get_connection, close_connection
+from ts_matrix import build_matrix, series
+from model_store import (DEFAULT_MAX_AGE_DAYS, DEFAULT_MAX_MODELS, evict_models, load_model, prophet_params,
+                         save_model, series_fingerprint, stan_init, touch_model)
+
 warnings.filterwarnings("ignore") # Ignore some common warnings from statsmodels/prophet
 
-# Define paths relative to the project root
-PROJECT_ROOT = os.path.join(os.path.dirname(__file__), '..')
-DUCKDB_DB_PATH = os.path.join(PROJECT_ROOT, 'data', 'retail_data.duckdb') # The DuckDB database file
+FORECAST_HORIZON_DAYS = 30 # Forecast for the next 30 days
+DEFAULT_MAX_WORKERS = os.cpu_count() or 1
+DEFAULT_CHUNK_SIZE = 4 # Products handed to a worker process at a time
+FORECAST_WRITE_BATCH_ROWS = 100_000 # Rows buffered before each insert into DuckDB
+
+# Vectorized baseline tier: every product not routed to Prophet/SARIMAX is forecast at once
+# from a products x days matrix
+BASELINE_METHODS = ('seasonal_naive', 'moving_average', 'exp_smoothing')
+SEASON_LENGTH_DAYS = 7
+MOVING_AVERAGE_DAYS = 28
+SMOOTHING_ALPHA = 0.2
+VALIDATION_DAYS = 28 # Holdout used by baseline method 'auto' to pick the best method per product
+
+# 'policy' sends only products matching ROUTING_POLICY to Prophet/SARIMAX, 'all' sends every
+# product (the per-product path handles short histories itself), 'baseline' sends none
+ROUTING_MODES = ('policy', 'all', 'baseline')
+# Store-level forecasting: 'bottom_up' forecasts every product x store series with the
+# vectorized tier and sums up to products, so it only supports routing 'baseline' (and never
+# uses the model store); 'top_down' forecasts products as usual and splits each forecast across
+# stores by their recent share of the product's units. Product granularity drops the
+# store-level and category tables, which only product_store granularity writes.
+GRANULARITIES = ('product', 'product_store')
+RECONCILIATION_METHODS = ('bottom_up', 'top_down')
+STORE_SHARE_DAYS = 90
+
+ROUTING_POLICY = {
+    'min_history_days': 60, # Prophet needs a reasonable amount of data
+    'recent_days': 90, # Window the volume and variability are measured over
+    'volume_quantile': 0.8, # High volume: top 20% of products by recent units sold
+    'cv_threshold': 1.5, # High variance: std / mean of recent daily sales
+}
+
+def horizon_dates(last_date, forecast_horizon_days=FORECAST_HORIZON_DAYS):
+    """The forecast_horizon_days calendar days after last_date as a datetime64[D] array."""
+    return np.datetime64(pd.Timestamp(last_date).date(), 'D') + np.arange(1, forecast_horizon_days + 1)
+
+def non_negative_quantities(values):
+    """Rounds predictions to whole units and clips them at zero, vectorized."""
+    return np.maximum(0, np.round(np.asarray(values, dtype='float64'))).astype('int64')
+
+def seasonal_naive_forecast(matrix, horizon, season=SEASON_LENGTH_DAYS):
+    """Repeats each product's last season (week) across the horizon."""
+    last_season = matrix[:, -season:]
+    return np.tile(last_season, -(-horizon // last_season.shape[1]))[:, :horizon]
+
+def moving_average_forecast(matrix, horizon, window=MOVING_AVERAGE_DAYS):
+    """Holds each product's mean over the last window days flat across the horizon."""
+    return np.repeat(matrix[:, -window:].mean(axis=1, keepdims=True), horizon, axis=1)
+
+def exp_smoothing_forecast(matrix, horizon, alpha=SMOOTHING_ALPHA):
+    """
+    Simple exponential smoothing, held flat across the horizon. The final level is a fixed
+    weighted sum of the series, so all products are smoothed in one matrix-vector product.
+    """
+    days = matrix.shape[1]
+    weights = alpha * (1 - alpha) ** np.arange(days - 1, -1, -1, dtype='float64')
+    weights[0] = (1 - alpha) ** (days - 1) # The level starts at the first observation
+    return np.repeat((matrix @ weights)[:, None], horizon, axis=1)
+
+BASELINE_FORECASTERS = {
+    'seasonal_naive': seasonal_naive_forecast,
+    'moving_average': moving_average_forecast,
+    'exp_smoothing': exp_smoothing_forecast,
+}
+
+def baseline_forecasts(matrix, horizon=FORECAST_HORIZON_DAYS, method='auto'):
+    """
+    Forecasts every row of a products x days matrix at once.
+    With method 'auto' each product gets the baseline with the lowest mean absolute error over
+    its last VALIDATION_DAYS days, when fitted on the days before.
+    Returns (forecasts, methods): a products x horizon array and each product's method name.
+    """
+    if method == 'auto' and matrix.shape[1] < VALIDATION_DAYS + MOVING_AVERAGE_DAYS:
+        method = 'moving_average' # Too little history to hold out a validation window
+    if method != 'auto':
+        return BASELINE_FORECASTERS[method](matrix, horizon), np.full(len(matrix), method, dtype=object)
+
+    train, holdout = matrix[:, :-VALIDATION_DAYS], matrix[:, -VALIDATION_DAYS:]
+    errors = np.stack([np.abs(forecaster(train, VALIDATION_DAYS) - holdout).mean(axis=1)
+                       for forecaster in BASELINE_FORECASTERS.values()])
+    best = errors.argmin(axis=0)
+    forecasts = np.stack([forecaster(matrix, horizon) for forecaster in BASELINE_FORECASTERS.values()])
+    return forecasts[best, np.arange(len(matrix))], np.array(BASELINE_METHODS, dtype=object)[best]
+
+def route_products(matrix, policy=ROUTING_POLICY):
+    """
+    Boolean mask of the products worth a per-product Prophet/SARIMAX fit: enough history, and
+    either high recent volume or a volatile recent series.
+    """
+    history_days = matrix.shape[1] - (matrix > 0).argmax(axis=1)
+    recent = matrix[:, -policy['recent_days']:]
+    volume = recent.sum(axis=1)
+    mean, std = recent.mean(axis=1), recent.std(axis=1)
+    cv = np.divide(std, mean, out=np.zeros_like(std), where=mean > 0)
+    # Products with no recent sales are never high volume, even when most of the catalog has none and the quantile is 0
+    high_volume = (volume >= np.quantile(volume, policy['volume_quantile'])) & (volume > 0)
+    return (history_days >= policy['min_history_days']) & (high_volume | (cv >= policy['cv_threshold']))
+
+def baseline_results(product_ids, matrix, last_date, method='auto'):
+    """Yields one forecast result per matrix row, in the same shape as run_forecast_task's."""
+    if len(product_ids) == 0:
+        return
+    start = time.perf_counter()
+    forecasts, methods = baseline_forecasts(matrix, FORECAST_HORIZON_DAYS, method)
+    predicted = non_negative_quantities(forecasts)
+    seconds = (time.perf_counter() - start) / len(product_ids) # Amortized over the batch
+    forecast_dates = horizon_dates(last_date)
+    for row, product_id in enumerate(product_ids):
+        yield {
+            'product_id': product_id,
+            'forecast_dates': forecast_dates,
+            'predicted_quantities': predicted[row],
+            'method': methods[row],
+            'seconds': seconds,
+            'error': None,
+            'params': None,
+            'model_source': 'baseline',
+        }
+
+def bottom_up_results(product_ids, store_matrix, last_date, method='auto'):
+    """
+    Forecasts every product x store series at once with the vectorized baseline tier and sums
+    the stores up to products. Returns (store_quantities, results): a products x stores x horizon
+    array of whole units and one product-level result per product.
+    """
+    start = time.perf_counter()
+    products, stores, days = store_matrix.shape
+    forecasts, _ = baseline_forecasts(store_matrix.reshape(products * stores, days), FORECAST_HORIZON_DAYS, method)
+    store_quantities = non_negative_quantities(forecasts).reshape(products, stores, FORECAST_HORIZON_DAYS)
+    seconds = (time.perf_counter() - start) / max(products, 1) # Amortized over the batch
+    forecast_dates = horizon_dates(last_date)
+    results = [{
+        'product_id': product_id,
+        'forecast_dates': forecast_dates,
+        'predicted_quantities': store_quantities[row].sum(axis=0),
+        'method': 'bottom_up',
+        'seconds': seconds,
+        'error': None,
+        'params': None,
+        'model_source': 'baseline',
+    } for row, product_id in enumerate(product_ids)]
+    return store_quantities, results
+
+def store_shares(store_matrix, window=STORE_SHARE_DAYS):
+    """
+    Each product's split of units across stores over the last window days, falling back to its
+    whole history and then to an even split. Returns a products x stores array of rows summing to 1.
+    """
+    weights = store_matrix[:, :, -window:].sum(axis=2, dtype='float64')
+    weights = np.where(weights.sum(axis=1, keepdims=True) > 0, weights, store_matrix.sum(axis=2, dtype='float64'))
+    weights = np.where(weights.sum(axis=1, keepdims=True) > 0, weights, 1.0)
+    return weights / weights.sum(axis=1, keepdims=True)
+
+def split_top_down(totals, shares):
+    """
+    Splits whole-unit product forecasts (products x horizon) across stores (products x stores x
+    horizon) by share. Remainders go to the stores with the largest fractional parts, so the
+    stores always add back up to the product total.
+    """
+    raw = totals[:, None, :] * shares[:, :, None]
+    split = np.floor(raw)
+    shortfall = np.rint(totals - split.sum(axis=1)) # Units left to hand out per product and day
+    rank = np.argsort(np.argsort(split - raw, axis=1), axis=1) # 0 = largest fractional part
+    return (split + (rank < shortfall[:, None, :])).astype('int64')
+
+def collect_results(results, collected):
+    """Passes results through while keeping each one by product_id, for reconciliation afterwards."""
+    for result in results:
+        collected[result['product_id']] = result
+        yield result
+
+def new_prophet_model():
+    return Prophet(
+        yearly_seasonality=True,
+        weekly_seasonality=True,
+        daily_seasonality=False,
+        interval_width=0.95 # Confidence interval
+    )
+
+def fit_prophet(prophet_df, init_params=None):
+    """
+    Fits Prophet, warm-starting the optimizer from a previous fit's parameters when given.
+    Returns (model, model_source) where model_source is 'warm' or 'cold'.
+    """
+    if init_params is not None:
+        try:
+            return new_prophet_model().fit(prophet_df, init=stan_init(init_params)), 'warm'
+        except Exception:
+            pass # e.g. parameter shapes changed; a fitted Prophet can't be refit, so start over cold
+    return new_prophet_model().fit(prophet_df), 'cold'
+
+def forecast_product(product_id, product_df, default_last_date, forecast_horizon_days=FORECAST_HORIZON_DAYS, init_params=None):
+    """
+    Forecasts one product's daily series.
+    Returns (forecast_dates, predicted_quantities, method, error, params, model_source) where the
+    first two are equal-length NumPy arrays, error collects any fallback messages and params are
+    the fitted Prophet parameters (None for other methods) to warm-start the next fit.
+    """
+    errors = []
+
+    if len(product_df) < 60: # Need a reasonable amount of data for forecasting
+        # Fallback: Simple average of last 7 days or 0 if no data
+        predicted_quantity = round(product_df.tail(7).mean()) if not product_df.empty else 0
+
+        # Create simple forecast for the horizon if not enough data
+        last_date = product_df.index[-1] if not product_df.empty else default_last_date
+        predicted = np.full(forecast_horizon_days, max(0, predicted_quantity), dtype='int64') # Ensure non-negative
+        return horizon_dates(last_date, forecast_horizon_days), predicted, 'recent_mean', None, None, 'cold'
+
+    try:
+        # --- Use Prophet for forecasting ---
+        # Prophet requires columns 'ds' (datestamp) and 'y' (value)
+        prophet_df = pd.DataFrame({'ds': product_df.index, 'y': product_df.to_numpy()})
+
+        # Fit Prophet model
+        model, model_source = fit_prophet(prophet_df, init_params)
+
+        # Make future dataframe
+        future = model.make_future_dataframe(periods=forecast_horizon_days, freq='D')
 
-def forecast_inventory_demand():
-    print(f"Connecting to DuckDB database: {DUCKDB_DB_PATH}")
-    con = duckdb.connect(database=DUCKDB_DB_PATH)
+        # Predict
+        forecast = model.predict(future)
+
+        # Extract relevant part of the forecast (future dates only)
+        last_historical_date = prophet_df['ds'].max()
+        future_forecast = forecast[forecast['ds'] > last_historical_date]
+
+        yhat = future_forecast['yhat'].to_numpy() # yhat is the prediction
+        if np.isnan(yhat).any():
+            raise ValueError("Prophet returned NaN predictions")
+        forecast_dates = future_forecast['ds'].to_numpy().astype('datetime64[D]')
+        return forecast_dates, non_negative_quantities(yhat), 'prophet', None, prophet_params(model), model_source
+
+    except Exception as e:
+        errors.append(f"Prophet failed (using SARIMAX fallback): {e}")
+        # Fallback to SARIMAX if Prophet fails or for robustness (simpler SARIMAX)
+        try:
+            # Choose SARIMAX order (p,d,q)(P,D,Q,s) - very basic example order
+            # (1,1,1)(0,0,0,0) is a common starting point for non-seasonal
+            sarimax_model = SARIMAX(product_df, order=(1,1,1), seasonal_order=(0,0,0,0))
+            sarimax_fit = sarimax_model.fit(disp=False) # disp=False suppresses verbose output
+
+            # Forecast
+            sarimax_forecast = np.asarray(sarimax_fit.predict(start=len(product_df), end=len(product_df) + forecast_horizon_days - 1))
+            if np.isnan(sarimax_forecast).any():
+                raise ValueError("SARIMAX returned NaN predictions")
+            return horizon_dates(product_df.index[-1], forecast_horizon_days), non_negative_quantities(sarimax_forecast), 'sarimax', "; ".join(errors), None, 'cold'
+        except Exception as sarimax_e:
+            errors.append(f"SARIMAX fallback failed: {sarimax_e}")
+            # If all else fails, add 0 prediction for the product
+            predicted = np.zeros(forecast_horizon_days, dtype='int64')
+            return horizon_dates(product_df.index[-1], forecast_horizon_days), predicted, 'zero', "; ".join(errors), None, 'cold'
+
+def run_forecast_task(task):
+    """Worker entry point: forecasts one product and records how long it took."""
+    product_id, product_df, default_last_date, init_params = task
+    start = time.perf_counter()
+    try:
+        forecast_dates, predicted, method, error, params, model_source = forecast_product(
+            product_id, product_df, default_last_date, init_params=init_params)
+    except Exception as e:
+        forecast_dates, predicted = np.array([], dtype='datetime64[D]'), np.array([], dtype='int64')
+        method, error, params, model_source = 'failed', str(e), None, 'cold'
+    return {
+        'product_id': product_id,
+        'forecast_dates': forecast_dates,
+        'predicted_quantities': predicted,
+        'method': method,
+        'seconds': time.perf_counter() - start,
+        'error': error,
+        'params': params,
+        'model_source': model_source,
+    }
+
+def cached_result(record):
+    """Rebuilds a forecast result from a model store record whose series has not changed."""
+    return {
+        'product_id': record['product_id'],
+        'forecast_dates': np.array(record['forecast_dates'], dtype='datetime64[D]'),
+        'predicted_quantities': np.array(record['predicted_quantities'], dtype='int64'),
+        'method': record['method'],
+        'seconds': 0.0,
+        'error': record['error'],
+        'params': record['params'],
+        'model_source': 'cached',
+    }
+
+def store_results(results, fingerprints):
+    """Saves each freshly fitted result to the model store as it passes through."""
+    for result in results:
+        if result['method'] != 'failed':
+            save_model({
+                'product_id': result['product_id'],
+                'fingerprint': fingerprints[result['product_id']],
+                'method': result['method'],
+                'error': result['error'],
+                'params': result['params'],
+                'forecast_dates': [str(d) for d in result['forecast_dates']],
+                'predicted_quantities': result['predicted_quantities'].tolist(),
+            })
+        yield result
+
+def run_forecast_tasks(tasks, max_workers=DEFAULT_MAX_WORKERS, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Fans product tasks out over a process pool and yields results as they complete, in task order.
+    Executor.map keeps results in task order, so output is deterministic regardless of worker count.
+    """
+    if max_workers <= 1:
+        for task in tasks:
+            yield run_forecast_task(task)
+        return
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        yield from executor.map(run_forecast_task, tasks, chunksize=chunk_size)
+
+def flush_forecast_batch(con, product_ids, forecast_dates, predicted_quantities):
+    """Appends one batch of columnar forecast arrays to forecasts.product_demand_forecasts."""
+    batch_df = pd.DataFrame({
+        'product_id': np.concatenate(product_ids),
+        'forecast_date': np.concatenate(forecast_dates),
+        'predicted_quantity': np.concatenate(predicted_quantities),
+    })
+    con.register('batch_df', batch_df)
+    try:
+        con.execute("""
+        INSERT INTO forecasts.product_demand_forecasts
+        SELECT product_id, strftime(forecast_date, '%Y-%m-%d'), predicted_quantity FROM batch_df;
+        """)
+    finally:
+        con.unregister('batch_df')
+    return len(batch_df)
+
+def write_forecasts(con, results, batch_rows=FORECAST_WRITE_BATCH_ROWS):
+    """
+    Streams forecast results into forecasts.product_demand_forecasts.
+    Per-product arrays are buffered and concatenated once per batch, so assembly is linear in
+    the number of rows and memory is bounded by batch_rows rather than the whole catalog.
+    Returns (rows_written, diagnostics) where diagnostics holds one dict per product.
+    """
+    diagnostics = []
+    product_ids, forecast_dates, predicted_quantities = [], [], []
+    buffered_rows = 0
+    rows_written = 0
+
+    con.execute("BEGIN TRANSACTION;")
+    try:
+        con.execute("""
+        CREATE OR REPLACE TABLE forecasts.product_demand_forecasts (
+            product_id VARCHAR, forecast_date VARCHAR, predicted_quantity BIGINT
+        );
+        """)
+        for result in results:
+            diagnostics.append({key: result[key] for key in ('product_id', 'method', 'model_source', 'seconds', 'error')})
+            row_count = len(result['predicted_quantities'])
+            if row_count == 0:
+                continue
+            product_ids.append(np.full(row_count, result['product_id'], dtype=object))
+            forecast_dates.append(result['forecast_dates'])
+            predicted_quantities.append(result['predicted_quantities'])
+            buffered_rows += row_count
+
+            if buffered_rows >= batch_rows:
+                rows_written += flush_forecast_batch(con, product_ids, forecast_dates, predicted_quantities)
+                product_ids, forecast_dates, predicted_quantities = [], [], []
+                buffered_rows = 0
+
+        if buffered_rows:
+            rows_written += flush_forecast_batch(con, product_ids, forecast_dates, predicted_quantities)
+
+        if rows_written:
+            con.execute("COMMIT;")
+        else:
+            con.execute("ROLLBACK;") # Keep the previous forecasts rather than publishing an empty table
+    except Exception:
+        con.execute("ROLLBACK;")
+        raise
+    return rows_written, diagnostics
+
+def write_store_forecasts(con, product_ids, store_ids, forecast_dates, store_quantities, batch_rows=FORECAST_WRITE_BATCH_ROWS):
+    """
+    Replaces forecasts.product_store_demand_forecasts from a products x stores x horizon array,
+    where forecast_dates is products x horizon. Rows are built in batches of whole products.
+    """
+    products, stores, horizon = store_quantities.shape
+    products_per_batch = max(1, batch_rows // (stores * horizon))
+    con.execute("BEGIN TRANSACTION;")
+    try:
+        con.execute("""
+        CREATE OR REPLACE TABLE forecasts.product_store_demand_forecasts (
+            product_id VARCHAR, store_id VARCHAR, forecast_date VARCHAR, predicted_quantity BIGINT
+        );
+        """)
+        for first in range(0, products, products_per_batch):
+            last = min(first + products_per_batch, products)
+            batch_df = pd.DataFrame({
+                'product_id': np.repeat(product_ids[first:last], stores * horizon),
+                'store_id': np.tile(np.repeat(store_ids, horizon), last - first),
+                'forecast_date': np.repeat(forecast_dates[first:last, None, :], stores, axis=1).ravel(),
+                'predicted_quantity': store_quantities[first:last].ravel(),
+            })
+            con.register('batch_df', batch_df)
+            try:
+                con.execute("""
+                INSERT INTO forecasts.product_store_demand_forecasts
+                SELECT product_id, store_id, strftime(forecast_date, '%Y-%m-%d'), predicted_quantity FROM batch_df;
+                """)
+            finally:
+                con.unregister('batch_df')
+        con.execute("COMMIT;")
+    except Exception:
+        con.execute("ROLLBACK;")
+        raise
+    return products * stores * horizon
+
+def write_category_forecasts(con):
+    """Aggregates the (reconciled) product forecasts up to category, so every level adds up."""
+    con.execute("""
+    CREATE OR REPLACE TABLE forecasts.category_demand_forecasts AS
+    SELECT p.category, f.forecast_date, SUM(f.predicted_quantity)::BIGINT AS predicted_quantity
+    FROM forecasts.product_demand_forecasts AS f
+    JOIN marts.dim_products AS p USING (product_id)
+    GROUP BY ALL
+    ORDER BY ALL;
+    """)
+    return con.execute("SELECT COUNT(*) FROM forecasts.category_demand_forecasts;").fetchone()[0]
+
+def forecast_products(axes, matrix, default_last_date, max_workers=DEFAULT_MAX_WORKERS, chunk_size=DEFAULT_CHUNK_SIZE,
+                      use_model_cache=True, routing='policy', baseline_method='auto'):
+    """
+    Forecasts every row of a products x days matrix: routed products get a per-product
+    Prophet/SARIMAX fit (or their stored forecast), the rest the vectorized baseline.
+    Yields one result per product, in product order.
+    """
+    if routing not in ROUTING_MODES:
+        raise ValueError(f"Unknown routing '{routing}'. Expected one of {ROUTING_MODES}.")
+    product_ids = axes['product_id']
+
+    # Route products between the vectorized baseline tier and per-product Prophet/SARIMAX fits
+    if routing == 'policy':
+        routed = route_products(matrix)
+    else:
+        routed = np.full(len(product_ids), routing == 'all')
+    print(f"Routing {routed.sum()} of {len(product_ids)} products to Prophet/SARIMAX, "
+          f"{(~routed).sum()} to the vectorized baseline (routing '{routing}', baseline method '{baseline_method}').")
+    baseline = baseline_results(product_ids[~routed], matrix[~routed], default_last_date, baseline_method)
+
+    # Products whose series is unchanged since the stored model reuse its forecast; the rest
+    # are refit, warm-starting Prophet from the stored parameters where there are any
+    tasks, cached, fingerprints = [], [], {}
+    for row in np.flatnonzero(routed):
+        product_id = product_ids[row]
+        product_df = series(axes, matrix[row], name='total_quantity_sold') # First to last day with sales
+        fingerprint = series_fingerprint(product_df, default_last_date, FORECAST_HORIZON_DAYS)
+        record = load_model(product_id) if use_model_cache else None
+        if record is not None and record['fingerprint'] == fingerprint:
+            touch_model(product_id)
+            cached.append(cached_result(record))
+            continue
+        fingerprints[product_id] = fingerprint
+        tasks.append((product_id, product_df, default_last_date, record['params'] if record else None))
+
+    print(f"Starting forecasting for {len(tasks)} changed products ({len(cached)} unchanged, reused from the model store) "
+          f"on {max_workers} worker(s), chunk size {chunk_size}...")
+    fitted = store_results(run_forecast_tasks(tasks, max_workers=max_workers, chunk_size=chunk_size), fingerprints)
+    return heapq.merge(baseline, cached, fitted, key=lambda result: result['product_id']) # All are in product order
+
+def resolve_routing(routing, granularity, reconciliation):
+    """The routing mode to use: routing if it fits the granularity, else the default for it when routing is None."""
+    bottom_up = granularity == 'product_store' and reconciliation == 'bottom_up'
+    if routing is None:
+        return 'baseline' if bottom_up else 'policy'
+    if routing not in ROUTING_MODES:
+        raise ValueError(f"Unknown routing '{routing}'. Expected one of {ROUTING_MODES}.")
+    if bottom_up and routing != 'baseline':
+        raise ValueError(f"Routing '{routing}' needs per-product Prophet/SARIMAX fits, but bottom_up reconciliation forecasts "
+                         "every product x store series with the vectorized baseline. Use reconciliation 'top_down' instead.")
+    return routing
+
+def forecast_inventory_demand(max_workers=DEFAULT_MAX_WORKERS, chunk_size=DEFAULT_CHUNK_SIZE, con=None,
+                              use_model_cache=True, max_model_age_days=DEFAULT_MAX_AGE_DAYS, max_models=DEFAULT_MAX_MODELS,
+                              routing=None, baseline_method='auto', granularity='product', reconciliation='bottom_up'):
+    routing = resolve_routing(routing, granularity, reconciliation)
+    owns_connection = con is None
+    if owns_connection:
+        print(f"Connecting to DuckDB database: {DUCKDB_DB_PATH}")
+        con = get_connection()
 
     # Create a schema for forecasts if it doesn't exist
     con.execute("CREATE SCHEMA IF NOT EXISTS forecasts;")
@@ -26,125 +513,120 @@ def forecast_inventory_demand():
     # Fetch historical daily sales data from the fct_sales mart
     print("\nFetching historical daily product sales data...")
     # Note: fct_sales should exist after transform_marts.py runs successfully
-    query_daily_sales = """
-    SELECT
-        sale_date,
-        product_id,
-        SUM(quantity_sold) AS total_quantity_sold
-    FROM marts.fct_sales
-    GROUP BY sale_date, product_id
-    ORDER BY sale_date, product_id;
-    """
-    historical_sales_df = con.execute(query_daily_sales).fetchdf()
-
-    if historical_sales_df.empty:
+    # Daily units per product as a dense products x days matrix, zero-filled for days without sales.
+    # At store granularity the products x stores x days matrix is built and summed over stores.
+    store_matrix = None
+    if granularity == 'product_store':
+        axes, store_matrix = build_matrix(con, keys=('product_id', 'store_id'), dtype='float32')
+        matrix = store_matrix.sum(axis=1, dtype='float64')
+    else:
+        axes, matrix = build_matrix(con, keys=('product_id',))
+
+    if matrix.size == 0:
         print("No historical sales data found. Cannot perform forecasting.")
-        con.close()
+        if owns_connection:
+            close_connection()
         return
 
-    # Ensure sale_date is datetime and set as index for time series operations
-    historical_sales_df['sale_date'] = pd.to_datetime(historical_sales_df['sale_date'])
+    product_ids = axes['product_id']
+    default_last_date = axes['date'][-1].to_pydatetime()
+    shape = store_matrix.shape if store_matrix is not None else matrix.shape
+    print(f"Built a {' x '.join(map(str, shape))} ({' x '.join(axes)}) sales matrix.")
 
-    all_forecasts = pd.DataFrame()
-    forecast_horizon_days = 30 # Forecast for the next 30 days
+    start = time.perf_counter()
+    collected = {}
+    if granularity == 'product_store' and reconciliation == 'bottom_up':
+        print(f"Forecasting {store_matrix.shape[0] * store_matrix.shape[1]} product x store series with the vectorized "
+              f"baseline (baseline method '{baseline_method}') and summing them up to products...")
+        store_quantities, results = bottom_up_results(product_ids, store_matrix, default_last_date, baseline_method)
+    else:
+        results = forecast_products(axes, matrix, default_last_date, max_workers, chunk_size, use_model_cache,
+                                    routing, baseline_method)
+        if granularity == 'product_store':
+            results = collect_results(results, collected)
 
-    print(f"Starting forecasting for {len(historical_sales_df['product_id'].unique())} unique products...")
+    # Store forecasts in DuckDB as results arrive
+    rows_written, diagnostics = write_forecasts(con, results)
+    elapsed = time.perf_counter() - start
+    diagnostics_df = pd.DataFrame(diagnostics)
 
-    for product_id in historical_sales_df['product_id'].unique():
-        product_df = historical_sales_df[historical_sales_df['product_id'] == product_id].set_index('sale_date')
-        product_df = product_df['total_quantity_sold'].resample('D').sum().fillna(0) # Resample to daily, fill missing days with 0
+    failed = diagnostics_df['error'].notnull().sum()
+    print(f"Forecasted {len(diagnostics_df)} products in {elapsed:.2f}s ({failed} with fallbacks or failures).")
+    print(diagnostics_df.groupby(['method', 'model_source'])['seconds'].agg(['count', 'sum', 'max']).round(2).to_string())
 
-        if len(product_df) < 60: # Need a reasonable amount of data for forecasting
-            # print(f"  Skipping forecasting for {product_id}: Not enough historical data ({len(product_df)} days).")
-            # Fallback: Simple average of last 7 days or 0 if no data
-            predicted_quantity = round(product_df.tail(7).mean()) if not product_df.empty else 0
+    # Store per-product timings and failures alongside the forecasts
+    con.execute("""
+    CREATE OR REPLACE TABLE forecasts.forecast_run_diagnostics (
+        product_id VARCHAR, method VARCHAR, model_source VARCHAR, seconds DOUBLE, error VARCHAR
+    );
+    """)
+    con.register('diagnostics_df', diagnostics_df)
+    con.execute("INSERT INTO forecasts.forecast_run_diagnostics SELECT * FROM diagnostics_df;")
+    con.unregister('diagnostics_df')
 
-            # Create simple forecast for the horizon if not enough data
-            last_date = product_df.index[-1] if not product_df.empty else datetime.strptime(historical_sales_df['sale_date'].max().strftime('%Y-%m-%d'), '%Y-%m-%d')
-            for i in range(1, forecast_horizon_days + 1):
-                forecast_date = last_date + timedelta(days=i)
-                all_forecasts = pd.concat([all_forecasts, pd.DataFrame([{
-                    'product_id': product_id,
-                    'forecast_date': forecast_date.strftime('%Y-%m-%d'),
-                    'predicted_quantity': max(0, predicted_quantity) # Ensure non-negative
-                }])], ignore_index=True)
-            continue
-
-        try:
-            # --- Use Prophet for forecasting ---
-            # Prophet requires columns 'ds' (datestamp) and 'y' (value)
-            prophet_df = product_df.reset_index().rename(columns={'sale_date': 'ds', 'total_quantity_sold': 'y'})
-
-            # Fit Prophet model
-            model = Prophet(
-                yearly_seasonality=True,
-                weekly_seasonality=True,
-                daily_seasonality=False,
-                interval_width=0.95 # Confidence interval
-            )
-            model.fit(prophet_df)
-
-            # Make future dataframe
-            future = model.make_future_dataframe(periods=forecast_horizon_days, freq='D')
-
-            # Predict
-            forecast = model.predict(future)
-
-            # Extract relevant part of the forecast (future dates only)
-            last_historical_date = prophet_df['ds'].max()
-            future_forecast = forecast[forecast['ds'] > last_historical_date]
-
-            for _, row in future_forecast.iterrows():
-                all_forecasts = pd.concat([all_forecasts, pd.DataFrame([{
-                    'product_id': product_id,
-                    'forecast_date': row['ds'].strftime('%Y-%m-%d'),
-                    'predicted_quantity': max(0, round(row['yhat'])) # yhat is the prediction
-                }])], ignore_index=True)
-            # print(f"  Forecasted for {product_id} using Prophet.")
-
-        except Exception as e:
-            print(f"  Error forecasting {product_id} with Prophet (using SARIMAX fallback): {e}")
-            # Fallback to SARIMAX if Prophet fails or for robustness (simpler SARIMAX)
-            try:
-                # Choose SARIMAX order (p,d,q)(P,D,Q,s) - very basic example order
-                # (1,1,1)(0,0,0,0) is a common starting point for non-seasonal
-                sarimax_model = SARIMAX(product_df, order=(1,1,1), seasonal_order=(0,0,0,0))
-                sarimax_fit = sarimax_model.fit(disp=False) # disp=False suppresses verbose output
-
-                # Forecast
-                sarimax_forecast = sarimax_fit.predict(start=len(product_df), end=len(product_df) + forecast_horizon_days - 1)
-                forecast_dates = pd.date_range(start=product_df.index[-1] + timedelta(days=1), periods=forecast_horizon_days, freq='D')
-
-                for date, value in zip(forecast_dates, sarimax_forecast):
-                    all_forecasts = pd.concat([all_forecasts, pd.DataFrame([{
-                        'product_id': product_id,
-                        'forecast_date': date.strftime('%Y-%m-%d'),
-                        'predicted_quantity': max(0, round(value)) # Ensure non-negative
-                    }])], ignore_index=True)
-                # print(f"  Forecasted for {product_id} using SARIMAX.")
-            except Exception as sarimax_e:
-                print(f"  Error forecasting {product_id} with SARIMAX fallback: {sarimax_e}. Skipping this product.")
-                # If all else fails, add 0 prediction for the product
-                last_date = product_df.index[-1]
-                for i in range(1, forecast_horizon_days + 1):
-                    forecast_date = last_date + timedelta(days=i)
-                    all_forecasts = pd.concat([all_forecasts, pd.DataFrame([{
-                        'product_id': product_id,
-                        'forecast_date': forecast_date.strftime('%Y-%m-%d'),
-                        'predicted_quantity': 0
-                    }])], ignore_index=True)
-
-
-    # Store forecasts in DuckDB
-    if not all_forecasts.empty:
-        con.execute("DROP TABLE IF EXISTS forecasts.product_demand_forecasts;")
-        con.execute("CREATE TABLE forecasts.product_demand_forecasts AS SELECT * FROM all_forecasts;")
-        print(f"\nLoaded {len(all_forecasts)} demand forecasts into forecasts.product_demand_forecasts.")
+    if rows_written:
+        print(f"\nLoaded {rows_written} demand forecasts into forecasts.product_demand_forecasts.")
     else:
         print("\nNo forecasts generated to load into DuckDB.")
 
-    con.close()
-    print("\nInventory forecasting complete. DuckDB connection closed.")
+    if granularity == 'product_store' and rows_written:
+        forecast_dates = np.tile(horizon_dates(default_last_date), (len(product_ids), 1))
+        if reconciliation == 'top_down':
+            # Split each product's forecast across stores; products without a forecast get zeros
+            totals = np.zeros((len(product_ids), FORECAST_HORIZON_DAYS), dtype='int64')
+            for row, product_id in enumerate(product_ids):
+                result = collected.get(product_id)
+                if result is not None and len(result['predicted_quantities']) == FORECAST_HORIZON_DAYS:
+                    totals[row] = result['predicted_quantities']
+                    forecast_dates[row] = result['forecast_dates']
+            store_quantities = split_top_down(totals, store_shares(store_matrix))
+        store_rows = write_store_forecasts(con, product_ids, axes['store_id'], forecast_dates, store_quantities)
+        category_rows = write_category_forecasts(con)
+        print(f"Loaded {store_rows} product x store forecasts ({reconciliation.replace('_', '-')}) into "
+              f"forecasts.product_store_demand_forecasts and {category_rows} into forecasts.category_demand_forecasts.")
+    elif granularity == 'product':
+        # Left over from a product_store run, they would no longer add up to the product forecasts
+        con.execute("DROP TABLE IF EXISTS forecasts.product_store_demand_forecasts;")
+        con.execute("DROP TABLE IF EXISTS forecasts.category_demand_forecasts;")
+
+    evicted = evict_models(max_model_age_days, max_models)
+    if evicted:
+        print(f"Evicted {evicted} stored model(s) from the model store.")
+
+    bump_data_version()
+    if owns_connection:
+        close_connection()
+    print("\nInventory forecasting complete.")
 
 if __name__ == "__main__":
-    forecast_inventory_demand()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Forecast daily product demand.")
+    parser.add_argument('--workers', type=int, default=DEFAULT_MAX_WORKERS,
+                        help="Number of worker processes (1 runs in-process).")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Number of products sent to a worker at a time.")
+    parser.add_argument('--no-model-cache', action='store_true',
+                        help="Refit every product from scratch instead of reusing or warm-starting stored models "
+                             "(only per-product Prophet/SARIMAX fits use the model store).")
+    parser.add_argument('--max-model-age-days', type=int, default=DEFAULT_MAX_AGE_DAYS,
+                        help="Evict stored models unused for this many days.")
+    parser.add_argument('--max-models', type=int, default=DEFAULT_MAX_MODELS,
+                        help="Keep at most this many stored models (least recently used are evicted).")
+    parser.add_argument('--routing', choices=ROUTING_MODES,
+                        help="Which products get a per-product Prophet/SARIMAX fit: those matching the routing policy (default), "
+                             "all, or none ('baseline'). Bottom-up product_store forecasts only support 'baseline', their default.")
+    parser.add_argument('--baseline-method', choices=('auto',) + BASELINE_METHODS, default='auto',
+                        help="Vectorized method for the remaining products ('auto' picks the best per product on a holdout).")
+    parser.add_argument('--granularity', choices=GRANULARITIES, default='product',
+                        help="Also forecast per product x store ('product_store'), reconciled with products and categories.")
+    parser.add_argument('--reconciliation', choices=RECONCILIATION_METHODS, default='bottom_up',
+                        help="At product_store granularity: sum baseline store forecasts up to products, or split product "
+                             "forecasts (with --routing and the model store) down to stores.")
+    args = parser.parse_args()
+    try:
+        resolve_routing(args.routing, args.granularity, args.reconciliation)
+    except ValueError as e:
+        parser.error(str(e))
+    forecast_inventory_demand(max_workers=args.workers, chunk_size=args.chunk_size, use_model_cache=not args.no_model_cache,
+                              max_model_age_days=args.max_model_age_days, max_models=args.max_models,
+                              routing=args.routing, baseline_method=args.baseline_method,
+                              granularity=args.granularity, reconciliation=args.reconciliation)
@@ -0,0 +1,93 @@
+# scripts/inventory_history.py
+#
+# As-of queries over marts.inventory_history, the SCD-2 history of product x store stock levels
+# that transform_marts.py appends to on every inventory load (see the 'snapshot' materialization
+# in model_runner.py). A version holds one stock level from valid_from up to, not including,
+# valid_to (NULL while it is still current), so "stock at date D" is a range predicate rather than
+# a search for the latest snapshot on or before D:
+#   * versions are appended in valid_from order, so DuckDB's per-row-group min/max statistics
+#     on valid_from skip every row group written after D;
+#   * many (product, store, date) lookups at once go through an ASOF JOIN, which merges the
+#     sorted lookups with the sorted history instead of probing the history once per lookup.
+import argparse
+
+from db import DUCKDB_DB_PATH, get_connection, close_connection
+
+INVENTORY_HISTORY_TABLE = 'marts.inventory_history'
+
+def stock_as_of_sql(as_of_date_sql):
+    """SELECT of the versions valid on the date that the SQL expression as_of_date_sql evaluates to."""
+    return f"""
+    SELECT product_id, store_id, current_stock_level, valid_from, valid_to
+    FROM {INVENTORY_HISTORY_TABLE}
+    WHERE valid_from <= {as_of_date_sql} AND (valid_to IS NULL OR valid_to > {as_of_date_sql})
+    """
+
+def stock_as_of(con, as_of_date, product_ids=None, store_ids=None):
+    """Stock level of every product x store (optionally only the given ones) on as_of_date, as a DataFrame."""
+    filters, params = [], {'as_of_date': str(as_of_date)}
+    if product_ids is not None:
+        filters.append("list_contains($product_ids, product_id)")
+        params['product_ids'] = [str(product_id) for product_id in product_ids]
+    if store_ids is not None:
+        filters.append("list_contains($store_ids, store_id)")
+        params['store_ids'] = [str(store_id) for store_id in store_ids]
+    where = f"WHERE {' AND '.join(filters)}" if filters else ""
+    return con.execute(f"""
+    SELECT * FROM ({stock_as_of_sql('CAST($as_of_date AS DATE)')}) AS stock
+    {where}
+    ORDER BY product_id, store_id;
+    """, params).fetchdf()
+
+def stock_on_dates(con, lookups):
+    """
+    lookups is a DataFrame with product_id, store_id and as_of_date columns. Returns it with the
+    stock level on each row's date added (missing where nothing was recorded for that date).
+    """
+    con.register('_stock_lookups', lookups)
+    try:
+        return con.execute(f"""
+        SELECT l.*, CASE WHEN h.valid_to IS NULL OR h.valid_to > CAST(l.as_of_date AS DATE) THEN h.current_stock_level END AS current_stock_level
+        FROM _stock_lookups AS l
+        ASOF LEFT JOIN {INVENTORY_HISTORY_TABLE} AS h
+            ON l.product_id = h.product_id AND l.store_id = h.store_id AND CAST(l.as_of_date AS DATE) >= h.valid_from
+        ORDER BY l.product_id, l.store_id, l.as_of_date;
+        """).fetchdf()
+    finally:
+        con.unregister('_stock_lookups')
+
+def stockout_days(con, start_date, end_date):
+    """
+    Per product x store, the days from start_date to end_date (inclusive) on which the recorded stock
+    level was zero, and in how many separate periods. The current version is assumed to last to end_date.
+    """
+    return con.execute(f"""
+    WITH window_bounds AS (SELECT CAST($start_date AS DATE) AS start_date, CAST($end_date AS DATE) + 1 AS end_date)
+    SELECT
+        h.product_id,
+        h.store_id,
+        CAST(SUM(date_diff('day', GREATEST(h.valid_from, w.start_date), LEAST(COALESCE(h.valid_to, w.end_date), w.end_date))) AS BIGINT) AS stockout_days,
+        COUNT(*) AS stockout_periods
+    FROM {INVENTORY_HISTORY_TABLE} AS h, window_bounds AS w
+    WHERE h.current_stock_level <= 0
+      AND h.valid_from < w.end_date AND (h.valid_to IS NULL OR h.valid_to > w.start_date)
+    GROUP BY ALL
+    ORDER BY stockout_days DESC, h.product_id, h.store_id;
+    """, {'start_date': str(start_date), 'end_date': str(end_date)}).fetchdf()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the product x store inventory history.")
+    parser.add_argument('--as-of', metavar='DATE', help="Print stock levels on this date.")
+    parser.add_argument('--product-id', action='append', help="Only this product (repeatable).")
+    parser.add_argument('--store-id', action='append', help="Only this store (repeatable).")
+    parser.add_argument('--stockouts', nargs=2, metavar=('START', 'END'), help="Print stock-out days per product x store in this window.")
+    args = parser.parse_args()
+    if not args.as_of and not args.stockouts:
+        parser.error("Pass --as-of DATE and/or --stockouts START END.")
+
+    con = get_connection(read_only=True, db_path=DUCKDB_DB_PATH)
+    if args.as_of:
+        print(stock_as_of(con, args.as_of, args.product_id, args.store_id).to_string(index=False))
+    if args.stockouts:
+        print(stockout_days(con, *args.stockouts).to_string(index=False))
+    close_connection(DUCKDB_DB_PATH)
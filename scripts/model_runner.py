@@ -0,0 +1,281 @@
+# scripts/model_runner.py
+import re
+import time
+
+# Shared helpers for running SQL models entirely inside DuckDB.
+# A model is a plain dict: {'name': 'stg_sales', 'sql': "SELECT ..."}.
+# Each model declares how it is materialized with 'materialized' (default 'table'):
+#   'table'       - CREATE OR REPLACE TABLE ... AS, so the data never leaves the database
+#   'view'        - CREATE OR REPLACE VIEW; nothing is stored, readers run the SELECT. For pure projections.
+#   'incremental' - a table whose newest partitions are recomputed in place (see below)
+#   'ephemeral'   - nothing is created; the SELECT is inlined as a CTE into every model that references it
+#   'snapshot'    - an append-only SCD-2 history of the SELECT's rows (see below); never rebuilt
+#
+# Incremental models (similar to dbt's is_incremental()) also set:
+#   'incremental_key': 'sale_date',             # date column the model is partitioned by
+#   'change_sources': ['sales', 'supplier'],    # raw tables whose changes the model depends on
+# Whatever writes a raw table logs which partition dates it touched in ops.raw_table_changes
+# (see record_raw_changes; the loader does this for every merge, including corrections to old
+# rows). An incremental run deletes and re-inserts exactly the dates logged for its sources since
+# its last build, which ops.model_state records (for every stored model, not just incremental
+# ones). A change logged for a whole table, a model without change_sources or without a recorded
+# build, and --full-refresh all rebuild in full.
+#
+# Snapshot models (similar to dbt snapshots) keep one row per version of each key:
+#   'unique_key': ['product_id', 'store_id'],  # identifies a tracked entity
+#   'check_cols': ['current_stock_level'],     # a change in any of these starts a new version
+#   'snapshot_date': 'inventory_date',         # date the SELECT's rows were observed
+#   'invalidate_hard_deletes': True,           # close versions of keys missing from the SELECT
+# The target holds the key and checked columns plus valid_from and valid_to (exclusive; NULL
+# while current). Each run only appends versions for keys whose values changed, so a daily
+# snapshot costs storage in proportion to what changed, not to its size. --full-refresh
+# leaves snapshots alone: their history can't be rebuilt from the current source.
+MATERIALIZATIONS = ('table', 'view', 'incremental', 'ephemeral', 'snapshot')
+CHANGE_LOG_TABLE = 'ops.raw_table_changes'
+MODEL_STATE_TABLE = 'ops.model_state'
+
+def ensure_change_log(con):
+    con.execute("CREATE SCHEMA IF NOT EXISTS ops;")
+    con.execute("CREATE SEQUENCE IF NOT EXISTS ops.raw_table_change_ids;")
+    con.execute(f"""
+    CREATE TABLE IF NOT EXISTS {CHANGE_LOG_TABLE} (
+        change_id BIGINT DEFAULT nextval('ops.raw_table_change_ids'),
+        table_name VARCHAR,
+        partition_date DATE, -- NULL when the whole table may have changed
+        changed_at TIMESTAMP
+    );
+    """)
+    con.execute(f"""
+    CREATE TABLE IF NOT EXISTS {MODEL_STATE_TABLE} (
+        model VARCHAR PRIMARY KEY,
+        last_change_id BIGINT, -- Changes up to this id are reflected in the model
+        built_at TIMESTAMP
+    );
+    """)
+
+def record_raw_changes(con, table_name, dates_sql=None, params=None):
+    """
+    Logs a change to a raw table: on the dates returned by dates_sql (a one-column SELECT, run
+    with params), or to the whole table when dates_sql is None.
+    """
+    ensure_change_log(con)
+    if dates_sql is None:
+        con.execute(f"INSERT INTO {CHANGE_LOG_TABLE} (table_name, partition_date, changed_at) VALUES (?, NULL, current_localtimestamp());",
+                    [table_name])
+    else:
+        con.execute(f"""
+        INSERT INTO {CHANGE_LOG_TABLE} (table_name, partition_date, changed_at)
+        SELECT DISTINCT ?, CAST(changed_date AS DATE), current_localtimestamp()
+        FROM ({dates_sql}) AS changed(changed_date)
+        WHERE changed_date IS NOT NULL;
+        """, [table_name] + (params or []))
+
+def relation_type(con, target):
+    """'BASE TABLE' or 'VIEW' for an existing relation, None if there is none."""
+    schema, name = target.split('.')
+    row = con.execute(
+        "SELECT table_type FROM information_schema.tables WHERE table_schema = ? AND table_name = ?;",
+        [schema, name]
+    ).fetchone()
+    return row[0] if row else None
+
+def table_exists(con, target):
+    return relation_type(con, target) == 'BASE TABLE'
+
+def drop_relation(con, target, keep=None):
+    """Drops target unless it is already a relation of type keep (CREATE OR REPLACE can't change a table into a view)."""
+    existing = relation_type(con, target)
+    if existing == 'VIEW' and keep != 'VIEW':
+        con.execute(f"DROP VIEW {target};")
+    elif existing == 'BASE TABLE' and keep != 'BASE TABLE':
+        con.execute(f"DROP TABLE {target};")
+
+def inline_ephemeral(sql, ephemeral):
+    """
+    Replaces references to ephemeral models ({'schema.name': model}) with CTEs prepended to sql.
+    Ephemeral models may reference each other; their CTEs are ordered dependencies first.
+    """
+    ctes = {}
+
+    def resolve(sql):
+        for reference, model in ephemeral.items():
+            pattern = rf"\b{re.escape(reference)}\b"
+            if re.search(pattern, sql):
+                cte = f"ephemeral__{model['name']}"
+                if cte not in ctes:
+                    ctes[cte] = resolve(model['sql'])
+                sql = re.sub(pattern, cte, sql)
+        return sql
+
+    sql = resolve(sql)
+    if not ctes:
+        return sql
+    definitions = ",\n".join(f"{cte} AS ({body})" for cte, body in ctes.items())
+    existing_with = re.match(r"\s*WITH\s", sql, re.IGNORECASE)
+    if existing_with:
+        return f"WITH {definitions},\n{sql[existing_with.end():]}"
+    return f"WITH {definitions}\n{sql}"
+
+def changed_partitions(con, model, since_change_id):
+    """Dates changed in the model's change_sources after since_change_id, or None if they can't be narrowed down."""
+    if not model.get('change_sources'):
+        return None
+    rows = con.execute(
+        f"SELECT DISTINCT partition_date FROM {CHANGE_LOG_TABLE} WHERE change_id > ? AND list_contains(?, table_name);",
+        [since_change_id, model['change_sources']]
+    ).fetchall()
+    dates = sorted(row[0] for row in rows if row[0] is not None)
+    return None if len(dates) < len(rows) else dates # A NULL date means a whole table changed
+
+def run_incremental(con, target, model, since_change_id):
+    """Re-computes the partitions changed since since_change_id. Returns how many, or None to fall back to a full build."""
+    dates = changed_partitions(con, model, since_change_id)
+    if dates is None:
+        return None
+    if not dates:
+        return 0
+
+    key = model['incremental_key']
+    # The bounds let DuckDB skip row groups outside the changed range; the semi-join keeps exactly the changed dates
+    predicate = (f"{key} >= CAST(? AS DATE) AND {key} < CAST(? AS DATE) + INTERVAL 1 DAY "
+                 f"AND CAST({key} AS DATE) IN (SELECT partition_date FROM _changed_dates)")
+    bounds = [dates[0], dates[-1]]
+    con.execute("BEGIN TRANSACTION;")
+    try:
+        con.execute("CREATE OR REPLACE TEMP TABLE _changed_dates AS SELECT UNNEST(CAST(? AS DATE[])) AS partition_date;", [dates])
+        con.execute(f"DELETE FROM {target} WHERE {predicate};", bounds)
+        con.execute(f"INSERT INTO {target} BY NAME SELECT * FROM ({model['sql']}) AS model WHERE {predicate};", bounds)
+        con.execute("DROP TABLE _changed_dates;")
+        con.execute("COMMIT;")
+    except Exception:
+        con.execute("ROLLBACK;")
+        raise
+    return len(dates)
+
+def run_snapshot(con, target, model, sql):
+    """Merges the model's rows into its SCD-2 history table. Returns the mode string for the run."""
+    keys, checked = model['unique_key'], model['check_cols']
+    columns = ', '.join(keys + checked)
+    if not table_exists(con, target):
+        drop_relation(con, target)
+        con.execute(f"""
+        CREATE TABLE {target} AS
+        SELECT {columns}, CAST({model['snapshot_date']} AS DATE) AS valid_from, CAST(NULL AS DATE) AS valid_to
+        FROM ({sql}) AS model
+        ORDER BY valid_from;
+        """)
+        return 'snapshot created'
+
+    key_match = ' AND '.join(f"h.{key} = s.{key}" for key in keys)
+    changed = ' OR '.join(f"h.{column} IS DISTINCT FROM s.{column}" for column in checked)
+    con.execute("BEGIN TRANSACTION;")
+    try:
+        con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _snapshot AS
+        SELECT {columns}, CAST({model['snapshot_date']} AS DATE) AS snapshot_date FROM ({sql}) AS model;
+        """)
+        # A second observation on the same day corrects the current version instead of adding an empty one
+        corrected = con.execute(f"""
+        UPDATE {target} AS h SET {', '.join(f"{column} = s.{column}" for column in checked)}
+        FROM _snapshot AS s
+        WHERE h.valid_to IS NULL AND {key_match} AND s.snapshot_date = h.valid_from AND ({changed});
+        """).fetchone()[0]
+        closed = con.execute(f"""
+        UPDATE {target} AS h SET valid_to = s.snapshot_date
+        FROM _snapshot AS s
+        WHERE h.valid_to IS NULL AND {key_match} AND s.snapshot_date > h.valid_from AND ({changed});
+        """).fetchone()[0]
+        if model.get('invalidate_hard_deletes'):
+            closed += con.execute(f"""
+            UPDATE {target} AS h SET valid_to = (SELECT MAX(snapshot_date) FROM _snapshot)
+            WHERE h.valid_to IS NULL AND h.valid_from < (SELECT MAX(snapshot_date) FROM _snapshot)
+              AND NOT EXISTS (SELECT 1 FROM _snapshot AS s WHERE {key_match});
+            """).fetchone()[0]
+        # New keys and keys whose version was just closed; observations older than the history are ignored
+        inserted = con.execute(f"""
+        INSERT INTO {target}
+        SELECT {', '.join(f"s.{column}" for column in keys + checked)}, s.snapshot_date, NULL
+        FROM _snapshot AS s
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {target} AS h WHERE {key_match} AND (h.valid_to IS NULL OR h.valid_to > s.snapshot_date)
+        )
+        ORDER BY s.snapshot_date;
+        """).fetchone()[0]
+        con.execute("DROP TABLE _snapshot;")
+        con.execute("COMMIT;")
+    except Exception:
+        con.execute("ROLLBACK;")
+        raise
+    return f"snapshot: {inserted} new versions, {closed} closed, {corrected} corrected"
+
+def run_model(con, schema, model, full_refresh=False, ephemeral=None):
+    """
+    Materializes a single model as schema.name. Returns a dict with rows, seconds and the mode used;
+    rows is None for views and ephemeral models, which would have to be computed to be counted.
+    """
+    target = f"{schema}.{model['name']}"
+    materialized = model.get('materialized', 'table')
+    if materialized not in MATERIALIZATIONS:
+        raise ValueError(f"Unknown materialization '{materialized}' for {target}; expected one of {MATERIALIZATIONS}.")
+    sql = inline_ephemeral(model['sql'], ephemeral or {})
+    start = time.perf_counter()
+
+    if materialized == 'ephemeral':
+        drop_relation(con, target) # So nothing keeps reading a copy left by an earlier materialization
+        return {'model': target, 'rows': None, 'seconds': time.perf_counter() - start, 'mode': 'ephemeral'}
+    if materialized == 'view':
+        drop_relation(con, target, keep='VIEW')
+        con.execute(f"CREATE OR REPLACE VIEW {target} AS {sql}")
+        return {'model': target, 'rows': None, 'seconds': time.perf_counter() - start, 'mode': 'view'}
+
+    mode = 'table'
+    ensure_change_log(con)
+    latest_change_id = con.execute(f"SELECT COALESCE(MAX(change_id), 0) FROM {CHANGE_LOG_TABLE};").fetchone()[0]
+    if materialized == 'snapshot':
+        mode = run_snapshot(con, target, model, sql)
+    elif materialized == 'incremental':
+        built = con.execute(f"SELECT last_change_id FROM {MODEL_STATE_TABLE} WHERE model = ?;", [target]).fetchone()
+        if not full_refresh and built is not None and table_exists(con, target):
+            changed = run_incremental(con, target, {**model, 'sql': sql}, built[0])
+            if changed is not None:
+                mode = f"incremental, {changed} changed date(s)"
+
+    if mode == 'table':
+        drop_relation(con, target, keep='BASE TABLE')
+        con.execute(f"CREATE OR REPLACE TABLE {target} AS {sql}")
+    con.execute(f"INSERT OR REPLACE INTO {MODEL_STATE_TABLE} VALUES (?, ?, current_localtimestamp());", [target, latest_change_id])
+
+    row_count = con.execute(f"SELECT COUNT(*) FROM {target}").fetchone()[0]
+    elapsed = time.perf_counter() - start
+    return {'model': target, 'rows': row_count, 'seconds': elapsed, 'mode': mode}
+
+def ephemeral_models(layers):
+    """{'schema.name': model} for the ephemeral models of {schema: models}."""
+    return {f"{schema}.{model['name']}": model for schema, models in layers.items()
+            for model in models if model.get('materialized') == 'ephemeral'}
+
+def persisted_models(schema, models):
+    """schema.name of every model that exists in the database (all but ephemeral ones)."""
+    return [f"{schema}.{model['name']}" for model in models if model.get('materialized') != 'ephemeral']
+
+def run_models(con, schema, models, full_refresh=False, upstream=None):
+    """
+    Runs models in order and prints rows and time for each. Returns a list of result dicts.
+    upstream maps other schemas to their models, so ephemeral models there can be inlined here.
+    """
+    con.execute(f"CREATE SCHEMA IF NOT EXISTS {schema};")
+    print(f"{schema.capitalize()} schema ensured.")
+    ephemeral = ephemeral_models({**(upstream or {}), schema: models})
+
+    results = []
+    for model in models:
+        print(f"\nBuilding {schema}.{model['name']}...")
+        result = run_model(con, schema, model, full_refresh=full_refresh, ephemeral=ephemeral)
+        if result['mode'] == 'ephemeral':
+            print(f"{result['model']} is ephemeral; inlined into the models that use it.")
+        elif result['rows'] is None:
+            print(f"Created {result['model']} as a {result['mode']} in {result['seconds']:.2f}s.")
+        else:
+            print(f"Loaded {result['rows']} rows into {result['model']} ({result['mode']}) in {result['seconds']:.2f}s.")
+        results.append(result)
+    return results
@@ -0,0 +1,88 @@
+# scripts/model_store.py
+#
+# On-disk store of per-product forecast models under data/models. Each record holds the
+# fingerprint of the series it was fitted on, the fitted Prophet parameters (used to
+# warm-start the next fit) and the forecast it produced (reused as-is when the series has
+# not changed). Records are small JSON files written atomically; files are touched on every
+# cache hit, so age-based eviction removes models that are no longer used.
+import hashlib
+import json
+import os
+import re
+import time
+from datetime import datetime
+
+import numpy as np
+
+PROJECT_ROOT = os.path.join(os.path.dirname(__file__), '..')
+MODEL_STORE_DIR = os.path.join(PROJECT_ROOT, 'data', 'models')
+MODEL_STORE_VERSION = 1 # Bump when forecasting logic changes so old records are not reused
+DEFAULT_MAX_AGE_DAYS = 30
+DEFAULT_MAX_MODELS = None # No count limit unless configured
+
+def series_fingerprint(product_df, default_last_date, forecast_horizon_days):
+    """
+    Content hash of a daily series plus everything else that determines its forecast. A series'
+    forecast starts the day after its own last date, so the global default_last_date only counts
+    for an empty series; otherwise a new day of data elsewhere would invalidate every record.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"v{MODEL_STORE_VERSION}|{forecast_horizon_days}|".encode())
+    if len(product_df):
+        digest.update(f"{product_df.index[0]}|{product_df.index[-1]}|{len(product_df)}|".encode())
+    else:
+        digest.update(f"empty|{default_last_date}|".encode())
+    digest.update(np.ascontiguousarray(product_df.to_numpy(dtype='float64')).tobytes())
+    return digest.hexdigest()
+
+def prophet_params(model):
+    """Fitted Prophet parameters in the shape Prophet.fit(init=...) expects, as plain lists/floats."""
+    params = {name: float(np.mean(model.params[name])) for name in ('k', 'm', 'sigma_obs')}
+    for name in ('delta', 'beta'):
+        params[name] = np.mean(model.params[name], axis=0).tolist()
+    return params
+
+def stan_init(params):
+    """Stored parameters back in the form Prophet.fit(init=...) accepts (vector parameters as arrays)."""
+    return {name: np.asarray(value, dtype='float64') if isinstance(value, list) else value for name, value in params.items()}
+
+def model_path(product_id, store_dir=MODEL_STORE_DIR):
+    return os.path.join(store_dir, re.sub(r'[^A-Za-z0-9_.-]', '_', str(product_id)) + '.json')
+
+def load_model(product_id, store_dir=MODEL_STORE_DIR):
+    """Returns the stored record for a product, or None if there is none (or it is unreadable)."""
+    try:
+        with open(model_path(product_id, store_dir)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def save_model(record, store_dir=MODEL_STORE_DIR):
+    os.makedirs(store_dir, exist_ok=True)
+    path = model_path(record['product_id'], store_dir)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({**record, 'fitted_at': datetime.now().isoformat(timespec='seconds')}, f)
+    os.replace(tmp_path, path)
+
+def touch_model(product_id, store_dir=MODEL_STORE_DIR):
+    """Marks a record as used, so age-based eviction keeps it."""
+    try:
+        os.utime(model_path(product_id, store_dir))
+    except FileNotFoundError:
+        pass
+
+def evict_models(max_age_days=DEFAULT_MAX_AGE_DAYS, max_models=DEFAULT_MAX_MODELS, store_dir=MODEL_STORE_DIR):
+    """Deletes records unused for max_age_days, then the least recently used beyond max_models. Returns the count."""
+    if not os.path.isdir(store_dir):
+        return 0
+    paths = [os.path.join(store_dir, name) for name in os.listdir(store_dir) if name.endswith('.json')]
+    paths.sort(key=os.path.getmtime, reverse=True) # Most recently used first
+
+    cutoff = time.time() - max_age_days * 86400 if max_age_days is not None else None
+    evicted = 0
+    for rank, path in enumerate(paths):
+        if (cutoff is not None and os.path.getmtime(path) < cutoff) or (max_models is not None and rank >= max_models):
+            os.remove(path)
+            evicted += 1
+    return evicted
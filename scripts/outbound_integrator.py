@@ -1,73 +1,253 @@
 # scripts/outbound_integrator.py
-import duckdb
-import pandas as pd
 import os
+import json
+import argparse
 from datetime import datetime
 
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from db import DUCKDB_DB_PATH, get_connection, close_connection
+from duckdb_loader import file_sha256
+
 # Define paths relative to the project root
 PROJECT_ROOT = os.path.join(os.path.dirname(__file__), '..')
-DUCKDB_DB_PATH = os.path.join(PROJECT_ROOT, 'data', 'retail_data.duckdb') # The DuckDB database file
 OUTBOUND_DIR = os.path.join(PROJECT_ROOT, 'data', 'processed') # Directory for outbound files
 
 # Ensure the outbound directory exists
 os.makedirs(OUTBOUND_DIR, exist_ok=True)
 
-def export_data_for_customers():
-    print(f"Connecting to DuckDB database: {DUCKDB_DB_PATH}")
-    con = duckdb.connect(database=DUCKDB_DB_PATH)
+EXPORT_FORMATS = {'csv': '.csv', 'csv.gz': '.csv.gz', 'parquet': '.parquet', 'jsonl': '.jsonl'}
+EXPORT_MODES = ('full', 'delta')
+EXPORT_BATCH_ROWS = 100_000 # Rows pulled from DuckDB per Arrow record batch
 
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+QUERY_INVENTORY_SNAPSHOT = """
+SELECT
+    CAST(inventory_date AS DATE) AS inventory_date,
+    store_id,
+    product_id,
+    current_stock_level,
+    product_name,
+    category,
+    brand,
+    cost_price,
+    supplier_name,
+    lead_time_days
+FROM marts.agg_daily_inventory_summary
+WHERE inventory_date = (SELECT MAX(inventory_date) FROM marts.agg_daily_inventory_summary) -- Get the latest summary
+"""
 
-    # --- Export Inventory Summary ---
-    print("\nExporting Inventory Summary for customer ERP...")
-    query_inventory_summary = """
-    SELECT
-        inventory_date,
-        store_id,
-        product_id,
-        current_stock_level,
-        product_name,
-        category,
-        brand,
-        cost_price,
-        supplier_name,
-        lead_time_days
-    FROM marts.agg_daily_inventory_summary
-    WHERE inventory_date = (SELECT MAX(inventory_date) FROM marts.agg_daily_inventory_summary); -- Get the latest summary
+QUERY_PRICING_RECOMMENDATIONS = """
+SELECT
+    product_id,
+    product_name,
+    current_price_reference,
+    recommended_price,
+    pricing_reason,
+    recommendation_date
+FROM recommendations.product_pricing_recommendations
+WHERE recommendation_date = (SELECT MAX(recommendation_date) FROM recommendations.product_pricing_recommendations) -- Get the latest recommendations
+"""
+
+# Business key of each export, and columns left out of the change hash (the snapshot date
+# moves every day, so it would otherwise mark every row as updated).
+EXPORT_KEYS = {
+    'inventory_snapshot': {'keys': ['store_id', 'product_id'], 'ignore': ['inventory_date']},
+    'pricing_recommendations': {'keys': ['product_id'], 'ignore': ['recommendation_date']},
+}
+
+def open_part_writer(path, fmt, schema):
+    """Returns (write_batch, bytes_written, close) for one output file of the given format."""
+    if fmt == 'parquet':
+        sink = pa.OSFile(path, 'wb')
+        writer = pq.ParquetWriter(sink, schema, compression='zstd')
+        def close():
+            writer.close()
+            sink.close()
+        return writer.write_batch, sink.tell, close
+
+    if fmt == 'jsonl':
+        f = open(path, 'w', encoding='utf-8')
+        def write_batch(batch):
+            for row in batch.to_pylist():
+                f.write(json.dumps(row, default=str) + '\n')
+        return write_batch, f.tell, f.close
+
+    sink = pa.OSFile(path, 'wb')
+    stream = pa.CompressedOutputStream(sink, 'gzip') if fmt == 'csv.gz' else sink
+    writer = pa_csv.CSVWriter(stream, schema)
+    def close():
+        writer.close()
+        if stream is not sink:
+            stream.close()
+        sink.close()
+    return writer.write_batch, sink.tell, close # Compressed size, so splits follow the bytes on disk
+
+def export_query(con, query, base_name, timestamp, fmt='csv', max_rows=None, max_bytes=None, params=None, manifest_extra=None):
+    """
+    Streams a query result to OUTBOUND_DIR as Arrow record batches, so only one batch is in
+    memory at a time. Output is split into parts once a file reaches max_rows rows or about
+    max_bytes bytes. Every part is written to a temp file and renamed into place when
+    complete. A manifest with per-file row counts and sha256 checksums is written last, so
+    a receiving system can treat its presence as "export complete".
+    Returns the manifest, or None when the query returned no rows.
     """
-    inventory_summary_df = con.execute(query_inventory_summary).fetchdf()
+    extension = EXPORT_FORMATS[fmt]
+    split = bool(max_rows or max_bytes)
+    reader = con.execute(query, params).fetch_record_batch(min(max_rows or EXPORT_BATCH_ROWS, EXPORT_BATCH_ROWS))
 
-    if not inventory_summary_df.empty:
-        output_filepath = os.path.join(OUTBOUND_DIR, f"inventory_snapshot_{timestamp}.csv")
-        inventory_summary_df.to_csv(output_filepath, index=False)
-        print(f"Successfully exported {len(inventory_summary_df)} rows to {output_filepath}")
-    else:
-        print("No inventory summary data found to export.")
+    files = []
+    part = None # (final_path, tmp_path, write_batch, bytes_written, close, rows)
 
-    # --- Export Pricing Recommendations ---
-    print("\nExporting Pricing Recommendations for customer's e-commerce system...")
-    query_pricing_recommendations = """
-    SELECT
-        product_id,
-        product_name,
-        current_price_reference,
-        recommended_price,
-        pricing_reason,
-        recommendation_date
-    FROM recommendations.product_pricing_recommendations
-    WHERE recommendation_date = (SELECT MAX(recommendation_date) FROM recommendations.product_pricing_recommendations); -- Get the latest recommendations
+    def finish_part():
+        final_path, tmp_path, _, _, close, rows = part
+        close()
+        os.replace(tmp_path, final_path)
+        files.append({
+            'file': os.path.basename(final_path),
+            'rows': rows,
+            'bytes': os.path.getsize(final_path),
+            'sha256': file_sha256(final_path),
+        })
+
+    for batch in reader:
+        while batch.num_rows:
+            if part is None:
+                suffix = f"_part{len(files):04d}" if split else ""
+                final_path = os.path.join(OUTBOUND_DIR, f"{base_name}_{timestamp}{suffix}{extension}")
+                tmp_path = f"{final_path}.tmp"
+                part = [final_path, tmp_path, *open_part_writer(tmp_path, fmt, reader.schema), 0]
+            take = batch.num_rows if not max_rows else min(batch.num_rows, max_rows - part[5])
+            part[2](batch.slice(0, take))
+            part[5] += take
+            batch = batch.slice(take)
+            if (max_rows and part[5] >= max_rows) or (max_bytes and part[3]() >= max_bytes):
+                finish_part()
+                part = None
+    if part is not None:
+        finish_part()
+
+    if not files:
+        return None
+
+    manifest = {
+        'export': base_name,
+        'format': fmt,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'total_rows': sum(f['rows'] for f in files),
+        **(manifest_extra or {}),
+        'files': files,
+    }
+    manifest_path = os.path.join(OUTBOUND_DIR, f"{base_name}_{timestamp}.manifest.json")
+    with open(f"{manifest_path}.tmp", 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+    return manifest
+
+def state_table(export_name):
+    return f"ops.outbound_state_{export_name}"
+
+def stage_current_rows(con, query, export_name):
+    """
+    Materializes the export query in a temp table with a hash of each row's non-key payload,
+    so the delta and the new state are computed from the same snapshot.
+    """
+    spec = EXPORT_KEYS[export_name]
+    columns = [column[0] for column in con.execute(f"SELECT * FROM ({query}) LIMIT 0").description]
+    hashed = [c for c in columns if c not in spec['keys'] and c not in spec['ignore']]
+    current = f"_outbound_current_{export_name}"
+    con.execute(f"CREATE OR REPLACE TEMP TABLE {current} AS SELECT *, hash({', '.join(hashed)}) AS _row_hash FROM ({query});")
+    return current
+
+def delta_query(export_name, current):
+    """Inserted, updated and deleted rows against the last exported state, tagged with an op column (I/U/D)."""
+    keys = ', '.join(EXPORT_KEYS[export_name]['keys'])
+    state = state_table(export_name)
+    return f"""
+    SELECT 'I' AS op, c.* EXCLUDE (_row_hash) FROM {current} AS c ANTI JOIN {state} AS s USING ({keys})
+    UNION ALL BY NAME
+    SELECT 'U' AS op, c.* EXCLUDE (_row_hash) FROM {current} AS c JOIN {state} AS s USING ({keys}) WHERE c._row_hash <> s.row_hash
+    UNION ALL BY NAME
+    SELECT 'D' AS op, s.* EXCLUDE (row_hash, exported_at) FROM {state} AS s ANTI JOIN {current} AS c USING ({keys})
+    ORDER BY {keys}
     """
-    pricing_recommendations_df = con.execute(query_pricing_recommendations).fetchdf()
 
-    if not pricing_recommendations_df.empty:
-        output_filepath = os.path.join(OUTBOUND_DIR, f"pricing_recommendations_{timestamp}.csv")
-        pricing_recommendations_df.to_csv(output_filepath, index=False)
-        print(f"Successfully exported {len(pricing_recommendations_df)} rows to {output_filepath}")
+def save_export_state(con, export_name, current):
+    """Replaces the stored per-key hashes with the snapshot that was just shipped."""
+    keys = ', '.join(EXPORT_KEYS[export_name]['keys'])
+    con.execute(f"""
+    CREATE OR REPLACE TABLE {state_table(export_name)} AS
+    SELECT {keys}, _row_hash AS row_hash, current_localtimestamp() AS exported_at FROM {current};
+    """)
+
+def run_export(con, export_name, query, timestamp, fmt='csv', max_rows=None, max_bytes=None, mode='full'):
+    """
+    Full mode ships the whole snapshot; delta mode ships only rows that changed since the
+    last export of either mode. Both record the shipped snapshot as the new baseline.
+    """
+    current = stage_current_rows(con, query, export_name)
+    con.execute("CREATE SCHEMA IF NOT EXISTS ops;")
+    keys = ', '.join(EXPORT_KEYS[export_name]['keys'])
+    con.execute(f"""
+    CREATE TABLE IF NOT EXISTS {state_table(export_name)} AS
+    SELECT {keys}, _row_hash AS row_hash, current_localtimestamp() AS exported_at FROM {current} WHERE false;
+    """)
+
+    if mode == 'delta':
+        delta = delta_query(export_name, current)
+        op_counts = dict(con.execute(f"SELECT op, COUNT(*) FROM ({delta}) GROUP BY op;").fetchall())
+        manifest = export_query(con, delta, f"{export_name}_delta", timestamp, fmt, max_rows, max_bytes,
+                                manifest_extra={'mode': 'delta', 'op_counts': op_counts})
     else:
-        print("No pricing recommendations data found to export.")
+        manifest = export_query(con, f"SELECT * EXCLUDE (_row_hash) FROM {current}", export_name, timestamp,
+                                fmt, max_rows, max_bytes, manifest_extra={'mode': 'full'})
+
+    if manifest is not None or mode == 'full':
+        save_export_state(con, export_name, current)
+    con.execute(f"DROP TABLE {current};")
+    return manifest
+
+def report_export(manifest, empty_message):
+    if manifest is None:
+        print(empty_message)
+        return
+    file_names = ", ".join(f['file'] for f in manifest['files'])
+    print(f"Successfully exported {manifest['total_rows']} rows to {OUTBOUND_DIR}: {file_names}")
+    if 'op_counts' in manifest:
+        print("Changes: " + ", ".join(f"{op}={count}" for op, count in sorted(manifest['op_counts'].items())))
+
+def export_inventory_snapshot(con, timestamp, fmt='csv', max_rows=None, max_bytes=None, mode='full'):
+    # --- Export Inventory Summary ---
+    print(f"\nExporting Inventory Summary ({mode}) for customer ERP...")
+    manifest = run_export(con, 'inventory_snapshot', QUERY_INVENTORY_SNAPSHOT, timestamp, fmt, max_rows, max_bytes, mode)
+    report_export(manifest, "No inventory changes to export." if mode == 'delta' else "No inventory summary data found to export.")
+    return manifest
+
+def export_pricing_recommendations(con, timestamp, fmt='csv', max_rows=None, max_bytes=None, mode='full'):
+    # --- Export Pricing Recommendations ---
+    print(f"\nExporting Pricing Recommendations ({mode}) for customer's e-commerce system...")
+    manifest = run_export(con, 'pricing_recommendations', QUERY_PRICING_RECOMMENDATIONS, timestamp, fmt, max_rows, max_bytes, mode)
+    report_export(manifest, "No pricing changes to export." if mode == 'delta' else "No pricing recommendations data found to export.")
+    return manifest
+
+def export_data_for_customers(fmt='csv', max_rows=None, max_bytes=None, mode='full'):
+    print(f"Connecting to DuckDB database: {DUCKDB_DB_PATH}")
+    con = get_connection()
+
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    export_inventory_snapshot(con, timestamp, fmt, max_rows, max_bytes, mode)
+    export_pricing_recommendations(con, timestamp, fmt, max_rows, max_bytes, mode)
 
-    con.close()
+    close_connection()
     print("\nOutbound data integration complete. DuckDB connection closed.")
 
 if __name__ == "__main__":
-    export_data_for_customers()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Export inventory and pricing data for customer systems.")
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv', help="Output file format.")
+    parser.add_argument('--max-rows', type=int, help="Start a new part file after this many rows.")
+    parser.add_argument('--max-bytes', type=int, help="Start a new part file once a file reaches about this many bytes.")
+    parser.add_argument('--mode', choices=EXPORT_MODES, default='full',
+                        help="'full' ships the whole snapshot; 'delta' ships only rows inserted (I), updated (U) or deleted (D) since the last export.")
+    args = parser.parse_args()
+    export_data_for_customers(fmt=args.format, max_rows=args.max_rows, max_bytes=args.max_bytes, mode=args.mode)
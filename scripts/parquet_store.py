@@ -0,0 +1,126 @@
+# scripts/parquet_store.py
+#
+# Columnar Parquet tier for the raw ingests and the large marts. Tables are written as
+# Hive-partitioned Parquet (month=YYYY-MM/store_id=.../*.parquet), sorted by date inside each
+# partition and zstd-compressed. DuckDB stores min/max statistics per row group, so readers
+# get partition pruning from the directory layout and predicate pushdown from the statistics:
+#
+#   SELECT ... FROM parquet_marts.fct_sales WHERE month = '2024-03' AND store_id = 'STORE01'
+#
+# only opens that one partition's files instead of scanning everything.
+import os
+import re
+import uuid
+import shutil
+from datetime import datetime
+
+PROJECT_ROOT = os.path.join(os.path.dirname(__file__), '..')
+PARQUET_DIR = os.path.join(PROJECT_ROOT, 'data', 'parquet')
+PARQUET_COMPRESSION = 'zstd'
+PARQUET_ROW_GROUP_SIZE = 122_880 # DuckDB's default row group size; one min/max statistic per group
+CURRENT_POINTER = 'CURRENT' # Names the table's published generation directory
+GENERATION_PATTERN = re.compile(r'^gen_\d{20}-[0-9a-f]{8}$') # Names sort by write time
+KEEP_GENERATIONS = 2 # The current generation plus the one readers may still be scanning
+
+# Which tables each layer persists. date_column drives the month partition and the sort
+# order; small dimension tables are written as a single unpartitioned file.
+LAYER_SCHEMAS = {'raw': 'main', 'marts': 'marts'}
+PARQUET_TABLES = {
+    'raw': {
+        'sales': {'date_column': 'sale_date', 'partition_by': ['month', 'store_id']},
+        'inventory': {'date_column': 'last_updated', 'partition_by': ['month', 'store_id']},
+        'product_catalog': {},
+        'supplier': {},
+    },
+    'marts': {
+        'fct_sales': {'date_column': 'sale_date', 'partition_by': ['month', 'store_id']},
+        'agg_daily_inventory_summary': {'date_column': 'inventory_date', 'partition_by': ['month', 'store_id']},
+    },
+}
+
+def table_dir(layer, table_name, parquet_dir=PARQUET_DIR):
+    return os.path.join(parquet_dir, layer, table_name)
+
+def current_generation_dir(layer, table_name, parquet_dir=PARQUET_DIR):
+    """Directory of the table's published generation, or None if it has never been exported."""
+    try:
+        with open(os.path.join(table_dir(layer, table_name, parquet_dir), CURRENT_POINTER)) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(table_dir(layer, table_name, parquet_dir), name) if name else None
+
+def parquet_source(layer, table_name, parquet_dir=PARQUET_DIR):
+    """read_parquet(...) expression for the published generation of a table, with partition columns typed as VARCHAR."""
+    path = os.path.abspath(current_generation_dir(layer, table_name, parquet_dir)).replace("'", "''")
+    if PARQUET_TABLES[layer][table_name].get('partition_by'):
+        return (f"read_parquet('{path}/**/*.parquet', hive_partitioning = true, "
+                "hive_types = {'month': VARCHAR, 'store_id': VARCHAR})")
+    return f"read_parquet('{path}/*.parquet')"
+
+def export_table(con, layer, table_name, parquet_dir=PARQUET_DIR):
+    """
+    Writes one table as a new generation directory and then atomically points the table's
+    CURRENT file at it, so readers see either the previous or the new copy, never a half-written
+    or missing one. The views from create_views() read the generation named at creation time.
+    """
+    spec = PARQUET_TABLES[layer][table_name]
+    source = f"{LAYER_SCHEMAS[layer]}.{table_name}"
+    target = table_dir(layer, table_name, parquet_dir)
+    generation = f"gen_{datetime.now().strftime('%Y%m%d%H%M%S%f')}-{uuid.uuid4().hex[:8]}"
+    generation_dir = os.path.join(target, generation)
+    os.makedirs(target, exist_ok=True)
+
+    options = f"FORMAT parquet, COMPRESSION {PARQUET_COMPRESSION}, ROW_GROUP_SIZE {PARQUET_ROW_GROUP_SIZE}"
+    try:
+        if spec.get('partition_by'):
+            date_column = spec['date_column']
+            # The date column may arrive as VARCHAR (e.g. from Parquet drops); strftime needs a DATE
+            con.execute(f"""
+            COPY (
+                SELECT *, strftime(CAST({date_column} AS DATE), '%Y-%m') AS month
+                FROM {source}
+                ORDER BY {date_column}
+            ) TO ? ({options}, PARTITION_BY ({', '.join(spec['partition_by'])}));
+            """, [generation_dir])
+        else:
+            os.makedirs(generation_dir)
+            con.execute(f"COPY {source} TO ? ({options});", [os.path.join(generation_dir, 'data.parquet')])
+    except Exception:
+        shutil.rmtree(generation_dir, ignore_errors=True)
+        raise
+
+    pointer_path = os.path.join(target, CURRENT_POINTER)
+    tmp_pointer = f"{pointer_path}.{generation}.tmp"
+    with open(tmp_pointer, 'w') as f:
+        f.write(generation)
+    os.replace(tmp_pointer, pointer_path)
+    prune_generations(target, generation)
+
+def prune_generations(target, current):
+    """Removes everything under target but CURRENT and the newest KEEP_GENERATIONS generations (including current)."""
+    generations = sorted((name for name in os.listdir(target) if GENERATION_PATTERN.match(name)), reverse=True)
+    keep = set(generations[:KEEP_GENERATIONS]) | {current, CURRENT_POINTER}
+    for name in os.listdir(target):
+        if name in keep:
+            continue
+        path = os.path.join(target, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True) # Also clears files from the pre-generation layout
+        else:
+            os.remove(path)
+
+def create_views(con, layer, parquet_dir=PARQUET_DIR):
+    """(Re)creates parquet_<layer>.<table> views over the stored files for downstream readers."""
+    con.execute(f"CREATE SCHEMA IF NOT EXISTS parquet_{layer};")
+    for table_name in PARQUET_TABLES[layer]:
+        con.execute(f"CREATE OR REPLACE VIEW parquet_{layer}.{table_name} AS SELECT * FROM {parquet_source(layer, table_name, parquet_dir)};")
+
+def export_layer(con, layer, parquet_dir=PARQUET_DIR):
+    """Persists every table of a layer ('raw' or 'marts') as Parquet and refreshes its views."""
+    for table_name in PARQUET_TABLES[layer]:
+        export_table(con, layer, table_name, parquet_dir)
+        generation_dir = current_generation_dir(layer, table_name, parquet_dir)
+        files = sum(len(names) for _, _, names in os.walk(generation_dir))
+        print(f"Wrote {LAYER_SCHEMAS[layer]}.{table_name} to {generation_dir} ({files} file(s)).")
+    create_views(con, layer, parquet_dir)
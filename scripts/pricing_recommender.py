@@ -1,97 +1,154 @@
 # scripts/pricing_recommender.py
-import duckdb
-import pandas as pd
 import os
-from datetime import datetime, timedelta # datetime is used for CURRENT_DATE() equivalent
+import json
+import argparse
+from datetime import datetime
+
+from data_version import bump_data_version
+from db import DUCKDB_DB_PATH, get_connection, close_connection
+from inventory_history import stock_as_of_sql
 
 # Define paths relative to the project root
 PROJECT_ROOT = os.path.join(os.path.dirname(__file__), '..')
-DUCKDB_DB_PATH = os.path.join(PROJECT_ROOT, 'data', 'retail_data.duckdb')
+PRICING_RULES_PATH = os.path.join(PROJECT_ROOT, 'config', 'pricing_rules.json')
+
+# Columns a rule may reference as its price base
+PRICE_BASES = ('current_price_reference', 'cost_price')
+
+# Fetch necessary data from marts and forecasts. Stock and demand are both taken relative to $recommendation_date.
+QUERY_PRICING_DATA = f"""
+SELECT
+    dp.product_id,
+    dp.product_name,
+    dp.category,
+    dp.cost_price,
+    COALESCE(inv.current_stock_level, 0) AS current_stock_level,
+    COALESCE(fd.predicted_quantity, 0) AS predicted_demand_tomorrow,
+    -- Average historical price for reference, from the precomputed price stats mart
+    ps.avg_price AS historical_avg_price
+FROM marts.dim_products AS dp
+LEFT JOIN marts.agg_product_price_stats AS ps
+    ON dp.product_id = ps.product_id
+LEFT JOIN (
+    -- Chain-wide stock as of the recommendation date: the latest level recorded on or before it per store
+    SELECT product_id, SUM(current_stock_level) AS current_stock_level
+    FROM ({stock_as_of_sql('CAST($recommendation_date AS DATE)')}) AS stock
+    GROUP BY product_id
+) AS inv
+    ON dp.product_id = inv.product_id
+LEFT JOIN forecasts.product_demand_forecasts AS fd
+    ON dp.product_id = fd.product_id
+    AND fd.forecast_date = strftime(CAST($recommendation_date AS DATE) + 1, '%Y-%m-%d') -- Demand for the next day
+"""
+
+def load_pricing_rules(path=PRICING_RULES_PATH):
+    """Loads the pricing rules config and returns it with rules sorted by priority (lowest first)."""
+    with open(path) as f:
+        config = json.load(f)
+    for rule in config['rules']:
+        if rule['base'] not in PRICE_BASES:
+            raise ValueError(f"Pricing rule '{rule['name']}' has unknown base '{rule['base']}'. Expected one of {PRICE_BASES}.")
+    config['rules'] = sorted(config['rules'], key=lambda rule: rule['priority'])
+    return config
+
+def sql_string(value):
+    return "'" + value.replace("'", "''") + "'"
+
+def sql_round_cents(expression):
+    # printf rounds the exact binary value like Python's round(x, 2); ROUND() rounds ties away from zero
+    return f"CAST(printf('%.2f', {expression}) AS DOUBLE)"
+
+def compile_pricing_sql(config):
+    """
+    Compiles the rules into one set-based query: the first matching rule (by priority)
+    sets the price and reason via CASE, then the minimum margin is applied with GREATEST.
+    Equivalent to evaluating the rules row by row as an if/elif chain.
+    """
+    price_cases = "\n".join(
+        f"            WHEN {rule['condition']} THEN {rule['base']} * {float(rule['multiplier'])!r}"
+        for rule in config['rules']
+    )
+    reason_cases = "\n".join(
+        f"            WHEN {rule['condition']} THEN {sql_string(rule['reason'])}"
+        for rule in config['rules']
+    )
+    return f"""
+    WITH pricing_data AS ({QUERY_PRICING_DATA}),
+    referenced AS (
+        SELECT
+            *,
+            -- Use historical average price as a starting point, otherwise apply a default markup on cost
+            COALESCE(historical_avg_price, cost_price * {float(config['default_markup'])!r}) AS current_price_reference
+        FROM pricing_data
+    ),
+    ruled AS (
+        SELECT
+            *,
+            CASE
+{price_cases}
+            ELSE current_price_reference
+            END AS rule_price,
+            CASE
+{reason_cases}
+            ELSE {sql_string(config['default_reason'])}
+            END AS pricing_reason
+        FROM referenced
+    )
+    SELECT
+        product_id,
+        product_name,
+        {sql_round_cents('current_price_reference')} AS current_price_reference,
+        -- Ensure price doesn't go below a certain margin (e.g., 10% above cost)
+        {sql_round_cents(f"GREATEST(rule_price, cost_price * {float(config['minimum_margin'])!r})")} AS recommended_price,
+        pricing_reason,
+        CAST($recommendation_date AS VARCHAR) AS recommendation_date
+    FROM ruled
+    """
 
-def generate_pricing_recommendations():
-    print(f"Connecting to DuckDB database: {DUCKDB_DB_PATH}")
-    con = duckdb.connect(database=DUCKDB_DB_PATH)
+def generate_pricing_recommendations(rules_path=PRICING_RULES_PATH, con=None, recommendation_date=None):
+    owns_connection = con is None
+    if owns_connection:
+        print(f"Connecting to DuckDB database: {DUCKDB_DB_PATH}")
+        con = get_connection()
 
     # Create a schema for recommendations if it doesn't exist
     con.execute("CREATE SCHEMA IF NOT EXISTS recommendations;")
     print("Recommendations schema ensured.")
 
-    # Fetch necessary data from marts and forecasts
-    print("\nFetching data for pricing recommendations...")
-    query_pricing_data = """
-    SELECT
-        dp.product_id,
-        dp.product_name,
-        dp.category,
-        dp.cost_price,
-        COALESCE(inv.current_stock_level, 0) AS current_stock_level,
-        COALESCE(fd.predicted_quantity, 0) AS predicted_demand_tomorrow,
-        -- Get average historical price from fact sales for reference
-        (SELECT AVG(price_per_unit) FROM marts.fct_sales fs WHERE fs.product_id = dp.product_id) AS historical_avg_price
-    FROM marts.dim_products AS dp
-    LEFT JOIN marts.agg_daily_inventory_summary AS inv
-        ON dp.product_id = inv.product_id AND inv.inventory_date = CURRENT_DATE() -- Assuming we need today's stock
-    LEFT JOIN forecasts.product_demand_forecasts AS fd
-        ON dp.product_id = fd.product_id AND fd.forecast_date = CURRENT_DATE() + INTERVAL '1 day' -- Demand for tomorrow
-    ;
-    """
-    pricing_data_df = con.execute(query_pricing_data).fetchdf()
+    config = load_pricing_rules(rules_path)
+    print(f"\nLoaded {len(config['rules'])} pricing rules from {rules_path}.")
 
-    if pricing_data_df.empty:
-        print("No data found for pricing recommendations. Cannot proceed.")
-        con.close()
-        return
-
-    print(f"Generating pricing recommendations for {len(pricing_data_df)} products...")
-    recommendations = []
-
-    # Simple Rule-Based Pricing Logic (can be expanded with more complex ML)
-    for _, row in pricing_data_df.iterrows():
-        product_id = row['product_id']
-        # Use historical average price as a starting point, otherwise apply a default markup on cost
-        current_price_reference = row['historical_avg_price'] if pd.notnull(row['historical_avg_price']) else (row['cost_price'] * 1.5)
-        recommended_price = current_price_reference
-        reason = []
-
-        # Rule 1: High Inventory & Low Predicted Demand -> Discount
-        if row['current_stock_level'] > 50 and row['predicted_demand_tomorrow'] < 10:
-            recommended_price *= 0.90  # 10% discount
-            reason.append("High stock, low predicted demand (10% discount)")
-
-        # Rule 2: Low Inventory & High Predicted Demand -> Premium
-        elif row['current_stock_level'] < 10 and row['predicted_demand_tomorrow'] > 30:
-            recommended_price *= 1.15  # 15% premium
-            reason.append("Low stock, high predicted demand (15% premium)")
-
-        # Rule 3: High Cost Product with no recent sales -> Adjust initial markup
-        elif pd.isna(row['historical_avg_price']) and row['cost_price'] > 1000:
-            recommended_price = row['cost_price'] * 1.8 # Higher markup for high-cost, unselling items
-            reason.append("High cost product, no historical sales (higher default markup)")
-
-        # Ensure price doesn't go below a certain margin (e.g., 10% above cost)
-        recommended_price = max(recommended_price, row['cost_price'] * 1.10) # Minimum 10% margin
-
-        recommendations.append({
-            'product_id': product_id,
-            'product_name': row['product_name'],
-            'current_price_reference': round(current_price_reference, 2),
-            'recommended_price': round(recommended_price, 2),
-            'pricing_reason': "; ".join(reason) if reason else "Standard pricing based on cost/historical average",
-            'recommendation_date': datetime.now().strftime('%Y-%m-%d') # <<< THIS IS THE CRUCIAL LINE ADDED
-        })
-
-    pricing_recommendations_df = pd.DataFrame(recommendations)
+    recommendation_date = recommendation_date or datetime.now().strftime('%Y-%m-%d')
+
+    # Rule-based pricing evaluated in one pass inside DuckDB (can be expanded with more complex ML)
+    print(f"Generating pricing recommendations as of {recommendation_date}...")
+    con.execute("BEGIN TRANSACTION;")
+    try:
+        con.execute(
+            f"CREATE OR REPLACE TABLE recommendations.product_pricing_recommendations AS {compile_pricing_sql(config)};",
+            {'recommendation_date': recommendation_date}
+        )
+        row_count = con.execute("SELECT COUNT(*) FROM recommendations.product_pricing_recommendations").fetchone()[0]
+    except Exception:
+        con.execute("ROLLBACK;")
+        raise
 
     # Store recommendations in DuckDB
-    if not pricing_recommendations_df.empty:
-        con.execute("DROP TABLE IF EXISTS recommendations.product_pricing_recommendations;")
-        con.execute("CREATE TABLE recommendations.product_pricing_recommendations AS SELECT * FROM pricing_recommendations_df;")
-        print(f"\nLoaded {len(pricing_recommendations_df)} pricing recommendations into recommendations.product_pricing_recommendations.")
+    if row_count:
+        con.execute("COMMIT;")
+        bump_data_version() # Only a committed table is new data for readers
+        print(f"\nLoaded {row_count} pricing recommendations into recommendations.product_pricing_recommendations.")
     else:
-        print("\nNo pricing recommendations generated to load into DuckDB.")
+        con.execute("ROLLBACK;")
+        print("No data found for pricing recommendations. Cannot proceed.")
 
-    con.close()
-    print("\nDynamic pricing recommendation complete. DuckDB connection closed.")
+    if owns_connection:
+        close_connection()
+    print("\nDynamic pricing recommendation complete.")
 
 if __name__ == "__main__":
-    generate_pricing_recommendations()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate rule-based pricing recommendations.")
+    parser.add_argument('--rules', default=PRICING_RULES_PATH, help="Path to the pricing rules JSON config.")
+    parser.add_argument('--date', help="Recommendation date (YYYY-MM-DD); defaults to today.")
+    args = parser.parse_args()
+    generate_pricing_recommendations(rules_path=args.rules, recommendation_date=args.date)
@@ -0,0 +1,76 @@
+# scripts/query_cache.py
+import threading
+import time
+from collections import OrderedDict
+
+from data_version import read_data_version
+
+class QueryCache:
+    """
+    Thread-safe query-result cache for the dashboard.
+
+    Entries are keyed by (sql, params, data version), so a pipeline run that bumps the data
+    version makes every older entry unreachable. A TTL bounds staleness for anything the
+    version token doesn't cover, and an LRU cap bounds memory. Cached DataFrames are shared
+    between sessions, so callers must treat them as read-only.
+    """
+
+    def __init__(self, max_entries=256, ttl_seconds=600, version_reader=read_data_version):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.version_reader = version_reader
+        self._entries = OrderedDict() # key -> (stored_at, result)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, kind, sql, params):
+        return (kind, sql, tuple(params) if params else (), self.version_reader())
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, result = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key) # Mark as most recently used
+            self.hits += 1
+            return entry
+
+    def _put(self, key, result):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), result)
+            self._entries.move_to_end(key)
+            # Entries from older data versions are never hit again, so LRU evicts them first
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _cached(self, kind, con, sql, params, run):
+        key = self._key(kind, sql, params)
+        entry = self._get(key)
+        if entry is not None:
+            return entry[1]
+        result = run(con.execute(sql, params) if params else con.execute(sql))
+        self._put(key, result)
+        return result
+
+    def fetchdf(self, con, sql, params=None):
+        """Returns the query result as a DataFrame, running it only on a cache miss."""
+        return self._cached('df', con, sql, params, lambda cursor: cursor.fetchdf())
+
+    def fetchone(self, con, sql, params=None):
+        """Returns the first row of the query result, running it only on a cache miss."""
+        return self._cached('one', con, sql, params, lambda cursor: cursor.fetchone())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,398 @@
+# scripts/run_pipeline.py
+#
+# Runs the whole pipeline in one process over one DuckDB connection:
+#   load_raw -> staging -> intermediate -> marts -> forecasts -> pricing -> export_pricing
+#                                              \-> export_inventory
+# Steps are a DAG; a step starts as soon as everything it depends on has finished, so
+# independent steps (e.g. the inventory export and forecasting) run concurrently, each on
+# its own cursor. A step is skipped when the fingerprint of its inputs (upstream tables, raw
+# files and its own code/config) matches the last successful run and its outputs are still
+# the ones that run produced. Table fingerprints come from the change log and build state
+# rather than from scanning the tables (see table_fingerprint). Step state lives in
+# ops.pipeline_step_state.
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+
+from db import DUCKDB_DB_PATH, get_connection, close_connection
+from data_version import bump_data_version
+from instrumentation import DEFAULT_PROFILE_MIN_SECONDS, PipelineRecorder, table_rows
+from duckdb_loader import TABLE_KEYS, file_sha256, raw_files, load_csv_to_duckdb
+from model_runner import CHANGE_LOG_TABLE, MODEL_STATE_TABLE, persisted_models
+from transform_staging import STAGING_MODELS, transform_staging_data
+from transform_intermediate import INTERMEDIATE_MODELS, transform_intermediate_data
+from transform_marts import MART_MODELS, transform_marts_data
+from inventory_forecaster import (BASELINE_METHODS, DEFAULT_MAX_WORKERS, DEFAULT_CHUNK_SIZE, GRANULARITIES,
+                                  RECONCILIATION_METHODS, ROUTING_MODES, forecast_inventory_demand, resolve_routing)
+from pricing_recommender import PRICING_RULES_PATH, generate_pricing_recommendations
+from snapshot import current_snapshot_path, publish_snapshot
+from outbound_integrator import EXPORT_FORMATS, EXPORT_MODES, export_inventory_snapshot, export_pricing_recommendations
+
+PROJECT_ROOT = os.path.join(os.path.dirname(__file__), '..')
+STEP_STATE_TABLE = 'ops.pipeline_step_state'
+DEFAULT_MAX_PARALLEL = 2
+CONTENT_HASH_MAX_ROWS = 100_000 # Larger tables are never scanned just to decide whether a step can be skipped
+
+def script_path(file_name):
+    return os.path.join(PROJECT_ROOT, 'scripts', file_name)
+
+def export_options(args):
+    return {'fmt': args.export_format, 'max_rows': args.export_max_rows, 'max_bytes': args.export_max_bytes,
+            'mode': args.export_mode}
+
+# Each step: what it runs, which steps must finish first, and what its fingerprint covers.
+#   inputs  - tables it reads          outputs - tables it writes
+#   sources - code/config files        files   - raw input files (hashed by content)
+#   options - CLI options (or other run settings) that change what the step writes
+PIPELINE_STEPS = [
+    {
+        'name': 'load_raw',
+        'depends_on': [],
+        'files': raw_files,
+        'inputs': [],
+        'outputs': [f"main.{table_name}" for table_name in TABLE_KEYS],
+        'sources': [script_path('duckdb_loader.py'), script_path('parquet_store.py')],
+        'options': lambda args: {'parquet': args.parquet},
+        'run': lambda con, args: load_csv_to_duckdb(incremental=args.incremental, parquet=args.parquet, con=con),
+    },
+    {
+        'name': 'staging',
+        'depends_on': ['load_raw'],
+        'inputs': [f"main.{table_name}" for table_name in TABLE_KEYS],
+        'outputs': persisted_models('staging', STAGING_MODELS),
+        'sources': [script_path('transform_staging.py'), script_path('model_runner.py')],
+        'run': lambda con, args: transform_staging_data(con=con),
+    },
+    {
+        'name': 'intermediate',
+        'depends_on': ['staging'],
+        'inputs': ['staging.stg_sales', 'staging.stg_products', 'main.supplier'], # stg_supplier is ephemeral: fingerprint its source
+        'outputs': persisted_models('intermediate', INTERMEDIATE_MODELS),
+        'sources': [script_path('transform_intermediate.py'), script_path('transform_staging.py'), script_path('model_runner.py')],
+        'run': lambda con, args: transform_intermediate_data(full_refresh=args.full_refresh, con=con),
+    },
+    {
+        'name': 'marts',
+        'depends_on': ['staging', 'intermediate'],
+        'inputs': ['staging.stg_sales', 'staging.stg_inventory', 'intermediate.int_product_details'],
+        'outputs': persisted_models('marts', MART_MODELS),
+        'sources': [script_path('transform_marts.py'), script_path('model_runner.py'), script_path('parquet_store.py')],
+        'options': lambda args: {'parquet': args.parquet},
+        'run': lambda con, args: transform_marts_data(full_refresh=args.full_refresh, parquet=args.parquet, con=con),
+    },
+    {
+        'name': 'forecasts',
+        'depends_on': ['marts'],
+        'inputs': ['marts.fct_sales', 'marts.dim_products'],
+        'outputs': ['forecasts.product_demand_forecasts', 'forecasts.product_store_demand_forecasts',
+                    'forecasts.category_demand_forecasts', 'forecasts.forecast_run_diagnostics'],
+        'sources': [script_path('inventory_forecaster.py'), script_path('model_store.py'), script_path('ts_matrix.py')],
+        'options': lambda args: {'routing': resolve_routing(args.routing, args.granularity, args.reconciliation),
+                                 'baseline_method': args.baseline_method,
+                                 'granularity': args.granularity, 'reconciliation': args.reconciliation},
+        'run': lambda con, args: forecast_inventory_demand(max_workers=args.workers, chunk_size=args.chunk_size, con=con,
+                                                           routing=args.routing, baseline_method=args.baseline_method,
+                                                           granularity=args.granularity, reconciliation=args.reconciliation),
+    },
+    {
+        'name': 'pricing',
+        'depends_on': ['marts', 'forecasts'],
+        'inputs': ['marts.dim_products', 'marts.agg_product_price_stats', 'marts.inventory_history',
+                   'forecasts.product_demand_forecasts'],
+        'outputs': ['recommendations.product_pricing_recommendations'],
+        'sources': [script_path('pricing_recommender.py'), script_path('inventory_history.py'), PRICING_RULES_PATH],
+        'options': lambda args: {'recommendation_date': datetime.now().strftime('%Y-%m-%d')}, # Priced as of today
+        'run': lambda con, args: generate_pricing_recommendations(rules_path=args.rules, con=con),
+    },
+    {
+        'name': 'export_inventory',
+        'depends_on': ['marts'],
+        'inputs': ['marts.agg_daily_inventory_summary'],
+        'outputs': [],
+        'sources': [script_path('outbound_integrator.py')],
+        'options': lambda args: export_options(args),
+        'run': lambda con, args: export_inventory_snapshot(con, args.timestamp, **export_options(args)),
+    },
+    {
+        'name': 'export_pricing',
+        'depends_on': ['pricing'],
+        'inputs': ['recommendations.product_pricing_recommendations'],
+        'outputs': [],
+        'sources': [script_path('outbound_integrator.py')],
+        'options': lambda args: export_options(args),
+        'run': lambda con, args: export_pricing_recommendations(con, args.timestamp, **export_options(args)),
+    },
+]
+
+class TableFingerprints:
+    """Fingerprints of tables (see table_fingerprint), memoized for the run and invalidated when a step rewrites a table."""
+
+    def __init__(self):
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+
+    def get(self, con, table):
+        with self._lock:
+            if table in self._fingerprints:
+                return self._fingerprints[table]
+        fingerprint = table_fingerprint(con, table)
+        with self._lock:
+            self._fingerprints[table] = fingerprint
+        return fingerprint
+
+    def invalidate(self, tables):
+        with self._lock:
+            for table in tables:
+                self._fingerprints.pop(table, None)
+
+def table_fingerprint(con, table):
+    """
+    A fingerprint that changes whenever the table's content may have, without scanning large tables:
+      * raw tables: the last change the loaders logged for them in ops.raw_table_changes;
+      * tables the model runner builds: their last build in ops.model_state;
+      * views: their definition plus the fingerprints of the relations they read;
+      * any other table: its content (row count and an order-independent sum of row hashes) up
+        to CONTENT_HASH_MAX_ROWS rows, otherwise only its row count.
+    All of them include the column layout; a table that doesn't exist is 'missing'.
+    """
+    schema, name = table.split('.')
+    columns = con.execute("""
+    SELECT string_agg(column_name || ' ' || data_type, ', ' ORDER BY ordinal_position)
+    FROM information_schema.columns
+    WHERE table_schema = ? AND table_name = ?;
+    """, [schema, name]).fetchone()[0]
+    if columns is None:
+        return 'missing'
+
+    view = con.execute(
+        "SELECT sql FROM duckdb_views() WHERE database_name = current_database() AND schema_name = ? AND view_name = ?;",
+        [schema, name]
+    ).fetchone()
+    if view is not None:
+        upstream = {relation: table_fingerprint(con, relation) for relation in view_relations(con, view[0])}
+        return f"{columns}|view|{combined_fingerprint({'sql': view[0], 'upstream': upstream})}"
+
+    if schema == 'main' and name in TABLE_KEYS and relation_exists(con, CHANGE_LOG_TABLE):
+        change_id = con.execute(f"SELECT MAX(change_id) FROM {CHANGE_LOG_TABLE} WHERE table_name = ?;", [name]).fetchone()[0]
+        if change_id is not None:
+            return f"{columns}|change {change_id}"
+    if relation_exists(con, MODEL_STATE_TABLE):
+        built = con.execute(f"SELECT last_change_id, built_at FROM {MODEL_STATE_TABLE} WHERE model = ?;", [table]).fetchone()
+        if built is not None:
+            return f"{columns}|built {built[0]} at {built[1]}"
+
+    row_count = con.execute(f"SELECT COUNT(*) FROM {table};").fetchone()[0]
+    if row_count > CONTENT_HASH_MAX_ROWS:
+        return f"{columns}|{row_count}"
+    row_hash_sum = con.execute(f"SELECT SUM(CAST(hash(t) AS HUGEINT)) FROM {table} AS t;").fetchone()[0]
+    return f"{columns}|{row_count}|{row_hash_sum}"
+
+def relation_exists(con, relation):
+    schema, name = relation.split('.')
+    return con.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = ? AND table_name = ?;", [schema, name]
+    ).fetchone()[0] > 0
+
+def view_relations(con, view_sql):
+    """schema.name of the existing tables and views a CREATE VIEW statement reads (unqualified names are in main)."""
+    select = re.match(r'CREATE\s+VIEW\s+\S+\s+AS\s+(.*)$', view_sql, re.IGNORECASE | re.DOTALL).group(1).rstrip().rstrip(';')
+    tree = json.loads(con.execute("SELECT json_serialize_sql(?);", [select]).fetchone()[0])
+    relations, stack = set(), [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            if node.get('type') == 'BASE_TABLE':
+                relations.add(f"{node.get('schema_name') or 'main'}.{node['table_name']}")
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+    return sorted(relation for relation in relations if relation_exists(con, relation)) # Drops CTE names
+
+def combined_fingerprint(parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+def input_fingerprint(con, step, args, fingerprints):
+    parts = {
+        'sources': {os.path.basename(path): file_sha256(path) for path in step['sources']},
+        'tables': {table: fingerprints.get(con, table) for table in step['inputs']},
+    }
+    if 'files' in step:
+        parts['files'] = {os.path.basename(path): file_sha256(path) for path in step['files']()}
+    if 'options' in step:
+        parts['options'] = step['options'](args)
+    return combined_fingerprint(parts)
+
+def output_fingerprint(con, step, fingerprints):
+    return combined_fingerprint({table: fingerprints.get(con, table) for table in step['outputs']})
+
+def ensure_step_state(con):
+    con.execute("CREATE SCHEMA IF NOT EXISTS ops;")
+    con.execute(f"""
+    CREATE TABLE IF NOT EXISTS {STEP_STATE_TABLE} (
+        step_name VARCHAR PRIMARY KEY,
+        input_fingerprint VARCHAR,
+        output_fingerprint VARCHAR,
+        seconds DOUBLE,
+        completed_at TIMESTAMP
+    );
+    """)
+
+def load_step_state(con):
+    rows = con.execute(f"SELECT step_name, input_fingerprint, output_fingerprint FROM {STEP_STATE_TABLE};").fetchall()
+    return {step_name: (input_fp, output_fp) for step_name, input_fp, output_fp in rows}
+
+def record_step_state(con, step_name, outcome):
+    con.execute(
+        f"INSERT OR REPLACE INTO {STEP_STATE_TABLE} VALUES (?, ?, ?, ?, current_localtimestamp());",
+        [step_name, outcome['input_fingerprint'], outcome['output_fingerprint'], outcome['seconds']]
+    )
+
+def run_step(con, step, args, previous_state, fingerprints, recorder):
+    """
+    Runs one step on its own cursor, or skips it if its fingerprints match the last successful
+    run. The step is measured as one stage of the recorder's run.
+    """
+    cursor = con.cursor()
+    try:
+        with recorder.stage(step['name'], cursor) as metrics:
+            start = time.perf_counter()
+            step_input = input_fingerprint(cursor, step, args, fingerprints)
+            if not args.force and previous_state is not None and previous_state[0] == step_input:
+                if previous_state[1] == output_fingerprint(cursor, step, fingerprints):
+                    metrics['status'] = 'skipped'
+                    return {'status': 'skipped', 'seconds': time.perf_counter() - start}
+
+            print(f"\n=== {step['name']} ===")
+            metrics['rows_in'] = table_rows(cursor, step['inputs'])
+            step['run'](cursor, args)
+            fingerprints.invalidate(step['outputs'])
+            metrics['rows_out'] = table_rows(cursor, step['outputs'])
+            return {
+                'status': 'ran',
+                'input_fingerprint': step_input,
+                'output_fingerprint': output_fingerprint(cursor, step, fingerprints),
+                'seconds': time.perf_counter() - start,
+            }
+    finally:
+        cursor.close()
+
+def run_pipeline(args, steps=PIPELINE_STEPS):
+    print(f"Connecting to DuckDB database: {DUCKDB_DB_PATH}")
+    con = get_connection()
+    ensure_step_state(con)
+    state = load_step_state(con)
+    fingerprints = TableFingerprints()
+    recorder = PipelineRecorder('run_pipeline', profile=args.profile, profile_min_seconds=args.profile_min_seconds,
+                                options={key: value for key, value in vars(args).items() if key != 'timestamp'})
+
+    outcomes = {} # step name -> {'status': ran|skipped|failed|blocked, 'seconds': ...}
+    pending = list(steps)
+    running = {}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.max_parallel) as executor:
+        while pending or running:
+            for step in list(pending):
+                dependency_status = [outcomes.get(name, {}).get('status') for name in step['depends_on']]
+                if any(status in ('failed', 'blocked') for status in dependency_status):
+                    pending.remove(step)
+                    outcomes[step['name']] = {'status': 'blocked', 'seconds': 0.0}
+                elif all(status in ('ran', 'skipped') for status in dependency_status):
+                    pending.remove(step)
+                    future = executor.submit(run_step, con, step, args, state.get(step['name']), fingerprints, recorder)
+                    running[future] = step
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                try:
+                    outcome = future.result()
+                except Exception:
+                    print(f"\nStep {step['name']} failed:")
+                    traceback.print_exc()
+                    outcome = {'status': 'failed', 'seconds': 0.0}
+                if outcome['status'] == 'ran':
+                    record_step_state(con, step['name'], outcome)
+                elif outcome['status'] == 'skipped':
+                    print(f"\nSkipping {step['name']}: inputs and outputs unchanged since its last successful run.")
+                outcomes[step['name']] = outcome
+
+    print(f"\nPipeline finished in {time.perf_counter() - start:.2f}s:")
+    for step in steps:
+        outcome = outcomes[step['name']]
+        print(f"  {step['name']:<18} {outcome['status']:<8} {outcome['seconds']:.2f}s")
+
+    failed = any(outcome['status'] in ('failed', 'blocked') for outcome in outcomes.values())
+    run = recorder.save(con, 'failed' if failed else 'succeeded')
+    print(f"Run metrics saved as {run['run_id']} in ops.pipeline_runs / ops.stage_metrics "
+          f"({len(recorder.profiles)} query profile(s) in ops.query_profiles).")
+    bump_data_version() # So the dashboard's metrics page picks up this run
+
+    # Readers only see finished runs: a new generation is published when this run succeeded and changed something
+    changed = any(outcome['status'] == 'ran' for outcome in outcomes.values())
+    if args.publish and not failed and (changed or current_snapshot_path() is None):
+        publish_start = time.perf_counter()
+        path = publish_snapshot(con)
+        print(f"Published snapshot {os.path.basename(path)} for readers in {time.perf_counter() - publish_start:.2f}s.")
+
+    close_connection()
+    return outcomes
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the whole pipeline as a DAG in one process.")
+    parser.add_argument('--force', action='store_true',
+                        help="Run every step even if its inputs are unchanged.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Load only new or changed raw files (see duckdb_loader.py).")
+    parser.add_argument('--full-refresh', action='store_true',
+                        help="Rebuild incremental models from scratch; implies --force.")
+    parser.add_argument('--parquet', action='store_true',
+                        help="Also persist raw tables and the large marts as partitioned Parquet.")
+    parser.add_argument('--workers', type=int, default=DEFAULT_MAX_WORKERS,
+                        help="Forecasting worker processes.")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Products sent to a forecasting worker at a time.")
+    parser.add_argument('--routing', choices=ROUTING_MODES,
+                        help="Which products get a per-product Prophet/SARIMAX fit (the rest use the vectorized baseline). "
+                             "Defaults to 'policy'; bottom-up product_store forecasts only support 'baseline'.")
+    parser.add_argument('--baseline-method', choices=('auto',) + BASELINE_METHODS, default='auto',
+                        help="Vectorized forecasting method for products not routed to Prophet/SARIMAX.")
+    parser.add_argument('--granularity', choices=GRANULARITIES, default='product',
+                        help="Also forecast per product x store, reconciled with products and categories.")
+    parser.add_argument('--reconciliation', choices=RECONCILIATION_METHODS, default='bottom_up',
+                        help="How store-level forecasts are reconciled with product forecasts: bottom_up forecasts every "
+                             "product x store series with the vectorized baseline, top_down splits routed product forecasts.")
+    parser.add_argument('--rules', default=PRICING_RULES_PATH, help="Path to the pricing rules JSON config.")
+    parser.add_argument('--export-format', choices=EXPORT_FORMATS, default='csv', help="Outbound file format.")
+    parser.add_argument('--export-mode', choices=EXPORT_MODES, default='full',
+                        help="Ship full snapshots or only rows changed since the last export.")
+    parser.add_argument('--export-max-rows', type=int, help="Split outbound files after this many rows.")
+    parser.add_argument('--export-max-bytes', type=int, help="Split outbound files at about this many bytes.")
+    parser.add_argument('--profile', action='store_true',
+                        help="Keep DuckDB's JSON query profile (EXPLAIN ANALYZE) of slow statements in ops.query_profiles.")
+    parser.add_argument('--profile-min-seconds', type=float, default=DEFAULT_PROFILE_MIN_SECONDS,
+                        help="With --profile, only keep profiles of statements at least this slow.")
+    parser.add_argument('--max-parallel', type=int, default=DEFAULT_MAX_PARALLEL,
+                        help="Maximum number of steps running at once.")
+    parser.add_argument('--no-publish', dest='publish', action='store_false',
+                        help="Don't publish a new snapshot generation for the dashboard after a successful run.")
+    args = parser.parse_args()
+    try:
+        resolve_routing(args.routing, args.granularity, args.reconciliation) # Fail before any step runs
+    except ValueError as e:
+        parser.error(str(e))
+    args.force = args.force or args.full_refresh
+    args.timestamp = datetime.now().strftime('%Y%m%d%H%M%S') # Shared by every export in this run
+
+    outcomes = run_pipeline(args)
+    if any(outcome['status'] in ('failed', 'blocked') for outcome in outcomes.values()):
+        sys.exit(1)
@@ -0,0 +1,145 @@
+# scripts/snapshot.py
+#
+# Published snapshots of the database for readers (the dashboard). The pipeline keeps writing
+# data/retail_data.duckdb, which it holds with DuckDB's single-writer lock and rebuilds table by
+# table. When a run has finished, publish_snapshot() writes the relations the dashboard reads
+# (SNAPSHOT_RELATIONS, cut down to the rows and columns its queries use) into a new generation
+# file under data/snapshots/ and then atomically rewrites the CURRENT pointer file to name it.
+# Readers open the generation CURRENT names, read-only:
+#   * they never contend for the writer's lock, so they never block or get blocked,
+#   * they only ever see a complete generation, never a half-rebuilt table.
+# A reader keeps its generation until it reopens; older generations are pruned on publish.
+import os
+import re
+import uuid
+import argparse
+from datetime import datetime
+
+from dashboard_queries import SAMPLE_ROWS
+from data_version import bump_data_version, read_data_version
+from db import DUCKDB_DB_PATH, get_connection, close_connection, open_db_paths
+
+PROJECT_ROOT = os.path.join(os.path.dirname(__file__), '..')
+SNAPSHOT_DIR = os.path.join(PROJECT_ROOT, 'data', 'snapshots')
+CURRENT_POINTER = 'CURRENT'
+GENERATION_PATTERN = re.compile(r'^retail_\d{20}-[0-9a-f]{8}\.duckdb$') # Names sort by publish time
+DEFAULT_KEEP_GENERATIONS = 2 # The current generation plus the one readers may still have open
+
+# Every relation dashboard_queries.py reads, with the SELECT that publishes it ({table} is the
+# working copy). A publish never copies the fact table or the history, so its cost doesn't grow
+# with them; keep this in step with dashboard_queries.py.
+SNAPSHOT_RELATIONS = {
+    # Only shown as a sample
+    'marts.fct_sales': f"SELECT * FROM {{table}} LIMIT {SAMPLE_ROWS}",
+    # sales_trend only sums revenue by date bucket, so one row per day is enough
+    'marts.agg_daily_product_store_prices': "SELECT sale_date, SUM(revenue) AS revenue FROM {table} GROUP BY sale_date",
+    'marts.agg_product_price_stats': "SELECT * FROM {table}",
+    # inventory_vs_forecast only reads the latest inventory date
+    'marts.agg_daily_inventory_summary': "SELECT * FROM {table} WHERE inventory_date = (SELECT MAX(inventory_date) FROM {table})",
+    'forecasts.product_demand_forecasts': "SELECT * FROM {table}",
+    'recommendations.product_pricing_recommendations': "SELECT * FROM {table}",
+    'ops.pipeline_runs': "SELECT * FROM {table}",
+    'ops.stage_metrics': "SELECT * FROM {table}",
+}
+
+def current_snapshot_path(snapshot_dir=SNAPSHOT_DIR):
+    """Path of the published generation, or None if nothing has been published yet."""
+    try:
+        with open(os.path.join(snapshot_dir, CURRENT_POINTER)) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    path = os.path.join(snapshot_dir, name)
+    return path if name and os.path.exists(path) else None
+
+def snapshot_version(db_path, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Cache token for results read from db_path. A generation never changes, so its name is enough;
+    the working database (read before the first publish) changes with every data version.
+    """
+    if os.path.dirname(os.path.abspath(db_path)) == os.path.abspath(snapshot_dir):
+        return os.path.basename(db_path)
+    return read_data_version()
+
+def reader_db_path(snapshot_dir=SNAPSHOT_DIR, fallback=DUCKDB_DB_PATH):
+    """The database file readers should open: the current generation, else the working database."""
+    return current_snapshot_path(snapshot_dir) or fallback
+
+def publish_snapshot(con, snapshot_dir=SNAPSHOT_DIR, keep=DEFAULT_KEEP_GENERATIONS):
+    """
+    Writes SNAPSHOT_RELATIONS (those that exist) into a new generation file as tables and points
+    CURRENT at it. The pointer is only swapped once the copy is complete, so a failed publish leaves the
+    previous generation in place. Returns the new generation's path.
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    name = f"retail_{datetime.now().strftime('%Y%m%d%H%M%S%f')}-{uuid.uuid4().hex[:8]}.duckdb"
+    path = os.path.join(snapshot_dir, name)
+    source = con.execute("SELECT current_database();").fetchone()[0]
+    quoted_path = os.path.abspath(path).replace("'", "''")
+
+    con.execute(f"ATTACH '{quoted_path}' AS snapshot_publish;")
+    try:
+        for relation in existing_relations(con, source, SNAPSHOT_RELATIONS):
+            schema_name, table_name = relation.split('.')
+            select = SNAPSHOT_RELATIONS[relation].format(table=f'"{source}"."{schema_name}"."{table_name}"')
+            con.execute(f'CREATE SCHEMA IF NOT EXISTS snapshot_publish."{schema_name}";')
+            con.execute(f'CREATE TABLE snapshot_publish."{schema_name}"."{table_name}" AS {select};')
+    except Exception:
+        con.execute("DETACH snapshot_publish;")
+        os.remove(path)
+        raise
+    con.execute("DETACH snapshot_publish;") # Checkpoints and closes the file
+
+    pointer_path = os.path.join(snapshot_dir, CURRENT_POINTER)
+    tmp_pointer = f"{pointer_path}.{name}.tmp"
+    with open(tmp_pointer, 'w') as f:
+        f.write(name)
+    os.replace(tmp_pointer, pointer_path) # Atomic, so readers see either the old or the new generation
+    bump_data_version()
+    prune_snapshots(snapshot_dir, keep)
+    return path
+
+def existing_relations(con, database, relations):
+    """The schema.name relations (tables or views) of relations that exist in database, in the given order."""
+    existing = {f"{schema_name}.{name}" for schema_name, name in con.execute("""
+    SELECT schema_name, table_name FROM duckdb_tables() WHERE database_name = $database
+    UNION ALL
+    SELECT schema_name, view_name FROM duckdb_views() WHERE database_name = $database AND NOT internal;
+    """, {'database': database}).fetchall()}
+    return [relation for relation in relations if relation in existing]
+
+def prune_snapshots(snapshot_dir=SNAPSHOT_DIR, keep=DEFAULT_KEEP_GENERATIONS):
+    """Deletes all but the newest keep generations (never the current one). Returns the count removed."""
+    current = current_snapshot_path(snapshot_dir)
+    names = sorted((name for name in os.listdir(snapshot_dir) if GENERATION_PATTERN.match(name)), reverse=True)
+    removed = 0
+    for name in names[max(keep, 1):]:
+        path = os.path.join(snapshot_dir, name)
+        if current is not None and os.path.samefile(path, current):
+            continue
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass # Still open by a reader on a platform that can't unlink open files; retried on the next publish
+    return removed
+
+def close_pruned_connections(snapshot_dir=SNAPSHOT_DIR):
+    """Closes this process's connections to generations that have since been pruned, releasing their files."""
+    for path in open_db_paths():
+        if os.path.dirname(path) == os.path.abspath(snapshot_dir) and not os.path.exists(path):
+            close_connection(path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish the working database as a new snapshot generation for readers.")
+    parser.add_argument('--keep', type=int, default=DEFAULT_KEEP_GENERATIONS, help="Generations to keep on disk.")
+    parser.add_argument('--status', action='store_true', help="Only print the current generation.")
+    args = parser.parse_args()
+
+    if args.status:
+        print(f"Current snapshot: {current_snapshot_path() or 'none published'}")
+    else:
+        print(f"Connecting to DuckDB database: {DUCKDB_DB_PATH}")
+        con = get_connection()
+        print(f"Published snapshot {publish_snapshot(con, keep=args.keep)}")
+        close_connection()
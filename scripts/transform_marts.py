@@ -1,93 +1,185 @@
 # scripts/transform_marts.py
-import duckdb
-import pandas as pd
-import os
+import argparse
 
-# Define paths relative to the project root
-PROJECT_ROOT = os.path.join(os.path.dirname(__file__), '..')
-DUCKDB_DB_PATH = os.path.join(PROJECT_ROOT, 'data', 'retail_data.duckdb')
+from data_version import bump_data_version
+from db import DUCKDB_DB_PATH, get_connection, close_connection
+from model_runner import run_models
+from parquet_store import export_layer
+from transform_intermediate import INTERMEDIATE_MODELS
+from transform_staging import STAGING_MODELS
 
-def transform_marts_data():
-    print(f"Connecting to DuckDB database: {DUCKDB_DB_PATH}")
-    con = duckdb.connect(database=DUCKDB_DB_PATH)
-
-    # Create a schema for mart data if it doesn't exist
-    con.execute("CREATE SCHEMA IF NOT EXISTS marts;")
-    print("Marts schema ensured.")
+# Price statistics rolled up from marts.agg_daily_product_store_prices at a given grain
+PRICE_STATS_SQL = """
+WITH daily AS (
+    SELECT *, (SELECT MAX(sale_date) FROM marts.agg_daily_product_store_prices) AS as_of_date
+    FROM marts.agg_daily_product_store_prices
+)
+SELECT
+    {grain},
+    MAX(as_of_date) AS as_of_date,
+    MIN(sale_date) AS first_sale_date,
+    MAX(sale_date) AS last_sale_date,
+    CAST(SUM(transaction_count) AS BIGINT) AS transaction_count,
+    CAST(SUM(price_sum) AS DOUBLE) / SUM(transaction_count) AS avg_price,
+    MIN(min_price) AS min_price,
+    MAX(max_price) AS max_price,
+    ARG_MAX(last_price, sale_date) AS last_price,
+    CAST(SUM(units_sold) AS BIGINT) AS units_sold,
+    SUM(revenue) AS revenue,
+    CAST(SUM(price_sum) FILTER (WHERE sale_date > as_of_date - INTERVAL 7 DAY) AS DOUBLE)
+        / SUM(transaction_count) FILTER (WHERE sale_date > as_of_date - INTERVAL 7 DAY) AS avg_price_7d,
+    CAST(SUM(price_sum) FILTER (WHERE sale_date > as_of_date - INTERVAL 30 DAY) AS DOUBLE)
+        / SUM(transaction_count) FILTER (WHERE sale_date > as_of_date - INTERVAL 30 DAY) AS avg_price_30d,
+    CAST(SUM(price_sum) FILTER (WHERE sale_date > as_of_date - INTERVAL 90 DAY) AS DOUBLE)
+        / SUM(transaction_count) FILTER (WHERE sale_date > as_of_date - INTERVAL 90 DAY) AS avg_price_90d,
+    CAST(COALESCE(SUM(units_sold) FILTER (WHERE sale_date > as_of_date - INTERVAL 30 DAY), 0) AS BIGINT) AS units_sold_30d,
+    COALESCE(SUM(revenue) FILTER (WHERE sale_date > as_of_date - INTERVAL 30 DAY), 0) AS revenue_30d
+FROM daily
+GROUP BY {grain}
+"""
 
+MART_MODELS = [
     # --- Mart: dim_products (Dimension Table) ---
-    print("\nCreating mart: dim_products...")
-    query_dim_products = """
-    SELECT
-        product_id,
-        product_name,
-        category,
-        brand,
-        cost_price,
-        supplier_name,
-        lead_time_days
-    FROM intermediate.int_product_details;
-    """
-    dim_products_df = con.execute(query_dim_products).fetchdf()
-
-    con.execute("DROP TABLE IF EXISTS marts.dim_products;")
-    con.execute("CREATE TABLE marts.dim_products AS SELECT * FROM dim_products_df;")
-    print(f"Loaded {len(dim_products_df)} rows into marts.dim_products.")
-
-
+    # A view over int_product_details: a column selection, so there is nothing worth storing.
+    {
+        'name': 'dim_products',
+        'materialized': 'view',
+        'sql': """
+        SELECT
+            product_id,
+            product_name,
+            category,
+            brand,
+            cost_price,
+            supplier_name,
+            lead_time_days
+        FROM intermediate.int_product_details
+        """,
+    },
     # --- Mart: fct_sales (Fact Table) ---
-    print("\nCreating mart: fct_sales...")
-    query_fct_sales = """
-    SELECT
-        s.sale_date,
-        s.transaction_id,
-        s.product_id,
-        s.customer_id,
-        s.store_id,
-        s.quantity_sold,
-        s.price_per_unit,
-        s.discount_applied,
-        s.net_sales_amount,
-        p.category,
-        p.brand,
-        p.cost_price,
-        p.supplier_name
-    FROM staging.stg_sales AS s
-    LEFT JOIN marts.dim_products AS p ON s.product_id = p.product_id;
-    """
-    fct_sales_df = con.execute(query_fct_sales).fetchdf()
-
-    con.execute("DROP TABLE IF EXISTS marts.fct_sales;")
-    con.execute("CREATE TABLE marts.fct_sales AS SELECT * FROM fct_sales_df;")
-    print(f"Loaded {len(fct_sales_df)} rows into marts.fct_sales.")
-
-
+    # Incremental on sale_date: runs only recompute the days whose sales were loaded or corrected.
+    # Product attributes are denormalized into every row, so a catalog or supplier change rebuilds it.
+    {
+        'name': 'fct_sales',
+        'materialized': 'incremental',
+        'incremental_key': 'sale_date',
+        'change_sources': ['sales', 'product_catalog', 'supplier'],
+        'sql': """
+        SELECT
+            s.sale_date,
+            s.transaction_id,
+            s.product_id,
+            s.customer_id,
+            s.store_id,
+            s.quantity_sold,
+            s.price_per_unit,
+            s.discount_applied,
+            s.net_sales_amount,
+            p.category,
+            p.brand,
+            p.cost_price,
+            p.supplier_name
+        FROM staging.stg_sales AS s
+        LEFT JOIN marts.dim_products AS p ON s.product_id = p.product_id
+        """,
+    },
+    # --- Mart: agg_daily_product_store_prices (Aggregated Mart) ---
+    # Daily price/volume partials per product and store, maintained incrementally with fct_sales.
+    # Prices are summed as DECIMAL so averages rolled up from these partials are exact.
+    {
+        'name': 'agg_daily_product_store_prices',
+        'materialized': 'incremental',
+        'incremental_key': 'sale_date',
+        'change_sources': ['sales'],
+        'sql': """
+        SELECT
+            sale_date,
+            product_id,
+            store_id,
+            COUNT(*) AS transaction_count,
+            SUM(CAST(price_per_unit AS DECIMAL(38, 2))) AS price_sum,
+            MIN(price_per_unit) AS min_price,
+            MAX(price_per_unit) AS max_price,
+            ARG_MAX(price_per_unit, transaction_id) AS last_price,
+            CAST(SUM(quantity_sold) AS BIGINT) AS units_sold,
+            SUM(net_sales_amount) AS revenue
+        FROM marts.fct_sales
+        GROUP BY 1, 2, 3
+        """,
+    },
+    # --- Mart: agg_product_price_stats / agg_product_store_price_stats (Aggregated Marts) ---
+    # Rolled up from the daily partials rather than the fact table; windows are relative to the latest sale date.
+    {
+        'name': 'agg_product_price_stats',
+        'sql': PRICE_STATS_SQL.format(grain='product_id'),
+    },
+    {
+        'name': 'agg_product_store_price_stats',
+        'sql': PRICE_STATS_SQL.format(grain='product_id, store_id'),
+    },
     # --- Mart: agg_daily_inventory_summary (Aggregated Mart) ---
-    print("\nCreating mart: agg_daily_inventory_summary...")
-    query_agg_inventory = """
-    SELECT
-        i.inventory_date,
-        i.store_id,
-        i.product_id,
-        i.current_stock_level,
-        p.product_name,
-        p.category,
-        p.brand,
-        p.cost_price,
-        p.supplier_name,
-        p.lead_time_days
-    FROM staging.stg_inventory AS i
-    LEFT JOIN marts.dim_products AS p ON i.product_id = p.product_id;
-    """
-    agg_daily_inventory_summary_df = con.execute(query_agg_inventory).fetchdf()
+    {
+        'name': 'agg_daily_inventory_summary',
+        'sql': """
+        SELECT
+            i.inventory_date,
+            i.store_id,
+            i.product_id,
+            i.current_stock_level,
+            p.product_name,
+            p.category,
+            p.brand,
+            p.cost_price,
+            p.supplier_name,
+            p.lead_time_days
+        FROM staging.stg_inventory AS i
+        LEFT JOIN marts.dim_products AS p ON i.product_id = p.product_id
+        """,
+    },
+    # --- Mart: inventory_history (SCD-2 Snapshot) ---
+    # Every inventory load appends only the product x store levels that changed since the last one;
+    # see inventory_history.py for as-of lookups.
+    {
+        'name': 'inventory_history',
+        'materialized': 'snapshot',
+        'unique_key': ['product_id', 'store_id'],
+        'check_cols': ['current_stock_level'],
+        'snapshot_date': 'inventory_date',
+        'invalidate_hard_deletes': True,
+        'sql': """
+        SELECT
+            product_id,
+            store_id,
+            current_stock_level,
+            CAST(inventory_date AS DATE) AS inventory_date
+        FROM staging.stg_inventory
+        """,
+    },
+]
+
+def transform_marts_data(full_refresh=False, parquet=False, con=None):
+    owns_connection = con is None
+    if owns_connection:
+        print(f"Connecting to DuckDB database: {DUCKDB_DB_PATH}")
+        con = get_connection()
 
-    con.execute("DROP TABLE IF EXISTS marts.agg_daily_inventory_summary;")
-    con.execute("CREATE TABLE marts.agg_daily_inventory_summary AS SELECT * FROM agg_daily_inventory_summary_df;")
-    print(f"Loaded {len(agg_daily_inventory_summary_df)} rows into marts.agg_daily_inventory_summary.")
+    run_models(con, 'marts', MART_MODELS, full_refresh=full_refresh,
+               upstream={'staging': STAGING_MODELS, 'intermediate': INTERMEDIATE_MODELS})
 
+    if parquet:
+        print("\nPersisting large marts as partitioned Parquet...")
+        export_layer(con, 'marts')
 
-    con.close()
-    print("\nAll mart transformations complete. DuckDB connection closed.")
+    bump_data_version()
+    if owns_connection:
+        close_connection()
+    print("\nAll mart transformations complete.")
 
 if __name__ == "__main__":
-    transform_marts_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build the marts layer from staging and intermediate.")
+    parser.add_argument('--full-refresh', action='store_true',
+                        help="Rebuild incremental models from all of staging instead of only the newest days.")
+    parser.add_argument('--parquet', action='store_true',
+                        help="Also persist fct_sales and agg_daily_inventory_summary as Hive-partitioned Parquet under data/parquet/marts.")
+    args = parser.parse_args()
+    transform_marts_data(full_refresh=args.full_refresh, parquet=args.parquet)
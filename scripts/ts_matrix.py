@@ -0,0 +1,62 @@
+# scripts/ts_matrix.py
+#
+# Dense, zero-filled time-series matrices (product x day, optionally x store) for forecasters,
+# backtests and dashboards. DuckDB aggregates the source to one row per key and day in a single
+# scan; the rows are then scattered into a NumPy array with one vectorized assignment, instead
+# of filtering and resampling the frame once per series.
+import numpy as np
+import pandas as pd
+
+def build_matrix(con, keys=('product_id',), source='marts.fct_sales', date_column='sale_date',
+                 value_column='quantity_sold', start_date=None, end_date=None, dtype='float64'):
+    """
+    Sums value_column per key(s) and calendar day into a dense matrix; days without rows are 0.
+    The date axis runs from start_date (default: first day in the data) to end_date (default: last day).
+    Returns (axes, matrix): axes maps each key and 'date' to its labels (sorted key values and a
+    DatetimeIndex); matrix has one dimension per key, in order, plus a trailing date dimension.
+    """
+    filters = [f"{key} IS NOT NULL" for key in keys]
+    params = []
+    if start_date is not None:
+        filters.append(f"CAST({date_column} AS DATE) >= CAST(? AS DATE)")
+        params.append(str(start_date))
+    if end_date is not None:
+        filters.append(f"CAST({date_column} AS DATE) <= CAST(? AS DATE)")
+        params.append(str(end_date))
+    where = f"WHERE {' AND '.join(filters)}"
+
+    first_date, last_date = con.execute(
+        f"SELECT MIN(CAST({date_column} AS DATE)), MAX(CAST({date_column} AS DATE)) FROM {source} {where};", params
+    ).fetchone()
+    first_date = pd.Timestamp(start_date if start_date is not None else first_date)
+    last_date = pd.Timestamp(end_date if end_date is not None else last_date)
+    if pd.isna(first_date) or pd.isna(last_date):
+        return {**{key: np.array([], dtype=object) for key in keys}, 'date': pd.DatetimeIndex([])}, np.zeros((0,) * len(keys) + (0,), dtype=dtype)
+
+    key_list = ', '.join(keys)
+    columns = con.execute(f"""
+    SELECT {key_list}, date_diff('day', CAST(? AS DATE), CAST({date_column} AS DATE)) AS day_index, SUM({value_column}) AS value
+    FROM {source} {where}
+    GROUP BY ALL;
+    """, [str(first_date.date())] + params).fetchnumpy()
+
+    axes, index = {}, []
+    for key in keys:
+        axes[key], codes = np.unique(np.asarray(columns[key], dtype=object), return_inverse=True)
+        index.append(codes)
+    axes['date'] = pd.date_range(first_date, last_date, freq='D')
+
+    matrix = np.zeros(tuple(len(labels) for labels in axes.values()), dtype=dtype)
+    matrix[tuple(index) + (np.asarray(columns['day_index']),)] = np.asarray(columns['value'], dtype=dtype) # One row per cell after GROUP BY
+    return axes, matrix
+
+def series(axes, matrix_row, name=None, trim=True):
+    """
+    One row of a matrix as a daily pd.Series indexed by date. With trim, leading and trailing
+    zero days are dropped, so the series spans the first to the last day with any value.
+    """
+    start, stop = 0, len(matrix_row)
+    if trim:
+        nonzero = np.flatnonzero(matrix_row)
+        start, stop = (nonzero[0], nonzero[-1] + 1) if len(nonzero) else (0, 0)
+    return pd.Series(matrix_row[start:stop], index=axes['date'][start:stop], name=name)
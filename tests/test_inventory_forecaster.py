@@ -0,0 +1,25 @@
+# tests/test_inventory_forecaster.py
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+from inventory_forecaster import ROUTING_POLICY, resolve_routing, route_products
+
+def test_route_products_keeps_a_mostly_idle_catalog_on_the_baseline():
+    # 200 days of history; 90 of 100 products sold early on but nothing in the recent window
+    matrix = np.zeros((100, 200))
+    matrix[:, :50] = 3
+    matrix[:10, -ROUTING_POLICY['recent_days']:] = 5
+    routed = route_products(matrix)
+    assert routed[:10].all()
+    assert not routed[10:].any()
+
+def test_resolve_routing_rejects_prophet_routing_for_bottom_up():
+    assert resolve_routing(None, 'product', 'bottom_up') == 'policy'
+    assert resolve_routing(None, 'product_store', 'bottom_up') == 'baseline'
+    assert resolve_routing('all', 'product_store', 'top_down') == 'all'
+    with pytest.raises(ValueError):
+        resolve_routing('policy', 'product_store', 'bottom_up')
@@ -0,0 +1,58 @@
+# tests/test_pricing_recommender.py
+#
+# Runs the pipeline on the sample data in data/raw/ (into a scratch database) and pins the
+# pricing reasons the rules produce, as of the last day of the sample.
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+from db import get_connection, close_connection
+from duckdb_loader import ensure_manifest, load_full, raw_files
+from inventory_forecaster import forecast_inventory_demand
+from pricing_recommender import generate_pricing_recommendations
+from transform_intermediate import transform_intermediate_data
+from transform_marts import transform_marts_data
+from transform_staging import transform_staging_data
+
+def sample_date(con):
+    return con.execute("SELECT strftime(MAX(sale_date), '%Y-%m-%d') FROM marts.fct_sales;").fetchone()[0]
+
+@pytest.fixture(scope='module')
+def sample_con(tmp_path_factory):
+    db_path = str(tmp_path_factory.mktemp('pricing') / 'retail_data.duckdb')
+    con = get_connection(db_path=db_path)
+    ensure_manifest(con)
+    load_full(con, raw_files())
+    transform_staging_data(con=con)
+    transform_intermediate_data(con=con)
+    transform_marts_data(con=con)
+    # The vectorized baseline is enough here and keeps the test fast; pricing only reads the forecasts
+    forecast_inventory_demand(max_workers=1, con=con, use_model_cache=False, routing='baseline')
+    generate_pricing_recommendations(con=con, recommendation_date=sample_date(con))
+    yield con
+    close_connection(db_path)
+
+def test_pricing_reasons_on_sample_data(sample_con):
+    reasons = dict(sample_con.execute("""
+    SELECT pricing_reason, COUNT(*)
+    FROM recommendations.product_pricing_recommendations
+    GROUP BY pricing_reason;
+    """).fetchall())
+    # Chain-wide stock is well above the discount threshold for almost every product
+    assert reasons == {
+        'High stock, low predicted demand (10% discount)': 199,
+        'Standard pricing based on cost/historical average': 1,
+    }
+
+def test_stock_and_demand_use_the_recommendation_date(sample_con):
+    recommendation_date = sample_date(sample_con)
+    assert sample_con.execute(
+        "SELECT COUNT(DISTINCT recommendation_date), MIN(recommendation_date) FROM recommendations.product_pricing_recommendations;"
+    ).fetchone() == (1, recommendation_date)
+    # The next day must be forecast, or every product would look like it has no demand
+    assert sample_con.execute("""
+    SELECT COUNT(*) FROM forecasts.product_demand_forecasts
+    WHERE forecast_date = strftime(CAST(? AS DATE) + 1, '%Y-%m-%d');
+    """, [recommendation_date]).fetchone()[0] > 0